@@ -0,0 +1,333 @@
+"""astarena.py
+
+A struct-of-arrays store for bbast trees: an Arena holds all the nodes
+of a tree (usually a module) in a handful of typed arrays, rather than
+as objects pointing at each other.
+
+    arena = astarena.from_tree(module)
+    for call in arena.views(bbast.MethodCall, name='add'):
+        print(call.token, call.owner)
+    module = astarena.to_tree(arena, tokens)
+
+Nodes are numbered in preorder, so the nodes under node i are those
+numbered from i + 1 up to (not including) arena.ends[i]. For each node
+the arena keeps its
+
+    kinds   class, as an index into KINDS (one byte per node),
+    ends    end of its subtree,
+    tokens  token position (-1 for no token),
+    names   'name', 'method_name' or 'attribute_name', as an index into
+            'strings' (-1 for none),
+    starts  offset in 'values' of its fields, then its annotations.
+
+Each entry of 'values' is a tagged int: one of the CONSTANTS, a node
+number, an index into 'strings', or the offset in 'values' of a list or
+a tuple, stored there as its length followed by its items.
+
+A NodeView has the attributes of its node's bbast class, read from the
+arrays on access, and its 'accept' method. Passes that only look for
+nodes of some kind can use Arena.find, which scans 'kinds' instead of
+walking the tree.
+"""
+import array
+import types
+
+import astvisitor
+import bbast
+
+# The node classes, in the order of bbast.
+KINDS = tuple(
+    value for value in vars(bbast).values()
+    if isinstance(value, type) and issubclass(value, bbast.Ast) and
+    '_visit_method' in vars(value))
+
+# Of the fields of a node, those kept in 'names' (at most one per class).
+NAME_FIELDS = ('name', 'method_name', 'attribute_name')
+
+TAG_BITS = 3
+TAG_MASK = (1 << TAG_BITS) - 1
+CONSTANT, NODE, STRING, LIST, TUPLE = range(5)
+CONSTANTS = (None, False, True)
+
+_CODES = {kind: code for code, kind in enumerate(KINDS)}
+_NAME_OFFSETS = tuple(
+    ([kind._fields.index(name) for name in NAME_FIELDS
+      if name in kind._fields] + [-1])[0]
+    for kind in KINDS)
+_FIND_TABLES = {}
+
+
+class Arena(object):
+
+    def __init__(self):
+        self.kinds = bytearray()
+        self.ends = array.array('i')
+        self.tokens = array.array('i')
+        self.names = array.array('i')
+        self.starts = array.array('i')
+        self.values = array.array('i')
+        self.strings = []
+        self.string_ids = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def encode(self, value, numbers=None):
+        # Returns 'value' as an entry of 'values', storing lists and
+        # tuples there. Nodes can only be encoded given 'numbers', a dict
+        # from their ids to their numbers.
+        if value is None or value is False or value is True:
+            return CONSTANTS.index(value) << TAG_BITS | CONSTANT
+        if isinstance(value, str):
+            return self.intern(value) << TAG_BITS | STRING
+        if isinstance(value, bbast.Ast) and numbers is not None:
+            return numbers[id(value)] << TAG_BITS | NODE
+        if isinstance(value, (list, tuple)):
+            items = [self.encode(item, numbers) for item in value]
+            offset = len(self.values)
+            self.values.append(len(items))
+            self.values.extend(items)
+            tag = LIST if isinstance(value, list) else TUPLE
+            return offset << TAG_BITS | tag
+        raise TypeError('Cannot store %r in an Arena' % (value,))
+
+    def decode(self, value, node=None):
+        # The inverse of encode, with nodes as given by node(number)
+        # (views by default).
+        tag = value & TAG_MASK
+        payload = value >> TAG_BITS
+        if tag == CONSTANT:
+            return CONSTANTS[payload]
+        if tag == NODE:
+            return (node or self.view)(payload)
+        if tag == STRING:
+            return self.strings[payload]
+        length = self.values[payload]
+        items = [self.decode(item, node)
+                 for item in self.values[payload + 1:payload + 1 + length]]
+        return items if tag == LIST else tuple(items)
+
+    def view(self, index):
+        return VIEWS[self.kinds[index]](self, index)
+
+    @property
+    def root(self):
+        return self.view(0)
+
+    def find(self, cls, within=None, name=None):
+        """Yield the numbers of the nodes that are instances of 'cls'.
+
+        'cls' is a class of bbast (abstract ones like bbast.Expression
+        included). With 'within', only nodes in the subtree of that node
+        number are found, and with 'name' only those of that name (see
+        NAME_FIELDS).
+        """
+        if within is None:
+            start, end = 0, len(self.kinds)
+        else:
+            start, end = within, self.ends[within]
+        if name is None:
+            name_id = None
+        else:
+            name_id = self.string_ids.get(name)
+            if name_id is None:
+                return
+        codes = [code for code, kind in enumerate(KINDS)
+                 if issubclass(kind, cls)]
+        if len(codes) == 1:
+            kinds = self.kinds
+            code = codes[0]
+        else:
+            if cls not in _FIND_TABLES:
+                _FIND_TABLES[cls] = bytes(
+                    code in codes for code in range(256))
+            kinds = self.kinds.translate(_FIND_TABLES[cls])
+            code = 1
+        names = self.names
+        index = kinds.find(code, start, end)
+        while index != -1:
+            if name_id is None or names[index] == name_id:
+                yield index
+            index = kinds.find(code, index + 1, end)
+
+    def views(self, cls, within=None, name=None):
+        """Like find, but yield views of the nodes."""
+        for index in self.find(cls, within, name):
+            yield self.view(index)
+
+
+class NodeView(object):
+    """A node of an Arena, with the attributes of its bbast class.
+
+    Views are made on each access, and are equal if they're of the same
+    node. As in lean trees (see bbparser.parse), the 'token' of a node
+    is the position of its token. The annotations (like deduced_type)
+    can be set, but not the fields.
+    """
+
+    __slots__ = ('arena', 'index')
+    kind = None
+    _fields = ()
+    _annotations = ()
+    _children = ()
+    _visit_method = None
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    accept = bbast.Ast.accept
+
+    @property
+    def token(self):
+        pos = self.arena.tokens[self.index]
+        return None if pos == -1 else pos
+
+    def __eq__(self, other):
+        return (isinstance(other, NodeView) and
+                self.arena is other.arena and self.index == other.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self):
+        return '<%s view of node %d>' % (self.kind.__name__, self.index)
+
+
+def _field(offset):
+    def get(self):
+        arena = self.arena
+        return arena.decode(arena.values[arena.starts[self.index] + offset])
+    return property(get)
+
+
+def _annotation(offset):
+    def set_(self, value):
+        arena = self.arena
+        arena.values[arena.starts[self.index] + offset] = arena.encode(value)
+    return property(_field(offset).fget, set_)
+
+
+def _view_class(kind):
+    namespace = {
+        '__slots__': (),
+        'kind': kind,
+        '_fields': kind._fields,
+        '_annotations': kind._annotations,
+        '_children': kind._children,
+        '_visit_method': kind._visit_method,
+    }
+    for name, value in vars(kind).items():
+        if (not name.startswith('__') and
+                isinstance(value, (types.FunctionType, property))):
+            namespace[name] = value
+    for offset, name in enumerate(kind._fields):
+        namespace[name] = _field(offset)
+    if kind is bbast.Class:
+        # Not a field, so not in the arena: made on each access instead.
+        namespace['qualified_typename'] = property(
+            bbast.Class.make_qualified_typename)
+    for offset, name in enumerate(kind._annotations, len(kind._fields)):
+        namespace[name] = _annotation(offset)
+    return type(kind.__name__, (NodeView,), namespace)
+
+
+VIEWS = tuple(_view_class(kind) for kind in KINDS)
+
+
+def _code(cls):
+    # Subclasses of the classes in KINDS (like bbparser.LazyMethod) are
+    # stored as those.
+    if cls not in _CODES:
+        _CODES[cls] = next(
+            _CODES[base] for base in cls.__mro__ if base in KINDS)
+    return _CODES[cls]
+
+
+def from_tree(tree):
+    """Return an Arena holding 'tree', a bbast node, and all under it.
+
+    The bodies of any LazyMethods are parsed. Tokens can be Tokens or
+    positions (as in lean trees).
+    """
+    order = []
+    last_children = []
+    numbers = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        numbers[id(node)] = len(order)
+        order.append(node)
+        children = list(astvisitor.iter_children(node))
+        last_children.append(children[-1] if children else None)
+        stack.extend(reversed(children))
+
+    arena = Arena()
+    for node in order:
+        code = _code(type(node))
+        token = node.token
+        arena.kinds.append(code)
+        if token is None:
+            arena.tokens.append(-1)
+        else:
+            arena.tokens.append(
+                token if isinstance(token, int) else token.pos)
+        name_offset = _NAME_OFFSETS[code]
+        if name_offset == -1:
+            arena.names.append(-1)
+        else:
+            arena.names.append(
+                arena.intern(getattr(node, node._fields[name_offset])))
+        names = node._fields + node._annotations
+        start = len(arena.values)
+        arena.starts.append(start)
+        arena.values.extend([0] * len(names))
+        for offset, name in enumerate(names):
+            arena.values[start + offset] = arena.encode(
+                getattr(node, name), numbers)
+
+    arena.ends = array.array('i', range(1, len(order) + 1))
+    for index in reversed(range(len(order))):
+        last_child = last_children[index]
+        if last_child is not None:
+            arena.ends[index] = arena.ends[numbers[id(last_child)]]
+    return arena
+
+
+def to_tree(arena, tokens=None):
+    """Return the bbast tree held in 'arena'.
+
+    Nodes get their tokens from 'tokens' (any iterable of the Tokens of
+    the source, like bblexer.lex returns) if given, or else just their
+    positions, as in lean trees.
+    """
+    if tokens is not None:
+        tokens = {token.pos: token for token in tokens}
+    nodes = [None] * len(arena)
+    for index in reversed(range(len(arena))):
+        kind = KINDS[arena.kinds[index]]
+        token = arena.tokens[index]
+        if token == -1:
+            token = None
+        elif tokens is not None:
+            token = tokens[token]
+        count = len(kind._fields)
+        start = arena.starts[index]
+        values = [
+            arena.decode(value, nodes.__getitem__) for value in
+            arena.values[start:start + count + len(kind._annotations)]]
+        node = kind(token, *values[:count])
+        for name, value in zip(kind._annotations, values[count:]):
+            setattr(node, name, value)
+        nodes[index] = node
+    return nodes[0]
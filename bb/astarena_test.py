@@ -0,0 +1,178 @@
+import unittest
+import astarena
+import astvisitor
+import bblexer
+import bbparser
+import bbast
+import bbast_testutils
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.maxDiff = None
+        bbast_testutils.add_ast_equality_funcs(self)
+
+
+SOURCE = bbast_testutils.SOURCE
+
+
+class ConversionTestCase(TestCase):
+
+    def test_round_trip(self):
+        tokens = bblexer.lex(SOURCE)
+        module = bbparser.parse(SOURCE, tokens)
+        arena = astarena.from_tree(module)
+        self.assertEqual(len(arena), len(list(astvisitor.walk(module))))
+        bbast_testutils.assert_same_trees(
+            self, astarena.to_tree(arena, tokens), module)
+
+    def test_lean(self):
+        module = bbparser.parse(SOURCE, lean=True)
+        arena = astarena.from_tree(bbparser.parse(SOURCE))
+        bbast_testutils.assert_same_trees(
+            self, astarena.to_tree(arena), module)
+        bbast_testutils.assert_same_trees(
+            self, astarena.to_tree(astarena.from_tree(module)), module)
+
+    def test_annotations(self):
+        module = bbparser.parse(SOURCE)
+        statement = module.classes[0].methods[0].body.statements[0]
+        statement.expr.deduced_type = 'int'
+        arena = astarena.from_tree(module)
+        view = next(arena.views(bbast.Assign))
+        self.assertEqual(view.deduced_type, 'int')
+        self.assertIsNone(view.expr.deduced_type)
+
+        view.expr.deduced_type = 'bb.lang.String'
+        module = astarena.to_tree(arena)
+        statement = module.classes[0].methods[0].body.statements[0]
+        self.assertEqual(statement.expr.deduced_type, 'int')
+        self.assertEqual(
+            statement.expr.expr.deduced_type, 'bb.lang.String')
+
+    def test_preorder(self):
+        module = bbparser.parse(SOURCE)
+        arena = astarena.from_tree(module)
+        nodes = list(astvisitor.walk(module))
+        self.assertEqual(
+            [astarena.KINDS[kind] for kind in arena.kinds],
+            [type(node) for node in nodes])
+        for index, node in enumerate(nodes):
+            self.assertEqual(
+                arena.ends[index] - index, len(list(astvisitor.walk(node))))
+
+    def test_deep_tree(self):
+        depth = 10000
+        source = bbparser.Source('<test>', '(' * depth + 'a' + ')' * depth)
+        expr = bbparser.StacklessParser(source).parse_expression()
+        expr = astarena.to_tree(astarena.from_tree(expr))
+        self.assertEqual(type(expr), bbast.Name)
+        self.assertEqual(expr.token, depth)
+
+    def test_lazy(self):
+        module = bbparser.parse(SOURCE, lazy=True)
+        arena = astarena.from_tree(module)
+        bbast_testutils.assert_same_trees(
+            self, astarena.to_tree(arena, bblexer.lex(SOURCE)),
+            bbparser.parse(SOURCE))
+
+    def test_bad_values(self):
+        module = bbparser.parse(SOURCE)
+        module.package = 1
+        with self.assertRaises(TypeError):
+            astarena.from_tree(module)
+
+
+class ViewTestCase(TestCase):
+
+    def test_attributes(self):
+        module = bbparser.parse(SOURCE)
+        arena = astarena.from_tree(module)
+        root = arena.root
+        self.assertEqual(type(root).__name__, 'Module')
+        self.assertIs(root.kind, bbast.Module)
+        self.assertEqual(root.token, module.token.pos)
+        self.assertEqual(root.imports, ['bb.lang.List'])
+
+        cls = root.classes[0]
+        self.assertEqual(cls.qualified_typename, 'local.Foo')
+        self.assertEqual(
+            [cls.doc, cls.is_native, cls.base],
+            ['A class with a doc.', False, 'bb.lang.Object'])
+        self.assertEqual(cls.members[0].doc, u'A member with a doc, caf\xe9.')
+
+        method = cls.methods[0]
+        self.assertEqual(
+            method.args, [('int', 'a'), ('bb.lang.String', 'b')])
+        self.assertTrue(method.is_static)
+        call = method.body.statements[0].expr.expr
+        self.assertEqual(call.method_name, 'add')
+        self.assertEqual(call.owner.method_name, 'size')
+        self.assertEqual(call.args[0].attribute_name, 'x')
+
+    def test_equality(self):
+        arena = astarena.from_tree(bbparser.parse(SOURCE))
+        self.assertEqual(arena.root.classes[0], arena.root.classes[0])
+        self.assertEqual(
+            len({arena.root.classes[0], arena.root.classes[0]}), 1)
+        self.assertNotEqual(arena.root, arena.root.classes[0])
+        other = astarena.from_tree(bbparser.parse(SOURCE))
+        self.assertNotEqual(arena.root, other.root)
+
+    def test_accept(self):
+        class Visitor(object):
+            def visit_module(self, node):
+                return [cls.accept(self) for cls in node.classes]
+
+            def visit_class(self, node):
+                return [node.name] + [
+                    method.accept(self) for method in node.methods]
+
+            def visit_method(self, node):
+                return node.name
+
+        arena = astarena.from_tree(bbparser.parse(SOURCE))
+        self.assertEqual(
+            arena.root.accept(Visitor()), [['Foo', 'f', 'g'], ['Bar']])
+
+
+class FindTestCase(TestCase):
+
+    def test_find(self):
+        module = bbparser.parse(SOURCE)
+        arena = astarena.from_tree(module)
+        nodes = list(astvisitor.walk(module))
+        for cls in (bbast.MethodCall, bbast.Expression, bbast.Statement,
+                    bbast.Ast, bbast.Module):
+            self.assertEqual(
+                list(arena.find(cls)),
+                [index for index, node in enumerate(nodes)
+                 if isinstance(node, cls)])
+        self.assertEqual(list(arena.find(bbast.Return)), [])
+
+    def test_within(self):
+        arena = astarena.from_tree(bbparser.parse(SOURCE))
+        method = arena.root.classes[0].methods[1]
+        self.assertEqual(
+            [view.method_name
+             for view in arena.views(bbast.MethodCall, method.index)],
+            ['add'])
+        self.assertEqual(
+            list(arena.views(bbast.Method, method.index)), [method])
+
+    def test_name(self):
+        arena = astarena.from_tree(bbparser.parse(SOURCE))
+        self.assertEqual(
+            [type(view.owner).__name__ for view in
+             arena.views(bbast.MethodCall, name='add')],
+            ['MethodCall', 'Name', 'GetAttribute'])
+        self.assertEqual(
+            [type(view).__name__ for view in
+             arena.views(bbast.Expression, name='bar')],
+            ['GetStaticAttribute', 'SetStaticAttribute'])
+        self.assertEqual(list(arena.find(bbast.Ast, name='nope')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
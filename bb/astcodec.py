@@ -0,0 +1,504 @@
+"""astcodec.py
+
+A compact binary encoding for syntax trees, for bbast and sleepast alike.
+
+A tree is written as one record: MAGIC (which includes the version of
+the format), the length of the rest of the record as a varint, and then
+these sections, each preceded by its length in bytes as a varint:
+
+    strings         every distinct string in the tree, UTF-8 encoded and
+                    back to back, the most used ones first
+    string lengths  the length of each string, in characters
+    shapes          two varints for each shape of node in the tree (see
+                    below): twice the string index of the name of its
+                    class (module name, dot, class name), plus 1 if its
+                    _annotations are included, and a bit mask of which
+                    of its values are leaves
+    positions       for each token, in the order they're first used, its
+                    position minus that of the previous one (zigzag
+                    encoded, as they're not necessarily in order)
+    token types     for each token, the string index of its type (none
+                    for lean trees, see below)
+    token values    for each token, 0 for no value, otherwise 1 plus the
+                    string index of its value (none for lean trees)
+    tags            the tree in postfix order: LEAF, LIST or TUPLE, with
+                    the elements of a LIST or TUPLE coming before it, or
+                    FIRST_NODE plus the index of a node's shape, with the
+                    values of its other fields coming before it
+    leaves          each leaf in order, 0 for None, 1 for False, 2 for
+                    True and STRINGS plus its index for a string
+    token refs      the token of each node, in order: 0 for the next
+                    token not used before, otherwise how many tokens back
+                    from that one (the first one being no token at all)
+    lengths         the number of elements of each LIST and TUPLE
+    uri             the string index of the uri of the source, then 1
+                    for a lean tree and 0 otherwise
+
+All sections but the first are unsigned LEB128 varints, and they're
+mostly small numbers, which the decoder turns into ints in bulk.
+
+A node's values are those of its _fields and, unless they are all None
+(as they are before annotating), of its _annotations. Leaves are the
+values that are None, a bool or a string. A node's own leaves are
+written when the node is, in the order of its fields, rather than
+getting tags of their own. Decoding a node passes its token and the
+values of its _fields to the constructor of its class, which has to be
+one of the node classes already imported (see astschema.find_class):
+records can come from a shared cache directory, so the names in them
+never get modules imported.
+
+Only the uri of the Source is stored: decoding takes the Source that the
+tokens should refer to. Neither encoding nor decoding recurses, so even
+the deepest trees (see bbparser.StacklessParser) are fine.
+
+The tokens of lean trees (see bbparser.parse) are just positions, and
+decode as such. Their uri is that of the 'line_index' of the root, if
+it has one, and when decoded with a Source the root gets that Source's
+line_index back.
+"""
+import io
+import itertools
+import operator
+import re
+
+import astschema
+import lexcore
+
+MAGIC = b'AST\x02'
+
+LEAF = 0
+LIST = 1
+TUPLE = 2
+FIRST_NODE = 3
+
+# Leaves other than strings.
+LEAF_VALUES = (None, False, True)
+STRINGS = len(LEAF_VALUES)
+
+_MULTI_BYTE_VARINT_RE = re.compile(b'[\x80-\xff]+[\x00-\x7f]')
+
+
+class _Emit(tuple):
+    # What to write for a LIST, TUPLE or node once all of its elements
+    # have been written: (tag, length) or (tag, token, leaves).
+    pass
+
+
+def _is_leaf(value):
+    return value is None or isinstance(value, (bool, str))
+
+
+class _Encoder(object):
+    def __init__(self):
+        self.strings = dict()  # string -> index in order of first use
+        self.shapes = dict()  # (class, annotated, mask) -> shape index
+        self.shape_refs = []
+        self.tokens = dict()  # id(token) -> (token index, token)
+        self.positions = []
+        self.type_refs = []
+        self.value_refs = []
+        self.tags = []
+        self.leaves = []
+        self.token_refs = []
+        self.lengths = []
+        self.last_pos = 0
+        self.lean = None  # Whether tokens are positions, once known.
+
+    def string(self, string):
+        index = self.strings.get(string)
+        if index is None:
+            index = self.strings[string] = len(self.strings)
+        return index
+
+    def leaf(self, value):
+        if value is None:
+            return 0
+        if value is False:
+            return 1
+        if value is True:
+            return 2
+        return STRINGS + self.string(value)
+
+    def shape(self, cls, annotated, mask):
+        key = cls, annotated, mask
+        index = self.shapes.get(key)
+        if index is None:
+            index = self.shapes[key] = len(self.shapes)
+            self.shape_refs.append((
+                self.string(cls.__module__ + '.' + cls.__name__),
+                annotated, mask))
+        return index
+
+    def token_ref(self, token):
+        seen = len(self.tokens) + 1  # Index 0 is for no token.
+        if token is None:
+            return seen
+        lean = type(token) is int
+        if lean is not self.lean:
+            if self.lean is not None:
+                raise TypeError(
+                    'Cannot encode a tree with both Tokens and positions')
+            self.lean = lean
+        # Positions are the same token if they're equal, Tokens if
+        # they're the same object.
+        key = token if lean else id(token)
+        entry = self.tokens.get(key)
+        if entry is not None:
+            return seen - entry[0]
+
+        # Holding on to the token, so that its id can't be reused.
+        self.tokens[key] = seen, token
+        pos = token if lean else token.pos
+        delta = pos - self.last_pos
+        self.last_pos = pos
+        self.positions.append(delta * 2 if delta >= 0 else -delta * 2 - 1)
+        if not lean:
+            self.type_refs.append(self.string(token.type))
+            value = token.value
+            self.value_refs.append(
+                0 if value is None else self.string(value) + 1)
+        return 0
+
+    def encode(self, tree):
+        tags = self.tags
+        leaves = self.leaves
+        stack = [tree]
+        while stack:
+            value = stack.pop()
+            if type(value) is _Emit:
+                tags.append(value[0])
+                if value[0] < FIRST_NODE:
+                    self.lengths.append(value[1])
+                else:
+                    self.token_refs.append(self.token_ref(value[1]))
+                    leaves.extend(map(self.leaf, value[2]))
+            elif _is_leaf(value):
+                tags.append(LEAF)
+                leaves.append(self.leaf(value))
+            elif isinstance(value, list):
+                stack.append(_Emit((LIST, len(value))))
+                stack.extend(reversed(value))
+            elif isinstance(value, tuple):
+                stack.append(_Emit((TUPLE, len(value))))
+                stack.extend(reversed(value))
+            elif hasattr(value, '_fields'):
+                cls = type(value)
+                names = cls._fields
+                annotated = False
+                for name in cls._annotations:
+                    if getattr(value, name) is not None:
+                        names += cls._annotations
+                        annotated = True
+                        break
+                mask = 0
+                node_leaves = []
+                children = []
+                for i, name in enumerate(names):
+                    child = getattr(value, name)
+                    if _is_leaf(child):
+                        mask |= 1 << i
+                        node_leaves.append(child)
+                    else:
+                        children.append(child)
+                stack.append(_Emit((
+                    FIRST_NODE + self.shape(cls, annotated, mask),
+                    value.token, node_leaves)))
+                stack.extend(reversed(children))
+            else:
+                raise TypeError('Cannot encode %r' % (value,))
+
+
+def dumps(tree):
+    """Encode 'tree' as a record (see module docstring)."""
+    encoder = _Encoder()
+    encoder.encode(tree)
+    if encoder.lean:
+        line_index = getattr(tree, 'line_index', None)
+        uri = '' if line_index is None else line_index.uri
+    else:
+        token = tree.token
+        uri = '' if token is None else token.source.uri
+    uri_ref = encoder.string(uri)
+
+    # Renumber the strings so that the most used ones have the smallest
+    # indices, which take the fewest bytes.
+    counts = [0] * len(encoder.strings)
+    for ref in encoder.type_refs:
+        counts[ref] += 1
+    for ref in encoder.value_refs:
+        if ref:
+            counts[ref - 1] += 1
+    for ref in encoder.leaves:
+        if ref >= STRINGS:
+            counts[ref - STRINGS] += 1
+    order = sorted(range(len(counts)), key=counts.__getitem__, reverse=True)
+    renumbered = [0] * len(order)
+    for new, old in enumerate(order):
+        renumbered[old] = new
+    strings = sorted(encoder.strings, key=encoder.strings.get)
+    strings = [strings[old] for old in order]
+
+    shapes = []
+    for ref, annotated, mask in encoder.shape_refs:
+        shapes.append(renumbered[ref] * 2 + annotated)
+        shapes.append(mask)
+    sections = [
+        ''.join(strings).encode('utf-8'),
+        [len(string) for string in strings],
+        shapes,
+        encoder.positions,
+        [renumbered[ref] for ref in encoder.type_refs],
+        [ref and renumbered[ref - 1] + 1 for ref in encoder.value_refs],
+        encoder.tags,
+        [ref if ref < STRINGS else renumbered[ref - STRINGS] + STRINGS
+         for ref in encoder.leaves],
+        encoder.token_refs,
+        encoder.lengths,
+        [renumbered[uri_ref], 1 if encoder.lean else 0],
+    ]
+    parts = []
+    for section in sections:
+        if not isinstance(section, bytes):
+            section = _encode_varints(section)
+        parts.append(_encode_varints([len(section)]))
+        parts.append(section)
+    body = b''.join(parts)
+    return MAGIC + _encode_varints([len(body)]) + body
+
+
+def dump(tree, f):
+    f.write(dumps(tree))
+
+
+def loads(data, source):
+    """Decode the record in 'data', with its tokens referring to 'source'.
+    """
+    f = io.BytesIO(data)
+    tree = load(f, source)
+    if f.read(1):
+        raise ValueError('Trailing data after syntax tree record')
+    return tree
+
+
+def load(f, source):
+    """Decode the next record read from file 'f' (see loads)."""
+    body = _read_record(f)
+    if body is None:
+        raise EOFError('No syntax tree record left')
+    return _decode(body, lambda uri: source)
+
+
+def iter_load(f, source_for_uri):
+    """Decode records from file 'f' one at a time, until its end.
+
+    Each tree's tokens refer to source_for_uri(uri), uri being that of
+    the source the tree was encoded with.
+    """
+    while True:
+        body = _read_record(f)
+        if body is None:
+            return
+        yield _decode(body, source_for_uri)
+
+
+def _encode_varints(ints):
+    if not ints or max(ints) < 0x80:
+        return bytes(ints)
+    data = bytearray()
+    for value in ints:
+        while value >= 0x80:
+            data.append(0x80 | (value & 0x7f))
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def _decode_varints(data):
+    # Almost all varints are a single byte, which list() decodes for us
+    # at C speed; only the others are put together here.
+    if _MULTI_BYTE_VARINT_RE.search(data) is None:
+        return list(data)
+    ints = []
+    start = 0
+    for match in _MULTI_BYTE_VARINT_RE.finditer(data):
+        ints.extend(data[start:match.start()])
+        value = 0
+        shift = 0
+        for byte in match.group():
+            value |= (byte & 0x7f) << shift
+            shift += 7
+        ints.append(value)
+        start = match.end()
+    ints.extend(data[start:])
+    return ints
+
+
+def _read_varint(f):
+    value = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise ValueError('Truncated syntax tree record')
+        byte = byte[0]
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value
+
+
+def _read_record(f):
+    # The body of the next record in 'f', or None at the end of 'f'.
+    magic = f.read(len(MAGIC))
+    if not magic:
+        return None
+    if magic != MAGIC:
+        raise ValueError('Not a syntax tree record: %r' % magic)
+    size = _read_varint(f)
+    body = f.read(size)
+    if len(body) != size:
+        raise ValueError('Truncated syntax tree record')
+    return body
+
+
+def _split_sections(body):
+    sections = []
+    pos = 0
+    while pos < len(body):
+        size = 0
+        shift = 0
+        while True:
+            byte = body[pos]
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        sections.append(body[pos:pos + size])
+        pos += size
+    if len(sections) != 11 or pos != len(body):
+        raise ValueError('Corrupt syntax tree record')
+    return sections
+
+
+_BUILDERS = dict()
+
+
+def _class(name):
+    # Only node classes (see astschema.find_class): a record never gets
+    # to pick a module to import.
+    cls = astschema.find_class(name)
+    if cls is None:
+        raise ValueError('Not a syntax tree class: %s' % name)
+    return cls
+
+
+def _builder(cls, annotated, mask):
+    # A function that builds a node of the given shape out of the values
+    # of its other fields at the top of the stack (which it pops), and
+    # the next leaves and token. For instance, for a MethodCall whose
+    # method_name is its only leaf:
+    #
+    #     def build(stack, next_leaf, next_token):
+    #         values = stack[-2:]
+    #         del stack[-2:]
+    #         node = cls(next_token(), values[0], next_leaf(), values[1])
+    #         return node
+    key = cls, annotated, mask
+    build = _BUILDERS.get(key)
+    if build is not None:
+        return build
+
+    names = cls._fields + (cls._annotations if annotated else ())
+    if mask >> len(names):
+        raise ValueError('Corrupt syntax tree record')
+    values = []
+    count = 0
+    for i in range(len(names)):
+        if mask & 1 << i:
+            values.append('next_leaf()')
+        else:
+            values.append('values[%d]' % count)
+            count += 1
+    lines = ['def build(stack, next_leaf, next_token):']
+    if count:
+        lines.append('    values = stack[-%d:]' % count)
+        lines.append('    del stack[-%d:]' % count)
+    lines.append('    node = cls(%s)' % ', '.join(
+        ['next_token()'] + values[:len(cls._fields)]))
+    for name, value in zip(names[len(cls._fields):],
+                           values[len(cls._fields):]):
+        lines.append('    node.%s = %s' % (name, value))
+    lines.append('    return node')
+    namespace = {'cls': cls}
+    exec('\n'.join(lines), namespace)
+    build = _BUILDERS[key] = namespace['build']
+    return build
+
+
+def _decode(body, source_for_uri):
+    sections = _split_sections(body)
+    text = sections[0].decode('utf-8')
+    (string_lengths, shapes, positions, type_refs, value_refs, tags,
+     leaf_refs, token_refs, lengths, uri_ref) = [
+        _decode_varints(section) for section in sections[1:]]
+
+    strings = []
+    start = 0
+    for length in string_lengths:
+        strings.append(text[start:start + length])
+        start += length
+    builders = []
+    for i in range(0, len(shapes) - 1, 2):
+        builders.append(_builder(
+            _class(strings[shapes[i] >> 1]), shapes[i] & 1, shapes[i + 1]))
+    source = source_for_uri(strings[uri_ref[0]])
+    lean = uri_ref[1]
+
+    tokens = [None]
+    if lean:
+        tokens.extend(itertools.accumulate(
+            [delta >> 1 if not delta & 1 else -(delta >> 1) - 1
+             for delta in positions]))
+    else:
+        tokens.extend(map(
+            lexcore.Token,
+            itertools.repeat(source),
+            itertools.accumulate(
+                [delta >> 1 if not delta & 1 else -(delta >> 1) - 1
+                 for delta in positions]),
+            [strings[ref] for ref in type_refs],
+            [strings[ref - 1] if ref else None for ref in value_refs]))
+
+    # Token ref 0 is the next token not used before, that is, one past
+    # the number of 0 refs before it. Others count back from there.
+    token_indices = map(
+        operator.sub,
+        itertools.accumulate(map(operator.not_, token_refs), initial=1),
+        token_refs)
+    next_token = map(tokens.__getitem__, token_indices).__next__
+    leaf_values = LEAF_VALUES + tuple(strings)
+    next_leaf = map(leaf_values.__getitem__, leaf_refs).__next__
+    next_length = iter(lengths).__next__
+
+    stack = []
+    push = stack.append
+    for tag in tags:
+        if tag >= FIRST_NODE:
+            push(builders[tag - FIRST_NODE](stack, next_leaf, next_token))
+        elif tag == LEAF:
+            push(next_leaf())
+        else:
+            count = next_length()
+            if count:
+                values = stack[-count:]
+                del stack[-count:]
+            else:
+                values = []
+            push(values if tag == LIST else tuple(values))
+    if len(stack) != 1:
+        raise ValueError('Corrupt syntax tree record')
+    tree = stack[0]
+    if lean and source is not None and hasattr(type(tree), 'line_index'):
+        tree.line_index = source.line_index()
+    return tree
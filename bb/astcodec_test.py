@@ -0,0 +1,148 @@
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+import astcodec
+import bbparser
+import bbast
+import bbast_testutils
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.maxDiff = None
+        bbast_testutils.add_ast_equality_funcs(self)
+
+
+SOURCE = bbast_testutils.SOURCE
+
+
+class RoundTripTestCase(TestCase):
+
+    def test_module(self):
+        module = bbparser.parse(SOURCE)
+        data = astcodec.dumps(module)
+        source = bbparser.Source(SOURCE.uri, SOURCE.text)
+        decoded = astcodec.loads(data, source)
+        bbast_testutils.assert_same_trees(self, decoded, module)
+        self.assertIs(decoded.classes[0].token.source, source)
+        self.assertEqual(
+            [c.qualified_typename for c in decoded.classes],
+            [c.qualified_typename for c in module.classes])
+
+    def test_smaller_than_pickle(self):
+        klass = SOURCE.text[SOURCE.text.index('class Foo'):]
+        text = SOURCE.text + ''.join(
+            klass.replace('Foo', 'Foo%d' % i) for i in range(20))
+        module = bbparser.parse(bbparser.Source('<test>', text))
+        data = astcodec.dumps(module)
+        bbast_testutils.assert_same_trees(
+            self, astcodec.loads(data, None), module)
+        self.assertLess(len(data) * 3, len(pickle.dumps(module)))
+
+    def test_tokens_are_shared(self):
+        module = bbparser.parse(SOURCE)
+        decoded = astcodec.loads(astcodec.dumps(module), SOURCE)
+        method = decoded.classes[0].methods[0]
+        statement = method.body.statements[0]
+        self.assertIs(statement.token, statement.expr.token)
+
+    def test_annotations(self):
+        parser = bbparser.Parser(bbparser.Source('<test>', 'a.f(1)'))
+        expr = parser.parse_expression()
+        decoded = astcodec.loads(astcodec.dumps(expr), None)
+        self.assertIsNone(decoded.deduced_type)
+
+        expr.args[0].deduced_type = 'int'
+        decoded = astcodec.loads(astcodec.dumps(expr), None)
+        self.assertEqual(decoded.args[0].deduced_type, 'int')
+        self.assertIsNone(decoded.deduced_type)
+
+    def test_lean(self):
+        module = bbparser.parse(SOURCE, lean=True)
+        data = astcodec.dumps(module)
+        source = bbparser.Source(SOURCE.uri, SOURCE.text)
+        decoded = astcodec.loads(data, source)
+        bbast_testutils.assert_same_trees(self, decoded, module)
+        self.assertEqual(type(decoded.classes[0].token), int)
+        self.assertEqual(decoded.line_index.uri, SOURCE.uri)
+        self.assertEqual(
+            decoded.line_index.line_starts, module.line_index.line_starts)
+
+        decoded = next(astcodec.iter_load(io.BytesIO(data), lambda uri: (
+            bbparser.Source(uri, SOURCE.text) if uri == SOURCE.uri else
+            None)))
+        self.assertEqual(decoded.line_index.uri, SOURCE.uri)
+        self.assertIsNone(astcodec.loads(data, None).line_index)
+
+    def test_lean_and_not(self):
+        module = bbparser.parse(SOURCE)
+        module.classes[0].token = module.classes[0].token.pos
+        with self.assertRaises(TypeError):
+            astcodec.dumps(module)
+
+    def test_deep_tree(self):
+        depth = 10000
+        source = bbparser.Source('<test>', '(' * depth + 'a' + ')' * depth)
+        expr = bbparser.StacklessParser(source).parse_expression()
+        expr = astcodec.loads(astcodec.dumps(expr), source)
+        self.assertEqual(type(expr), bbast.Name)
+        self.assertEqual(expr.token.pos, depth)
+
+
+class StreamTestCase(TestCase):
+
+    def test_iter_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        modules = []
+        for i in range(3):
+            path = os.path.join(directory, 'Klass%d.bb' % i)
+            with open(path, 'wb') as f:
+                f.write(b'package p; class Klass%d {}' % i)
+            modules.append(bbparser.parse(bbparser.Source.from_path(path)))
+
+        f = io.BytesIO()
+        for module in modules:
+            astcodec.dump(module, f)
+        f.seek(0)
+        decoded = list(astcodec.iter_load(f, bbparser.Source.from_path))
+        for module, expected in zip(decoded, modules):
+            bbast_testutils.assert_same_trees(self, module, expected)
+        self.assertEqual(len(decoded), len(modules))
+        self.assertEqual(
+            [module.token.source.path for module in decoded],
+            [module.token.source.path for module in modules])
+
+        f.seek(0)
+        self.assertEqual(
+            astcodec.load(f, None).classes[0].name, 'Klass0')
+        self.assertEqual(
+            astcodec.load(f, None).classes[0].name, 'Klass1')
+        astcodec.load(f, None)
+        with self.assertRaises(EOFError):
+            astcodec.load(f, None)
+
+    def test_bad_records(self):
+        data = astcodec.dumps(bbparser.parse(SOURCE))
+        for bad in (data[:-1], data[:3], b'NOPE' + data[4:], data + b'!'):
+            with self.assertRaises(ValueError):
+                astcodec.loads(bad, SOURCE)
+
+    def test_unknown_class(self):
+        # Importing 'this' would print the Zen of Python.
+        data = astcodec.dumps(bbparser.parse(SOURCE))
+        self.assertEqual(data.count(b'bbast.Name'), 1)
+        with self.assertRaises(ValueError) as context:
+            astcodec.loads(data.replace(b'bbast.Name', b'this.Name!'), None)
+        self.assertEqual(
+            str(context.exception), 'Not a syntax tree class: this.Name!')
+        self.assertNotIn('this', sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+"""astschema.py
+
+Structural equality and hashing of syntax trees, of bbast and sleepast
+alike, generated from the _fields and _children of each node class.
+
+Node classes declare:
+
+    _fields         the attributes set from the constructor's arguments
+                    after 'token', in their order (see astcodec)
+    _annotations    the attributes only filled in by the annotator
+    _children       those of the _fields that can hold nodes (see
+                    astvisitor)
+    _visit_method   the visitor method their 'accept' calls; abstract
+                    bases like bbast.Expression have none
+    __slots__       every class has to, as nodes have no __dict__: most
+                    declare just their _fields
+
+Ast itself has slots for 'token' and '_digest', where structural_hash
+keeps the digest of the node.
+
+Two nodes are equal if they're of the same kind and their _fields are
+equal, the nodes in them being compared the same way. Tokens (and so
+positions) and annotations don't matter, so a tree equals itself after
+an edit that only moved it, or once annotated. Comparing never recurses,
+so trees of any depth can be compared.
+
+structural_hash is a Merkle hash of that same structure: a digest of
+the kind and the _fields of a node, with the digests of its children in
+place of the children. It's computed once per node, bottom up, and kept
+on the node, so after bbparser.reparse only the new nodes are hashed.
+Digests don't depend on the process (unlike hash()), so they can key
+caches on disk too. Nodes must not be changed once hashed.
+
+Nodes still hash by identity, though, rather than by structural_hash:
+dicts and sets of nodes (like caches of annotations, which bbparser.
+reparse keeps valid by reusing nodes) keep equal nodes that are distinct
+apart, and hashing a node never walks or parses anything. Key by
+structural_hash explicitly to share entries between equal trees.
+
+The Ast classes of bbast and sleepast pass each of their subclasses to
+add_class, which gives them their __eq__.
+"""
+import hashlib
+
+import astvisitor
+
+DIGEST_SIZE = 16
+
+# From node classes to their kinds, the classes whose nodes they stand
+# for: most classes are their own kind, but a subclass without a
+# _visit_method of its own (like bbparser.LazyMethod) is the kind of its
+# base.
+_KINDS = {}
+
+# From node classes to their generated functions (see _generate).
+_SAME = {}
+_KEYS = {}
+
+# From 'module.Class' names to the node classes passed to add_class.
+_CLASSES = {}
+
+_TEMPLATE = '''
+def same(a, b, pairs):
+    if %(compare)s:
+        return False
+    %(push)s
+    return True
+
+def key(node, nested):
+    return (%(key)s)
+'''
+
+
+def kind(cls):
+    """Return the kind of the node class 'cls' (see _KINDS)."""
+    for base in cls.__mro__:
+        if '_visit_method' in vars(base):
+            return base
+    return cls
+
+
+def _generate(cls):
+    # Returns same(a, b, pairs), which is whether the fields of 'a' and
+    # 'b' (nodes of kind 'cls') that can't hold nodes are equal, adding
+    # the pairs of their other fields to 'pairs', and key(node, nested),
+    # the values that go into the digest of 'node'.
+    children = cls._children
+    compare = ' or '.join(
+        'a.%s != b.%s' % (name, name)
+        for name in cls._fields if name not in children) or 'False'
+    push = ''.join(
+        'pairs.append((a.%s, b.%s))\n    ' % (name, name)
+        for name in children)
+    key = repr('%s.%s' % (cls.__module__, cls.__name__)) + ', ' + ''.join(
+        ('nested(node.%s), ' if name in children else 'node.%s, ') % name
+        for name in cls._fields)
+    namespace = {}
+    exec(_TEMPLATE % {'compare': compare, 'push': push, 'key': key},
+         namespace)
+    return namespace['same'], namespace['key']
+
+
+def add_class(cls):
+    """Give the node class 'cls' its generated __eq__."""
+    node_kind = _KINDS[cls] = kind(cls)
+    _CLASSES[cls.__module__ + '.' + cls.__name__] = cls
+    if node_kind is cls:
+        _SAME[cls], _KEYS[cls] = _generate(cls)
+    else:
+        _SAME[cls], _KEYS[cls] = _SAME[node_kind], _KEYS[node_kind]
+    cls.__eq__ = _make_eq(node_kind)
+    # Setting __eq__ on a class after creating it leaves its __hash__ as
+    # it is, but spelled out: nodes hash by identity (see above).
+    cls.__hash__ = object.__hash__
+
+
+def find_class(name):
+    """Return the node class named 'name' (module, dot, class), or None.
+
+    Only classes passed to add_class are found, so only those of modules
+    that have been imported already.
+    """
+    return _CLASSES.get(name)
+
+
+def _make_eq(node_kind):
+    kinds = _KINDS
+
+    def __eq__(self, other):
+        return self is other or (
+            kinds.get(type(other)) is node_kind and
+            _equal_pairs([(self, other)]))
+    return __eq__
+
+
+def _equal_pairs(pairs):
+    # Whether the values in each of 'pairs' are equal.
+    kinds = _KINDS
+    same = _SAME
+    while pairs:
+        a, b = pairs.pop()
+        cls = type(a)
+        if cls is list or cls is tuple:
+            if type(b) is not cls or len(a) != len(b):
+                return False
+            pairs.extend(zip(a, b))
+        elif cls in kinds:
+            if a is b:
+                continue
+            if kinds.get(type(b)) is not kinds[cls]:
+                return False
+            digest = getattr(a, '_digest', None)
+            if digest is not None:
+                other_digest = getattr(b, '_digest', None)
+                if other_digest is not None and digest != other_digest:
+                    return False
+            if not same[cls](a, b, pairs):
+                return False
+        elif a != b:
+            return False
+    return True
+
+
+def _nested(value):
+    # 'value' with the nodes in it replaced by their digests.
+    cls = type(value)
+    if cls is list:
+        return [_nested(item) for item in value]
+    if cls is tuple:
+        return tuple(_nested(item) for item in value)
+    if cls in _KINDS:
+        return value._digest
+    return value
+
+
+def structural_hash(node):
+    """Return the digest (DIGEST_SIZE bytes) of the tree under 'node'."""
+    digest = getattr(node, '_digest', None)
+    if digest is not None:
+        return digest
+    # In preorder, without the subtrees hashed already, so that
+    # going through it backwards hashes children before their parents.
+    order = []
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if getattr(value, '_digest', None) is None:
+            order.append(value)
+            stack.extend(astvisitor.iter_children(value))
+    keys = _KEYS
+    blake2b = hashlib.blake2b
+    for value in reversed(order):
+        key = keys[type(value)](value, _nested)
+        value._digest = blake2b(
+            repr(key).encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+    return node._digest
@@ -0,0 +1,195 @@
+import unittest
+import astarena
+import astschema
+import bbast
+import bbast_testutils
+import bblexer
+import bbparser
+import sleepast
+import sleepparser
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.maxDiff = None
+        bbast_testutils.add_ast_equality_funcs(self)
+
+
+SOURCE = bbast_testutils.SOURCE.text
+
+
+def parse(text, **kwargs):
+    return bbparser.parse(bbparser.Source('<test>', text), **kwargs)
+
+
+class EqualityTestCase(TestCase):
+
+    def test_equal(self):
+        module = parse(SOURCE)
+        self.assertEqual(module, parse(SOURCE))
+        self.assertEqual(module.classes[0], parse(SOURCE).classes[0])
+        self.assertNotEqual(module.classes[0], module.classes[1])
+        self.assertNotEqual(module, parse(SOURCE.replace('x;', 'y;')))
+        self.assertNotEqual(module, parse(SOURCE.replace('(1)', '(2)')))
+        self.assertNotEqual(module, None)
+        self.assertNotEqual(module.classes[0].name, module.classes[0])
+
+    def test_positions_and_annotations(self):
+        module = parse(SOURCE)
+        moved = parse('\n# A comment\n' + SOURCE.replace('    ', '  '))
+        self.assertEqual(module, moved)
+        self.assertEqual(module, parse(SOURCE, lean=True))
+        statement = moved.classes[0].methods[1].body.statements[0]
+        statement.expr.deduced_type = 'int'
+        self.assertEqual(module, moved)
+
+    def test_lazy(self):
+        module = parse(SOURCE, lazy=True)
+        self.assertEqual(type(module.classes[0].methods[0]),
+                         bbparser.LazyMethod)
+        self.assertEqual(module, parse(SOURCE))
+        self.assertEqual(parse(SOURCE), module)
+
+    def test_deep_tree(self):
+        source = bbparser.Source('<test>', 'a' + '.f()' * 10000)
+        a = bbparser.StacklessParser(source).parse_expression()
+        b = bbparser.StacklessParser(source).parse_expression()
+        self.assertEqual(a, b)
+        b.owner.owner.method_name = 'g'
+        self.assertNotEqual(a, b)
+
+    def test_views(self):
+        # Views keep comparing as the same node of the same arena.
+        arena = astarena.from_tree(parse(SOURCE))
+        other = astarena.from_tree(parse(SOURCE))
+        self.assertNotEqual(arena.root, other.root)
+        self.assertEqual(astarena.to_tree(arena), astarena.to_tree(other))
+
+
+class StructuralHashTestCase(TestCase):
+
+    def test_hash(self):
+        module = parse(SOURCE)
+        digest = astschema.structural_hash(module)
+        self.assertEqual(len(digest), astschema.DIGEST_SIZE)
+        self.assertEqual(
+            astschema.structural_hash(parse('\n\n' + SOURCE)), digest)
+        self.assertEqual(
+            astschema.structural_hash(parse(SOURCE, lazy=True)), digest)
+        self.assertNotEqual(
+            astschema.structural_hash(parse(SOURCE.replace('x;', 'y;'))),
+            digest)
+
+    def test_identity_hash(self):
+        # Equal nodes are still distinct keys, and hashing one doesn't
+        # hash (or parse) what's under it.
+        module = parse(SOURCE, lazy=True)
+        other = parse(SOURCE)
+        self.assertEqual(module, other)
+        self.assertEqual(hash(module), object.__hash__(module))
+        self.assertEqual(len({module, other}), 2)
+        names = {module: 'a', other: 'b'}
+        self.assertEqual([names[module], names[other]], ['a', 'b'])
+        self.assertIsNone(getattr(module, '_digest', None))
+
+        module = parse(SOURCE, lazy=True)
+        hash(module)
+        self.assertNotIn('body', vars(module.classes[0].methods[0]))
+
+    def test_structure(self):
+        # The same nodes, but in different fields.
+        a = bbast.Class(None, None, False, False, 'local', 'A', 'x', [],
+                        [bbast.Member(None, None, False, 'int', 'x')], [])
+        b = bbast.Class(None, None, False, False, 'local', 'A', 'x', [],
+                        [], [bbast.Member(None, None, False, 'int', 'x')])
+        self.assertNotEqual(a, b)
+        self.assertNotEqual(
+            astschema.structural_hash(a), astschema.structural_hash(b))
+
+    def test_digests_are_kept(self):
+        text = SOURCE.replace('String name;', 'String name;\n    int y;')
+        source = bbparser.Source('<test>', text)
+        old_tokens = bblexer.lex(source)
+        module = bbparser.parse(source, list(old_tokens))
+        astschema.structural_hash(module)
+
+        start = text.index('int y;')
+        tokens = bblexer.relex(list(old_tokens), start, start + 3, 'float')
+        new_module = bbparser.reparse(
+            module, old_tokens, tokens, start, start + 3, 'float')
+        foo, bar = new_module.classes
+        self.assertIs(foo, module.classes[0])
+        self.assertIsNone(getattr(bar, '_digest', None))
+        self.assertIs(bar.members[0], module.classes[1].members[0])
+        self.assertEqual(
+            astschema.structural_hash(new_module),
+            astschema.structural_hash(parse(source.text)))
+
+    def test_deep_tree(self):
+        source = bbparser.Source('<test>', 'a' + '.f()' * 10000)
+        expr = bbparser.StacklessParser(source).parse_expression()
+        self.assertEqual(
+            astschema.structural_hash(expr),
+            astschema.structural_hash(
+                bbparser.StacklessParser(source).parse_expression()))
+
+
+class NodeClassesTestCase(TestCase):
+
+    def test_children(self):
+        self.assertEqual(
+            bbast_testutils.nodes_outside_children(parse(SOURCE)), [])
+        module = sleepparser.parse(sleepparser.Source('<test>', r"""
+package org.sample
+import com.foo.Bar
+interface Iface extends Base { int f(String s) }
+class Alpha extends Beta implements Iface {
+    int f(String s) {
+        Bar b = Bar(s, [1, 2.5])
+        if s and not b or s { return s; } else { b.x = s ? Bar.y : 'n'; }
+        while b { Bar.z = b.x; break; }
+    }
+}
+"""))
+        self.assertEqual(bbast_testutils.nodes_outside_children(module), [])
+
+    def test_nodes_have_no_dict(self):
+        for module in (bbast, sleepast):
+            classes = [value for value in vars(module).values()
+                       if isinstance(value, type) and
+                       issubclass(value, module.Ast)]
+            self.assertGreater(len(classes), 20)
+            for cls in classes:
+                self.assertFalse(
+                    hasattr(cls.__new__(cls), '__dict__'), cls.__name__)
+
+
+class TestUtilsTestCase(TestCase):
+
+    def test_first_difference(self):
+        a = parse(SOURCE)
+        b = parse(SOURCE.replace('(1)', '(2)'))
+        self.assertIsNone(bbast_testutils.first_difference(a, parse(SOURCE)))
+        path, x, y = bbast_testutils.first_difference(a, b)
+        self.assertEqual(
+            path,
+            'classes[0].methods[1].body.statements[0].expr.expr.args[0]'
+            '.args[0].value')
+        self.assertEqual((x, y), ('1', '2'))
+
+        b = parse(SOURCE.replace('String name;', ''))
+        path, x, y = bbast_testutils.first_difference(a, b)
+        self.assertEqual(path, 'classes[1].members')
+
+    def test_message(self):
+        with self.assertRaises(self.failureException) as context:
+            self.assertEqual(
+                parse(SOURCE), parse(SOURCE.replace('x;', 'y;')))
+        self.assertEqual(
+            str(context.exception),
+            "Trees differ at classes[0].members[0].name: 'x' != 'y'")
+
+
+if __name__ == '__main__':
+    unittest.main()
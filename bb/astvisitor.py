@@ -0,0 +1,99 @@
+"""astvisitor.py
+
+Visitors and walks over syntax trees, of bbast and sleepast alike.
+
+A Visitor finds the method for a node by the _visit_method its class
+declares (the one its 'accept' method calls), but only once per node
+class: the table from node classes to methods is kept on the visitor's
+class. Nodes without a method of their own are passed to generic_visit,
+which visits their children, so passes only write methods for the nodes
+they care about.
+
+walk and iter_children go by the _children of node classes (the fields
+that can hold nodes), getting them with an attrgetter made once per
+class. They don't recurse, so they're fine for trees of any depth.
+"""
+import operator
+
+
+def method_name(node_class):
+    """Return the name of the visitor method for 'node_class', if any.
+
+    That's the method called by its 'accept', like 'visit_module' for
+    bbast.Module, or None for abstract classes like bbast.Expression.
+    """
+    return getattr(node_class, '_visit_method', None)
+
+
+class Visitor(object):
+
+    # From node classes to the functions visiting them, for each Visitor
+    # subclass (see __init_subclass__).
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super(Visitor, cls).__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    def visit(self, node):
+        try:
+            function = self._dispatch[type(node)]
+        except KeyError:
+            function = self._dispatch[type(node)] = self._function(
+                type(node))
+        return function(self, node)
+
+    @classmethod
+    def _function(cls, node_class):
+        name = method_name(node_class)
+        function = getattr(cls, name, None) if name else None
+        return cls.generic_visit if function is None else function
+
+    def generic_visit(self, node):
+        for child in iter_children(node):
+            self.visit(child)
+
+
+# From node classes to functions returning the values of their
+# _children, last first.
+_CHILD_GETTERS = {}
+
+
+def _child_getter(node_class):
+    names = tuple(reversed(node_class._children))
+    if len(names) == 1:
+        getter = operator.attrgetter(names[0])
+        function = lambda node: (getter(node),)
+    elif names:
+        function = operator.attrgetter(*names)
+    else:
+        function = lambda node: ()
+    _CHILD_GETTERS[node_class] = function
+    return function
+
+
+def iter_children(node):
+    """Yield the nodes in the _children of 'node', in order."""
+    cls = type(node)
+    stack = list((_CHILD_GETTERS.get(cls) or _child_getter(cls))(node))
+    while stack:
+        value = stack.pop()
+        cls = type(value)
+        if cls is list or cls is tuple:
+            stack.extend(reversed(value))
+        elif cls is not str and value is not None:
+            yield value
+
+
+def walk(node):
+    """Yield 'node' and all the nodes under it, in preorder."""
+    stack = [node]
+    getters = _CHILD_GETTERS
+    while stack:
+        value = stack.pop()
+        cls = type(value)
+        if cls is list or cls is tuple:
+            stack.extend(reversed(value))
+        elif cls is not str and value is not None:
+            yield value
+            stack.extend((getters.get(cls) or _child_getter(cls))(value))
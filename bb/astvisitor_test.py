@@ -0,0 +1,123 @@
+import unittest
+import astarena
+import astvisitor
+import bbparser
+import bbast
+import bbast_testutils
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.maxDiff = None
+
+
+SOURCE = bbast_testutils.SOURCE
+
+
+class Counter(astvisitor.Visitor):
+    def __init__(self):
+        self.counts = {}
+
+    def count(self, node):
+        name = type(node).__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def visit_method_call(self, node):
+        self.count(node)
+        self.generic_visit(node)
+
+    def visit_name(self, node):
+        self.count(node)
+
+
+class StaticCounter(Counter):
+    def visit_static_method_call(self, node):
+        self.count(node)
+        self.generic_visit(node)
+
+
+class VisitorTestCase(TestCase):
+
+    def test_method_name(self):
+        self.assertEqual(
+            astvisitor.method_name(bbast.Module), 'visit_module')
+        self.assertEqual(
+            astvisitor.method_name(bbast.StaticMethodCall),
+            'visit_static_method_call')
+        self.assertEqual(
+            astvisitor.method_name(bbparser.LazyMethod), 'visit_method')
+        self.assertIsNone(astvisitor.method_name(bbast.Expression))
+
+    def test_dispatch(self):
+        module = bbparser.parse(SOURCE)
+        counter = Counter()
+        counter.visit(module)
+        self.assertEqual(counter.counts, {'MethodCall': 5, 'Name': 6})
+
+        counter = StaticCounter()
+        counter.visit(module)
+        self.assertEqual(
+            counter.counts,
+            {'MethodCall': 5, 'Name': 6, 'StaticMethodCall': 1})
+
+        self.assertIs(
+            Counter._dispatch[bbast.StaticMethodCall],
+            astvisitor.Visitor.generic_visit)
+        self.assertIs(
+            StaticCounter._dispatch[bbast.StaticMethodCall],
+            StaticCounter.visit_static_method_call)
+        self.assertEqual(astvisitor.Visitor._dispatch, {})
+
+    def test_return_values(self):
+        class Names(astvisitor.Visitor):
+            def visit_module(self, node):
+                return [self.visit(cls) for cls in node.classes]
+
+            def visit_class(self, node):
+                return node.name
+
+        self.assertEqual(Names().visit(bbparser.parse(SOURCE)), ['Foo', 'Bar'])
+
+    def test_views(self):
+        module = bbparser.parse(SOURCE)
+        arena = astarena.from_tree(module)
+        counter = StaticCounter()
+        counter.visit(arena.root)
+        self.assertEqual(
+            counter.counts,
+            {'MethodCall': 5, 'Name': 6, 'StaticMethodCall': 1})
+
+
+class WalkTestCase(TestCase):
+
+    def test_walk(self):
+        source = bbparser.Source('<test>', 'a = b.f(1, this.x);')
+        statement = bbparser.Parser(source).parse_statement()
+        self.assertEqual(
+            [type(node).__name__ for node in astvisitor.walk(statement)],
+            ['ExpressionStatement', 'Assign', 'MethodCall', 'Name', 'Int',
+             'GetAttribute', 'This'])
+
+    def test_children(self):
+        module = bbparser.parse(SOURCE)
+        method = module.classes[0].methods[0]
+        self.assertEqual(
+            list(astvisitor.iter_children(method.body)),
+            method.body.statements)
+        self.assertEqual(list(astvisitor.iter_children(method)),
+                         [method.body])
+
+    def test_deep_tree(self):
+        depth = 10000
+        source = bbparser.Source('<test>', '(' * depth + 'a' + ')' * depth)
+        expr = bbparser.StacklessParser(source).parse_expression()
+        self.assertEqual(len(list(astvisitor.walk(expr))), 1)
+
+        source = bbparser.Source('<test>', 'a' + '.f()' * depth)
+        expr = bbparser.StacklessParser(source).parse_expression()
+        self.assertEqual(len(list(astvisitor.walk(expr))), depth + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,17 +14,21 @@ Do a serious rewrite at some point
 # causes clash.
 # SO MUCH TO DO!!!
 
+import astvisitor
 import bbparser
 
 CompileError = bbparser.CompileError
 
 
-def extract_type_data(classes):
+def extract_type_data(classes, names=None):
     """TODO: BURN THIS and replace with something better"""
-    class_from_name = {c.qualified_typename: c for c in classes}
+    # With 'names', the InternTable the classes were parsed with, the
+    # keys are the very strings the trees use for typenames.
+    intern = str if names is None else names.intern
+    class_from_name = {intern(c.qualified_typename): c for c in classes}
 
     # Sorry, I know this is like, the worst name
-    data = {'bb.lang.Object': dict()}
+    data = {intern('bb.lang.Object'): dict()}
 
     working_on_it = set()
 
@@ -64,10 +68,14 @@ def extract_type_data(classes):
 
 
 
-class Annotator(object):
-    def __init__(self, type_data):
+class Annotator(astvisitor.Visitor):
+    def __init__(self, type_data, names=None):
         self.type_data = type_data
         self.scopes = []
+        intern = str if names is None else names.intern
+        self.int_type = intern('int')
+        self.float_type = intern('float')
+        self.string_type = intern('bb.lang.String')
 
     def push_scope(self):
         self.scopes.append(dict())
@@ -85,9 +93,6 @@ class Annotator(object):
         raise CompileError(
             token, "No such variable named '" + name + "' at this scope")
 
-    def visit(self, node):
-        return node.accept(self)
-
     def visit_class(self, node):
         if node.is_native or node.is_interface:
             return
@@ -99,13 +104,6 @@ class Annotator(object):
             self.visit(method.body)
             self.pop_scope()
 
-    def visit_block(self, node):
-        for statement in node.statements:
-            self.visit(statement)
-
-    def visit_expression_statement(self, node):
-        self.visit(node.expr)
-
     def get_member_type(self, token, type_, name):
         if type_ not in self.type_data:
             raise CompileError(token, "No such type: " + type_)
@@ -116,9 +114,7 @@ class Annotator(object):
         return attrs[name]
 
     def visit_method_call(self, node):
-        self.visit(node.owner)
-        for arg in node.args:
-            self.visit(arg)
+        self.generic_visit(node)
         t = self.get_member_type(
             node.token, node.owner.deduced_type, node.method_name)
         if isinstance(t, str):
@@ -131,8 +127,18 @@ class Annotator(object):
         # TODO: Check that expected_argtypes are bases of argts
         node.deduced_type = returns
 
+    def visit_static_method_call(self, node):
+        self.generic_visit(node)
+        t = self.get_member_type(node.token, node.type, node.method_name)
+        if isinstance(t, str):
+            raise CompileError(
+                node.token,
+                "Tried to call attribute like a static method: %s.%s" % (
+                node.type, node.method_name))
+        node.deduced_type = t[0]
+
     def visit_get_attribute(self, node):
-        self.visit(node.owner)
+        self.generic_visit(node)
         t = self.get_member_type(
             node.token, node.owner.deduced_type, node.attribute_name)
         if isinstance(t, tuple):
@@ -158,21 +164,21 @@ class Annotator(object):
 
     def visit_int(self, node):
         if not node.deduced_type:
-            node.deduced_type = 'int'
+            node.deduced_type = self.int_type
 
     def visit_float(self, node):
         if not node.deduced_type:
-            node.deduced_type = 'float'
+            node.deduced_type = self.float_type
 
     def visit_string(self, node):
         if not node.deduced_type:
-            node.deduced_type = 'bb.lang.String'
+            node.deduced_type = self.string_type
 
 
-def annotate(classes):
-    type_data = extract_type_data(classes)
+def annotate(classes, names=None):
+    type_data = extract_type_data(classes, names)
     for c in classes:
-        Annotator(type_data).visit(c)
+        Annotator(type_data, names).visit(c)
 
 
 
@@ -198,6 +198,64 @@ class AnnotatorTestCase(TestCase):
             module_0.classes +
             module_1.classes)
 
+    def test_static_method_call(self):
+        module = bbparser.parse(bbparser.Source('<test>', r"""
+        package local;
+
+        class Foo {
+            static int make(int x) {
+                Foo.make(Foo.make(5));
+            }
+        }
+        """))
+        bbannotator.annotate(module.classes)
+        call = module.classes[0].methods[0].body.statements[0].expr
+        self.assertEqual(type(call), bbast.StaticMethodCall)
+        self.assertEqual(call.deduced_type, 'int')
+        self.assertEqual(call.args[0].deduced_type, 'int')
+        self.assertEqual(call.args[0].args[0].deduced_type, 'int')
+
+    def test_interned_names(self):
+        names = bbparser.InternTable()
+        module_0 = bbparser.parse(bbparser.Source('<test>', r"""
+        package bb.lang;
+
+        native class String {
+            int size();
+        }
+        """), names=names)
+        module_1 = bbparser.parse(bbparser.Source('<test>', r"""
+        package local;
+
+        class Foo {
+            String bar;
+            Foo next;
+
+            void f() {
+                Foo().next.bar.size();
+                "s".size();
+            }
+        }
+        """), names=names)
+        classes = module_0.classes + module_1.classes
+        type_data = bbannotator.extract_type_data(classes, names)
+        bbannotator.annotate(classes, names)
+
+        keys = {key: key for key in type_data}
+        foo = module_1.classes[0]
+        self.assertIs(foo.members[0].type, keys['bb.lang.String'])
+        self.assertIs(foo.members[1].type, keys['local.Foo'])
+        self.assertIs(foo.base, keys['bb.lang.Object'])
+        self.assertIs(foo.package, names.intern('local'))
+        self.assertIs(foo.qualified_typename, keys['local.Foo'])
+        statements = foo.methods[0].body.statements
+        call = statements[0].expr
+        self.assertIs(call.owner.deduced_type, keys['bb.lang.String'])
+        self.assertIs(call.owner.owner.deduced_type, keys['local.Foo'])
+        self.assertIs(call.deduced_type, names.intern('int'))
+        self.assertIs(
+            statements[1].expr.owner.deduced_type, keys['bb.lang.String'])
+
 
 
 if __name__ == '__main__':
@@ -13,13 +13,35 @@ qualified-typename is either
         For instance, "java.util.ArrayList" is a qualified-typename.
 
 """
+import astschema
+
 
 class Ast(object):
+    # What node classes declare is described in astschema.
+    _fields = ()
+    _annotations = ()
+    _children = ()
+    __slots__ = ('token', '_digest')
+
+    def __init_subclass__(cls, **kwargs):
+        super(Ast, cls).__init_subclass__(**kwargs)
+        astschema.add_class(cls)
+
     def __init__(self, token):
-        self.token = token
+        # Just the position of the token (an int) in lean trees (see
+        # bbparser.parse), and so in errors about them.
+        self.token = token  # Token|int|None
+
+    def accept(self, visitor):
+        return getattr(visitor, self._visit_method)(self)
 
 
 class Module(Ast):
+    _fields = ('doc', 'package', 'imports', 'classes')
+    _children = ('classes',)
+    _visit_method = 'visit_module'
+    __slots__ = _fields + ('line_index',)
+
     def __init__(self, token, doc, package, imports, classes):
         super(Module, self).__init__(token)
         self.doc = doc  # string|None
@@ -27,13 +49,21 @@ class Module(Ast):
         self.imports = imports  # [qualified-typename]
         self.classes = classes  # [Class]
 
-    def accept(self, visitor):
-        return visitor.visit_module(self)
+        # Set by bbparser.parse for lean modules.
+        self.line_index = None  # lexcore.LineIndex|None
 
 
 class Class(Ast):
+    _fields = (
+        'doc', 'is_native', 'is_interface', 'package', 'name', 'base',
+        'interfaces', 'members', 'methods')
+    _children = ('members', 'methods')
+    _visit_method = 'visit_class'
+    __slots__ = _fields + ('qualified_typename',)
+
     def __init__(self, token, doc, is_native, is_interface, package, name,
-                 base, interfaces, members, methods):
+                 base, interfaces, members, methods,
+                 qualified_typename=None):
         super(Class, self).__init__(token)
         self.is_native = is_native  # bool
         self.is_interface = is_interface  # bool
@@ -45,15 +75,20 @@ class Class(Ast):
         self.members = members  # [Member]
         self.methods = methods  # [Method]
 
-    @property
-    def qualified_typename(self):
-        return self.package + '.' + self.name
+        # Made once rather than on each use. bbparser passes the one in
+        # the InternTable of the compilation.
+        self.qualified_typename = (  # qualified-typename
+            qualified_typename or self.make_qualified_typename())
 
-    def accept(self, visitor):
-        return visitor.visit_class(self)
+    def make_qualified_typename(self):
+        return self.package + '.' + self.name
 
 
 class Member(Ast):
+    _fields = ('doc', 'is_static', 'type', 'name')
+    _visit_method = 'visit_member'
+    __slots__ = _fields
+
     def __init__(self, token, doc, is_static, type_, name):
         super(Member, self).__init__(token)
         self.doc = doc  # string|None
@@ -61,11 +96,13 @@ class Member(Ast):
         self.type = type_  # qualified-typename
         self.name = name  # NAME-string
 
-    def accept(self, visitor):
-        return visitor.visit_member(self)
-
 
 class Method(Ast):
+    _fields = ('doc', 'is_static', 'returns', 'name', 'args', 'body')
+    _children = ('body',)
+    _visit_method = 'visit_method'
+    __slots__ = _fields
+
     def __init__(self, token, doc, is_static, returns, name, args, body):
         super(Method, self).__init__(token)
         self.doc = doc  # string
@@ -75,83 +112,94 @@ class Method(Ast):
         self.args = args  # [(qualified-typename, NAME-string)]
         self.body = body  # Block|None
 
-    def accept(self, visitor):
-        return visitor.visit_method(self)
-
 
 class Statement(Ast):
-    pass
+    __slots__ = ()
 
 
 class Block(Statement):
+    _fields = ('statements',)
+    _children = ('statements',)
+    _visit_method = 'visit_block'
+    __slots__ = _fields
+
     def __init__(self, token, statements):
         super(Block, self).__init__(token)
         self.statements = statements  # [Statement]
 
-    def accept(self, visitor):
-        return visitor.visit_block(self)
-
 
 class Declaration(Statement):
+    _fields = ('type', 'name')
+    _visit_method = 'visit_declaration'
+    __slots__ = _fields
+
     def __init__(self, token, type_, name):
         super(Declaration, self).__init__(token)
         self.type = type_  # qualified-typename
         self.name = name  # NAME-string
 
-    def accept(self, visitor):
-        return visitor.visit_declaration(self)
-
 
 class If(Statement):
+    _fields = ('condition', 'body', 'other')
+    _children = ('condition', 'body', 'other')
+    _visit_method = 'visit_if'
+    __slots__ = _fields
+
     def __init__(self, token, condition, body, other):
         super(If, self).__init__(token)
         self.condition = condition  # Expression
         self.body = body  # Block
         self.other = other  # Block|If|None
 
-    def accept(self, visitor):
-        return visitor.visit_if(self)
-
 
 class While(Statement):
+    _fields = ('condition', 'body')
+    _children = ('condition', 'body')
+    _visit_method = 'visit_while'
+    __slots__ = _fields
+
     def __init__(self, token, condition, body):
         super(While, self).__init__(token)
         self.condition = condition  # Expression
         self.body = body  # Block
 
-    def accept(self, visitor):
-        return visitor.visit_while(self)
-
 
 class Break(Statement):
-    def accept(self, visitor):
-        return visitor.visit_break(self)
+    _visit_method = 'visit_break'
+    __slots__ = ()
 
 
 class Continue(Statement):
-    def accept(self, visitor):
-        return visitor.visit_continue(self)
+    _visit_method = 'visit_continue'
+    __slots__ = ()
 
 
 class Return(Statement):
+    _fields = ('expr',)
+    _children = ('expr',)
+    _visit_method = 'visit_return'
+    __slots__ = _fields
+
     def __init__(self, token, expr):
         super(Return, self).__init__(token)
         self.expr = expr  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_return(self)
-
 
 class ExpressionStatement(Statement):
+    _fields = ('expr',)
+    _children = ('expr',)
+    _visit_method = 'visit_expression_statement'
+    __slots__ = _fields
+
     def __init__(self, token, expr):
         super(ExpressionStatement, self).__init__(token)
         self.expr = expr  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_expression_statement(self)
-
 
 class Expression(Ast):
+    _annotations = ('deduced_type',)
+    __slots__ = _annotations
+
     def __init__(self, token):
         super(Expression, self).__init__(token)
 
@@ -163,163 +211,186 @@ class Expression(Ast):
 
 
 class Assign(Expression):
+    _fields = ('name', 'expr')
+    _children = ('expr',)
+    _visit_method = 'visit_assign'
+    __slots__ = _fields
+
     def __init__(self, token, name, expr):
         super(Assign, self).__init__(token)
         self.name = name  # NAME-string
         self.expr = expr  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_assign(self)
-
 
 class Name(Expression):
+    _fields = ('name',)
+    _visit_method = 'visit_name'
+    __slots__ = _fields
+
     def __init__(self, token, name):
         super(Name, self).__init__(token)
         self.name = name  # NAME-string
 
-    def accept(self, visitor):
-        return visitor.visit_name(self)
-
 
 class This(Expression):
-    def accept(self, visitor):
-        return visitor.visit_this(self)
+    _visit_method = 'visit_this'
+    __slots__ = ()
 
 
 class Null(Expression):
-    def accept(self, visitor):
-        return visitor.visit_null(self)
+    _visit_method = 'visit_null'
+    __slots__ = ()
 
 
 class TrueExpression(Expression):
-    def accept(self, visitor):
-        return visitor.visit_true(self)
+    _visit_method = 'visit_true'
+    __slots__ = ()
 
 
 class FalseExpression(Expression):
-    def accept(self, visitor):
-        return visitor.visit_false(self)
+    _visit_method = 'visit_false'
+    __slots__ = ()
 
 
 class Int(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_int'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(Int, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_int(self)
-
 
 class Float(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_float'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(Float, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_float(self)
-
 
 class String(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_string'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(String, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_string(self)
-
 
 class List(Expression):
+    _fields = ('args',)
+    _children = ('args',)
+    _visit_method = 'visit_list'
+    __slots__ = _fields
+
     def __init__(self, token, args):
         super(List, self).__init__(token)
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_list(self)
-
 
 class New(Expression):
+    _fields = ('type', 'args')
+    _children = ('args',)
+    _visit_method = 'visit_new'
+    __slots__ = _fields
+
     def __init__(self, token, type_, args):
         super(New, self).__init__(token)
         self.type = type_  # qualified-typename
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_new(self)
-
 
 class SuperMethodCall(Expression):
+    _fields = ('method_name', 'args')
+    _children = ('args',)
+    _visit_method = 'visit_super_method_call'
+    __slots__ = _fields
+
     def __init__(self, token, method_name, args):
         super(SuperMethodCall, self).__init__(token)
         self.method_name = method_name  # NAME-string
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_super_method_call(self)
-
 
 class MethodCall(Expression):
+    _fields = ('owner', 'method_name', 'args')
+    _children = ('owner', 'args')
+    _visit_method = 'visit_method_call'
+    __slots__ = _fields
+
     def __init__(self, token, owner, method_name, args):
         super(MethodCall, self).__init__(token)
         self.owner = owner  # Expression
         self.method_name = method_name  # NAME-string
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_method_call(self)
-
 
 class GetAttribute(Expression):
+    _fields = ('owner', 'attribute_name')
+    _children = ('owner',)
+    _visit_method = 'visit_get_attribute'
+    __slots__ = _fields
+
     def __init__(self, token, owner, attribute_name):
         super(GetAttribute, self).__init__(token)
         self.owner = owner  # Expression
         self.attribute_name = attribute_name  # NAME-string
 
-    def accept(self, visitor):
-        return visitor.visit_get_attribute(self)
-
 
 class SetAttribute(Expression):
+    _fields = ('owner', 'attribute_name', 'expr')
+    _children = ('owner', 'expr')
+    _visit_method = 'visit_set_attribute'
+    __slots__ = _fields
+
     def __init__(self, token, owner, attribute_name, expr):
         super(SetAttribute, self).__init__(token)
         self.owner = owner  # Expression
         self.attribute_name = attribute_name  # NAME-string
         self.expr = expr  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_set_attribute(self)
-
 
 class StaticMethodCall(Expression):
+    _fields = ('type', 'method_name', 'args')
+    _children = ('args',)
+    _visit_method = 'visit_static_method_call'
+    __slots__ = _fields
+
     def __init__(self, token, type_, method_name, args):
         super(StaticMethodCall, self).__init__(token)
         self.type = type_  # qualified-typename
         self.method_name = method_name  # NAME-string
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_method_call(self)
-
 
 class GetStaticAttribute(Expression):
+    _fields = ('type', 'attribute_name')
+    _visit_method = 'visit_get_static_attribute'
+    __slots__ = _fields
+
     def __init__(self, token, type_, attribute_name):
         super(GetStaticAttribute, self).__init__(token)
         self.type = type_  # qualified-typename
         self.attribute_name = attribute_name  # NAME-string
 
-    def accept(self, visitor):
-        return visitor.visit_get_static_attribute(self)
-
 
 class SetStaticAttribute(Expression):
+    _fields = ('type', 'attribute_name', 'expr')
+    _children = ('expr',)
+    _visit_method = 'visit_set_static_attribute'
+    __slots__ = _fields
+
     def __init__(self, token, type_, attribute_name, expr):
         super(SetStaticAttribute, self).__init__(token)
         self.type = type_  # qualified-typename
         self.attribute_name = attribute_name  # NAME-string
         self.expr = expr  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_set_static_attribute(self)
-
 
 
 
@@ -1,15 +1,126 @@
-import unittest
+"""bbast_testutils.py
+
+Comparing syntax trees in tests. Trees are compared by the __eq__ of
+their nodes (see astschema), and only when that fails are they walked
+again, to say where they differ first. As __eq__ leaves out tokens,
+tests that care about them compare the positions of the trees too.
+
+SOURCE is a module with most kinds of nodes, for the tests of the
+passes over trees.
+"""
+import astschema
+import astvisitor
 import bbast
+import bbparser
+
+
+SOURCE = bbparser.Source('<test>', u"""
+package local;
+
+import bb.lang.List;
+
+class Foo {
+    "A class with a doc."
+
+    int x;
+        "A member with a doc, caf\xe9."
+
+    static void f(int a, String b) {
+        a = b.size().add(this.x);
+        c = b.f(1.5, true, false, null, "s", Foo.bar, Foo(a));
+        { b.add(a); { a; } }
+    }
+
+    int g() {
+        Foo.bar = this.x.add(Foo.make(1));
+    }
+}
+
+class Bar {
+    String name;
+}
+""")
+
+
+def positions(tree):
+    """Return the positions of the tokens of the nodes of 'tree'.
+
+    They're in preorder (see astvisitor.walk), and tokens can be Tokens
+    or positions (as in lean trees).
+    """
+    return [getattr(node.token, 'pos', node.token)
+            for node in astvisitor.walk(tree)]
+
+
+def first_difference(a, b):
+    """Return (path, a_value, b_value) for where 'a' and 'b' differ first.
+
+    The path is like 'classes[0].methods[1].body', from 'a' and 'b'
+    themselves (the empty path). Returns None if they don't differ.
+    """
+    stack = [('', a, b)]
+    while stack:
+        path, a, b = stack.pop()
+        if isinstance(a, (list, tuple)) and type(a) is type(b):
+            if len(a) != len(b):
+                return path, a, b
+            for index in reversed(range(len(a))):
+                stack.append(('%s[%d]' % (path, index), a[index], b[index]))
+        elif hasattr(a, '_fields') and hasattr(b, '_fields'):
+            if astschema.kind(type(a)) is not astschema.kind(type(b)):
+                return path, a, b
+            stack.extend(
+                ('%s.%s' % (path, name) if path else name,
+                 getattr(a, name), getattr(b, name))
+                for name in reversed(a._fields))
+        elif a != b:
+            return path, a, b
+    return None
+
 
 def make_ast_equality_func(failureException):
-    def equality_func(a, b):
-        if
+    def equality_func(a, b, msg=None):
+        if a != b:
+            path, x, y = first_difference(a, b)
+            standard_msg = 'Trees differ at %s: %r != %r' % (
+                path or 'the root', x, y)
+            raise failureException(msg or standard_msg)
+    return equality_func
+
+
+def add_ast_equality_funcs(test_case, module=bbast):
+    """Have 'test_case' compare the nodes of 'module' with assertEqual.
+
+    'module' is bbast by default, but can be sleepast too.
+    """
+    function = make_ast_equality_func(test_case.failureException)
+    for value in vars(module).values():
+        if isinstance(value, type) and hasattr(value, '_fields'):
+            test_case.addTypeEqualityFunc(value, function)
+
+
+def assert_same_trees(test_case, a, b):
+    """Have 'test_case' check that trees 'a' and 'b' are equal.
 
-        if type(a) != type(b):
-            return False
+    That's tokens included, unlike comparing them with ==.
+    """
+    test_case.assertEqual(a, b)
+    test_case.assertEqual(positions(a), positions(b))
 
-        attrs = tuple(set(dir(a)) - set(dir(bbast.Ast)))
 
-        for attr in attrs:
-            if getattr(a, attr) != getattr
+def nodes_outside_children(tree):
+    """Return the nodes of 'tree' in fields that aren't in _children.
 
+    Those would be missed by astvisitor, so this should be empty.
+    """
+    found = []
+    for node in astvisitor.walk(tree):
+        stack = [getattr(node, name) for name in node._fields
+                 if name not in node._children]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, (list, tuple)):
+                stack.extend(value)
+            elif hasattr(value, '_fields'):
+                found.append(value)
+    return found
@@ -0,0 +1,379 @@
+"""bbbench.py
+
+Lexer throughput benchmarks over synthetic bb and sleep sources, and
+the memory taken by the syntax trees parsed from them.
+
+    PYTHONPATH=../py python bbbench.py --size 2000000 --output new.json
+    PYTHONPATH=../py python bbbench.py --size 2000000 --compare old.json
+
+(The sleep modules it benchmarks too are in ../py.)
+
+Results are written as JSON so that runs from different revisions can
+be compared; with --compare, the exit status is non-zero if any
+benchmark got slower than --max-slowdown allows, or any syntax tree
+grew by more than --max-growth.
+"""
+import argparse
+import bisect
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import bbast
+import bblexer
+import bbparser
+import sleepast
+import sleeplexer
+import sleepparser
+
+# Relative weights of the kinds of lines that make up a method body.
+DEFAULT_MIX = {
+    'identifiers': 5,
+    'numbers': 2,
+    'docstrings': 1,
+    'comments': 2,
+    'operators': 2,
+}
+
+# The mix for sources to parse: neither parser takes the comparisons
+# from 'operators' or the bare typenames in 'identifiers' arguments.
+AST_MIX = {
+    'identifiers': 0,
+    'operators': 0,
+    'calls': 5,
+}
+
+# The kinds a mix can weigh (see --mix).
+MIX_KINDS = sorted(set(DEFAULT_MIX) | set(AST_MIX))
+
+OPERATORS = ('+', '-', '*', '/', '%', '<', '>', '<=', '>=', '==', '!=')
+
+WORDS = (
+    'the', 'value', 'of', 'this', 'widget', 'is', 'computed', 'lazily',
+    'and', 'cached', 'until', 'next', 'update', 'see', 'also', 'below',
+)
+
+LANGUAGES = {
+    'bb': (bblexer, 'package bench.generated;\n'),
+    'sleep': (sleeplexer, 'package bench.generated\n'),
+}
+
+PARSERS = {
+    'bb': bbparser,
+    'sleep': sleepparser,
+}
+
+
+class _Generator(object):
+    def __init__(self, mix, seed):
+        self.random = random.Random(seed)
+        self.kinds = sorted(kind for kind in mix if mix[kind] > 0)
+        if not self.kinds:
+            raise ValueError('Mix must have at least one positive weight')
+        self.cumulative_weights = []
+        total = 0
+        for kind in self.kinds:
+            total += mix[kind]
+            self.cumulative_weights.append(total)
+
+    def choose_kind(self):
+        weight = self.random.random() * self.cumulative_weights[-1]
+        index = bisect.bisect_right(self.cumulative_weights, weight)
+        return self.kinds[min(index, len(self.kinds) - 1)]
+
+    def name(self):
+        return '%s%d' % (self.random.choice(WORDS), self.random.randint(0, 99))
+
+    def typename(self):
+        return self.name().capitalize()
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for _ in range(count))
+
+    def identifiers(self):
+        return '%s.%s(%s, %s).%s;' % (
+            self.name(), self.name(), self.name(), self.typename(),
+            self.name())
+
+    def calls(self):
+        return '%s = %s.%s(%s, %s.%s(%d)).%s;' % (
+            self.name(), self.name(), self.name(), self.name(),
+            self.typename(), self.name(), self.random.randint(0, 999),
+            self.name())
+
+    def numbers(self):
+        return '%s.put(%d, %d.%d, %d);' % (
+            self.name(), self.random.randint(0, 10 ** 6),
+            self.random.randint(0, 999), self.random.randint(0, 999),
+            self.random.randint(0, 9))
+
+    def docstrings(self):
+        lines = [self.words(8) for _ in range(self.random.randint(1, 6))]
+        return '"""%s\\n%s""";' % (self.words(4), '\n        '.join(lines))
+
+    def comments(self):
+        return '# ' + self.words(10)
+
+    def operators(self):
+        parts = [self.name()]
+        for _ in range(self.random.randint(2, 6)):
+            parts.append(self.random.choice(OPERATORS))
+            parts.append(self.name())
+        return '%s = (%s);' % (self.name(), ' '.join(parts))
+
+    def method(self, index):
+        lines = ['    void run%d(%s %s) {' % (
+            index, self.typename(), self.name())]
+        for _ in range(self.random.randint(3, 12)):
+            lines.append('        ' + getattr(self, self.choose_kind())())
+        lines.append('    }')
+        return '\n'.join(lines)
+
+
+def generate(language, size, mix=None, seed=0):
+    """Generate roughly 'size' characters of 'language' source.
+
+    'language' is 'bb' or 'sleep', and 'mix' overrides the weights in
+    DEFAULT_MIX. The same arguments always produce the same text.
+    """
+    header = LANGUAGES[language][1]
+    generator = _Generator(dict(DEFAULT_MIX, **(mix or {})), seed)
+    parts = [header]
+    length = len(header)
+    index = 0
+    while length < size:
+        methods = [generator.method(index * 10 + i) for i in range(10)]
+        part = '\nclass Bench%d {\n%s\n}\n' % (index, '\n'.join(methods))
+        parts.append(part)
+        length += len(part)
+        index += 1
+    return ''.join(parts)
+
+
+def _time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark(text, language, engine=None, repeat=3):
+    """Time lexing 'text' and return a dict of throughput figures.
+
+    For bb, 'engine' picks one of bblexer.ENGINES. The 'bytes' engine
+    lexes a memory-mapped copy of the text, since that's the only way
+    it's used.
+    """
+    module = LANGUAGES[language][0]
+    data = text.encode('utf-8')
+    if engine == 'bytes':
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'bench.bb')
+            with open(path, 'wb') as f:
+                f.write(data)
+            seconds, tokens = _time(
+                lambda: module.lex(module.Source.from_path(path), engine),
+                repeat)
+        finally:
+            shutil.rmtree(directory)
+    elif engine is not None:
+        seconds, tokens = _time(
+            lambda: module.lex(module.Source('<bench>', text), engine),
+            repeat)
+    else:
+        seconds, tokens = _time(
+            lambda: module.lex(module.Source('<bench>', text)), repeat)
+    return {
+        'characters': len(text),
+        'bytes': len(data),
+        'tokens': len(tokens),
+        'seconds': seconds,
+        'tokens_per_second': len(tokens) / seconds,
+        'mb_per_second': len(data) / seconds / 1e6,
+    }
+
+
+def ast_memory(text, language):
+    """Parse 'text' and return a dict of the memory its tree takes.
+
+    That's what tracemalloc finds still allocated after the parse,
+    leaving out the tokens (lexed beforehand), which the tree shares
+    with the lexer.
+    """
+    parser = PARSERS[language].Parser(
+        PARSERS[language].Source('<bench>', text))
+    parse = (parser.parse_module if language == 'bb' else
+             parser.parse_file_input)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tree = parse()
+        gc.collect()
+        total_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    nodes = 0
+    stack = [tree]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, (bbast.Ast, sleepast.Ast)):
+            nodes += 1
+            stack.extend(getattr(value, name) for name in value._fields)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return {
+        'characters': len(text),
+        'nodes': nodes,
+        'total_bytes': total_bytes,
+        'bytes_per_node': total_bytes / nodes,
+    }
+
+
+def run_all(size, mix=None, seed=0, repeat=3, names=None):
+    """Run every benchmark (or just those in 'names').
+
+    Returns a JSON-ready dict with the results keyed by benchmark name
+    ('bb/<engine>' or 'sleep'), the memory benchmarks ('ast/bb' and
+    'ast/sleep', on sources of AST_MIX rather than 'mix') and the
+    parameters that produced them.
+    """
+    texts = {
+        language: generate(language, size, mix, seed)
+        for language in LANGUAGES
+    }
+    cases = [('bb/' + engine, 'bb', engine)
+             for engine in sorted(bblexer.ENGINES)]
+    cases.append(('sleep', 'sleep', None))
+    results = {}
+    for name, language, engine in cases:
+        if names is None or name in names:
+            results[name] = benchmark(
+                texts[language], language, engine, repeat)
+    memory = {}
+    for language in sorted(PARSERS):
+        name = 'ast/' + language
+        if names is None or name in names:
+            memory[name] = ast_memory(
+                generate(language, size, AST_MIX, seed), language)
+    return {
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'size': size,
+        'mix': dict(DEFAULT_MIX, **(mix or {})),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+        'memory': memory,
+    }
+
+
+def compare(old, new, max_slowdown, max_growth=0.05):
+    """Compare tokens/sec and tree sizes of two runs.
+
+    Returns (lines, regressed).
+    """
+    lines = []
+    regressed = False
+    for key in ('size', 'mix', 'seed'):
+        if old.get(key) != new.get(key):
+            lines.append('warning: runs have different %s: %r != %r' % (
+                key, old.get(key), new.get(key)))
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name]['tokens_per_second']
+        after = new['results'][name]['tokens_per_second']
+        ratio = after / before
+        slower = ratio < 1 - max_slowdown
+        regressed = regressed or slower
+        lines.append('%-12s %12.0f -> %12.0f tokens/s  %.2fx%s' % (
+            name, before, after, ratio, '  REGRESSION' if slower else ''))
+    old_memory = old.get('memory', {})
+    new_memory = new.get('memory', {})
+    for name in sorted(set(old_memory) & set(new_memory)):
+        before = old_memory[name]['bytes_per_node']
+        after = new_memory[name]['bytes_per_node']
+        ratio = after / before
+        grew = ratio > 1 + max_growth
+        regressed = regressed or grew
+        lines.append('%-12s %12.1f -> %12.1f bytes/node  %.2fx%s' % (
+            name, before, after, ratio, '  REGRESSION' if grew else ''))
+    return lines, regressed
+
+
+def _parse_mix(args):
+    mix = {}
+    for arg in args:
+        kind, _, weight = arg.partition('=')
+        if kind not in MIX_KINDS:
+            raise argparse.ArgumentTypeError(
+                'Unknown mix kind: %s (expected one of: %s)' % (
+                    kind, ', '.join(MIX_KINDS)))
+        mix[kind] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--size', type=int, default=1000000,
+                        help='approximate characters per generated source')
+    parser.add_argument('--mix', nargs='*', default=[], metavar='KIND=W',
+                        help='override weights of: ' +
+                        ', '.join(MIX_KINDS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best of this many runs')
+    parser.add_argument('--only', nargs='*', metavar='NAME',
+                        help='only run these benchmarks, e.g. bb/find')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare against the results in this file')
+    parser.add_argument('--max-slowdown', type=float, default=0.1,
+                        help='fraction of throughput --compare tolerates '
+                        'losing')
+    parser.add_argument('--max-growth', type=float, default=0.05,
+                        help='fraction of bytes per node --compare '
+                        'tolerates gaining')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.size, _parse_mix(args.mix), args.seed,
+                      args.repeat, args.only)
+
+    for name, result in sorted(results['results'].items()):
+        print('%-12s %9d tokens %12.0f tokens/s %8.2f MB/s' % (
+            name, result['tokens'], result['tokens_per_second'],
+            result['mb_per_second']))
+    for name, result in sorted(results['memory'].items()):
+        print('%-12s %9d nodes  %12d bytes %8.1f bytes/node' % (
+            name, result['nodes'], result['total_bytes'],
+            result['bytes_per_node']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        lines, regressed = compare(
+            old, results, args.max_slowdown, args.max_growth)
+        for line in lines:
+            print(line)
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import argparse
+import unittest
+import bbbench
+import bblexer
+import sleeplexer
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.maxDiff = None
+
+
+class GenerateTestCase(TestCase):
+    def test_sources_lex(self):
+        for language, module in (('bb', bblexer), ('sleep', sleeplexer)):
+            text = bbbench.generate(language, 5000)
+            self.assertGreaterEqual(len(text), 5000)
+            tokens = module.lex(module.Source('<test>', text))
+            self.assertEqual(tokens[-1].type, 'EOF')
+            self.assertGreater(len(tokens), 500)
+
+    def test_deterministic(self):
+        self.assertEqual(bbbench.generate('bb', 2000, seed=3),
+                         bbbench.generate('bb', 2000, seed=3))
+        self.assertNotEqual(bbbench.generate('bb', 2000, seed=3),
+                            bbbench.generate('bb', 2000, seed=4))
+
+    def test_mix(self):
+        only_comments = {kind: 0 for kind in bbbench.DEFAULT_MIX}
+        only_comments['comments'] = 1
+        text = bbbench.generate('bb', 2000, only_comments)
+        types = {token.type
+                 for token in bblexer.lex(bblexer.Source('<test>', text))}
+        self.assertNotIn('INT', types)
+        self.assertNotIn('STRING', types)
+        self.assertIn('#', text)
+
+        with self.assertRaises(ValueError):
+            bbbench.generate(
+                'bb', 10, {kind: 0 for kind in bbbench.DEFAULT_MIX})
+
+    def test_parse_mix(self):
+        self.assertEqual(bbbench._parse_mix(['calls=3', 'comments=1']),
+                         {'calls': 3.0, 'comments': 1.0})
+        with self.assertRaises(argparse.ArgumentTypeError) as context:
+            bbbench._parse_mix(['loops=1'])
+        self.assertIn('calls, comments, docstrings', str(context.exception))
+
+
+class RunTestCase(TestCase):
+    def test_run_all(self):
+        results = bbbench.run_all(2000, repeat=1)
+        self.assertEqual(
+            sorted(results['results']),
+            sorted(['bb/' + engine for engine in bblexer.ENGINES] +
+                   ['sleep']))
+        counts = {result['tokens']
+                  for name, result in results['results'].items()
+                  if name.startswith('bb/')}
+        self.assertEqual(len(counts), 1)
+        for result in results['results'].values():
+            self.assertGreater(result['tokens_per_second'], 0)
+        self.assertEqual(sorted(results['memory']), ['ast/bb', 'ast/sleep'])
+
+        results = bbbench.run_all(2000, repeat=1, names=['ast/bb'])
+        self.assertEqual(results['results'], {})
+        self.assertEqual(sorted(results['memory']), ['ast/bb'])
+
+    def test_compare(self):
+        old = {'size': 1, 'results': {
+            'bb/loop': {'tokens_per_second': 100.0},
+            'sleep': {'tokens_per_second': 100.0},
+        }}
+        new = {'size': 1, 'results': {
+            'bb/loop': {'tokens_per_second': 95.0},
+            'sleep': {'tokens_per_second': 50.0},
+        }}
+        lines, regressed = bbbench.compare(old, new, 0.1)
+        self.assertTrue(regressed)
+        self.assertEqual(len(lines), 2)
+        self.assertNotIn('REGRESSION', lines[0])
+        self.assertIn('REGRESSION', lines[1])
+
+        lines, regressed = bbbench.compare(old, old, 0.1)
+        self.assertFalse(regressed)
+
+    def test_compare_memory(self):
+        old = {'results': {}, 'memory': {
+            'ast/bb': {'bytes_per_node': 100.0},
+            'ast/sleep': {'bytes_per_node': 100.0},
+        }}
+        new = {'results': {}, 'memory': {
+            'ast/bb': {'bytes_per_node': 104.0},
+            'ast/sleep': {'bytes_per_node': 150.0},
+        }}
+        lines, regressed = bbbench.compare(old, new, 0.1, 0.05)
+        self.assertTrue(regressed)
+        self.assertNotIn('REGRESSION', lines[0])
+        self.assertIn('REGRESSION', lines[1])
+
+        lines, regressed = bbbench.compare(new, old, 0.1, 0.05)
+        self.assertFalse(regressed)
+
+
+class MemoryTestCase(TestCase):
+    def test_ast_memory(self):
+        for language in ('bb', 'sleep'):
+            text = bbbench.generate(language, 5000, bbbench.AST_MIX)
+            result = bbbench.ast_memory(text, language)
+            self.assertEqual(result['characters'], len(text))
+            self.assertGreater(result['nodes'], 300)
+            self.assertGreater(result['total_bytes'], 0)
+            self.assertEqual(
+                result['bytes_per_node'],
+                result['total_bytes'] / result['nodes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 """bblexer.py
 """
+import array
+import collections
+
+import lexcore
 
 OPEN_PARENTHESIS = '('
 CLOSE_PARENTHESIS = ')'
@@ -28,161 +32,253 @@ SYMBOLS = tuple(reversed(sorted((
     ';', '.', ',',
 ))))
 
-ESCAPE_TABLE = {
-    'n': '\n',
-    't': '\t',
-    '\\': '\\',
-    '"': '"',
-    "'": "'",
+
+Source = lexcore.Source
+Token = lexcore.Token
+InternTable = lexcore.InternTable
+ESCAPE_TABLE = lexcore.ESCAPE_TABLE
+
+
+class CompileError(Exception):
+    def __init__(self, token, message):
+        super(CompileError, self).__init__(message)
+        self.token = token
+        self.message = message
+
+    def __reduce__(self):
+        # Exception's own __reduce__ would only pass on 'message'.
+        return type(self), (self.token, self.message)
+
+
+def _is_typename(name):
+    return name[0].isupper() and (len(name) == 1 or not name.isupper())
+
+
+LANGUAGE = lexcore.Language(
+    KEYWORDS, PRIMITIVE_TYPES, SYMBOLS, _is_typename, CompileError)
+
+
+class Lexer(lexcore.Lexer):
+    language = LANGUAGE
+
+
+class FindLexer(lexcore.FindLexer):
+    language = LANGUAGE
+
+
+class RegexLexer(lexcore.RegexLexer):
+    language = LANGUAGE
+
+
+class BytesLexer(lexcore.BytesLexer):
+    language = LANGUAGE
+    text_lexer = RegexLexer
+
+
+ENGINES = {
+    'loop': Lexer,
+    'find': FindLexer,
+    'regex': RegexLexer,
+    'bytes': BytesLexer,
 }
 
 
-class Source(object):
-    def __init__(self, uri, text):
-        self.uri = uri
-        self.text = text
+def lex(source, engine=None, names=None):
+    # With 'names', an InternTable, the values of NAME and TYPENAME
+    # tokens are interned there.
+    return lexcore.tokenize(
+        lexcore.make_lexer(ENGINES, source, engine, names=names))
 
 
-class Token(object):
-    def __init__(self, source, pos, type_, value=None):
-        self.source = source
-        self.pos = pos
-        self.type = type_
-        self.value = value
+# Every token type has a small integer code, so that TokenBuffer can
+# store types in a byte array.
+TOKEN_TYPES = (
+    ('EOF', 'INT', 'FLOAT', 'STRING', 'NAME', 'TYPENAME') +
+    tuple(sorted(KEYWORDS)) +
+    tuple(sorted(SYMBOLS))
+)
+
+TOKEN_TYPE_CODES = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+
+_SLICED_TYPES = {'INT', 'FLOAT', 'NAME', 'TYPENAME'}
+
+
+class TokenView(object):
+    """A token in a TokenBuffer.
+
+    Quacks like a Token, but only holds on to the buffer and an index.
+    Everything else is looked up (and the value sliced out of the source
+    text) when it's asked for.
+    """
+
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def source(self):
+        return self.buffer.source
+
+    @property
+    def pos(self):
+        return self.buffer.starts[self.index]
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.buffer.types[self.index]]
+
+    @property
+    def value(self):
+        return self.buffer.value_at(self.index)
 
     def __repr__(self):
         return 'Token(type_=%r, value=%r)' % (self.type, self.value)
 
 
-class CompileError(Exception):
-    def __init__(self, token, message):
-        super(CompileError, self).__init__(message)
-        self.token = token
-        self.message = message
+class TokenBuffer(object):
+    """Compact, column-oriented alternative to a list of Tokens.
 
+    Each token costs a type code byte plus start and end offsets,
+    instead of a whole Token object. Indexing returns a TokenView, so a
+    TokenBuffer can be handed to bbparser.Parser in place of a list.
+    """
 
-class Lexer(object):
     def __init__(self, source):
         self.source = source
-        self.text = source.text
-        self.pos = 0
-        self.peek = self._extract_token()
-        self.done = False
-
-    def next(self):
-        token = self.peek
-        self.peek = self._extract_token()
-        self.done = token.type == 'EOF'
-        return token
-
-    def _skip_whitespace_and_comments(self):
-        while (self.pos < len(self.text) and
-               (self.text[self.pos] == '#' or
-                self.text[self.pos].isspace())):
-            if self.text[self.pos] == '#':
-                while (self.pos < len(self.text) and
-                       self.text[self.pos] != '\n'):
-                    self.pos += 1
-            else:
-                self.pos += 1
-
-    def _extract_token(self):
-        self._skip_whitespace_and_comments()
-        if self.pos >= len(self.text):
-            return Token(self.source, self.pos, 'EOF')
-
-        start = self.pos
-
-        # INT or FLOAT
-        if self.text[self.pos].isdigit():
-            while (self.pos < len(self.text) and
-                   self.text[self.pos].isdigit()):
-                self.pos += 1
-            if self.pos < len(self.text) and self.text[self.pos] == '.':
-                self.pos += 1
-                while (self.pos < len(self.text) and
-                       self.text[self.pos].isdigit()):
-                    self.pos += 1
-                value = self.text[start:self.pos]
-                return Token(self.source, start, 'FLOAT', value)
-            else:
-                value = self.text[start:self.pos]
-                return Token(self.source, start, 'INT', value)
-
-        # STRING
-        if self.text.startswith(('r"', "r'", '"', "'"), self.pos):
-            if self.text[self.pos] == 'r':
-                raw = True
-                self.pos += 1
-            else:
-                raw = False
-
-            if self.text.startswith(('"""', "'''"), self.pos):
-                quote = self.text[self.pos:self.pos+3]
-                self.pos += 3
-            else:
-                quote = self.text[self.pos]
-                self.pos += 1
-
-            chars = []
-
-            while not self.text.startswith(quote, self.pos):
-                if self.pos >= len(self.text):
-                    raise CompileError(
-                        Token(self.source, start, 'ERROR'),
-                        'Unterminated string literal')
-
-                if not raw and self.text[self.pos] == '\\':
-                    self.pos += 1
-                    ch = self.text[self.pos]
-                    if ch not in ESCAPE_TABLE:
-                        raise CompileError(
-                            Token(self.source, self.pos, 'ERROR'),
-                            'Invalid escape: ' + ch)
-                    chars.append(ESCAPE_TABLE[ch])
-                    self.pos += 1
-                else:
-                    chars.append(self.text[self.pos])
-                    self.pos += 1
-
-            self.pos += len(quote)
-            value = ''.join(chars)
-            return Token(self.source, start, 'STRING', value)
-
-        # TYPENAME or NAME or KEYWORD
-        if self.text[self.pos].isalpha() or self.text[self.pos] == '_':
-            while (self.pos < len(self.text) and
-                   (self.text[self.pos].isalnum() or
-                    self.text[self.pos] == '_')):
-                self.pos += 1
-            value = self.text[start:self.pos]
-            if value in KEYWORDS:
-                return Token(self.source, start, value)
-            elif (value in PRIMITIVE_TYPES or
-                  (value[0].isupper() and
-                   (len(value) == 1 or
-                    not value.isupper()))):
-                return Token(self.source, start, 'TYPENAME', value)
-            else:
-                return Token(self.source, start, 'NAME', value)
-
-        # SYMBOL
-        for symbol in SYMBOLS:
-            if self.text.startswith(symbol, self.pos):
-                self.pos += len(symbol)
-                return Token(self.source, start, symbol)
-
-        # ERROR
-        while (self.pos < len(self.text) and
-               not self.text[self.pos].isspace()):
-            self.pos += 1
-        raise CompileError(Token(self.source, start, 'ERROR'),
-            'Invalid token: ' + self.text[start:self.pos])
-
-
-def lex(source):
-    lexer = Lexer(source)
-    tokens = []
+        self.types = array.array('B')
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+
+    def append(self, type_, start, end):
+        self.types.append(TOKEN_TYPE_CODES[type_])
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def value_at(self, index):
+        type_ = TOKEN_TYPES[self.types[index]]
+        if type_ in _SLICED_TYPES:
+            return self.source.text[self.starts[index]:self.ends[index]]
+        elif type_ == 'STRING':
+            start = self.starts[index]
+            literal = self.source.text[start:self.ends[index]]
+            return LANGUAGE.string_literal_value(self.source, start, literal)
+        else:
+            return None
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('TokenBuffer index out of range')
+        return TokenView(self, index)
+
+
+class TokenStream(object):
+    """Tokens of a source, lexed on demand.
+
+    Only the most recent 'window' tokens are kept, so memory use doesn't
+    grow with the length of the source. Asking for a token that has
+    already been dropped raises IndexError. Past the end of the source,
+    every index is the EOF token.
+
+    bbparser.Parser never looks more than two tokens past its current
+    position, which is what the default window allows for.
+    """
+
+    def __init__(self, lexer, window=3):
+        self.lexer = lexer
+        self.tokens = collections.deque(maxlen=window)
+        self.start = 0  # index of self.tokens[0]
+
+    def __getitem__(self, index):
+        while index >= self.start + len(self.tokens):
+            if len(self.tokens) == self.tokens.maxlen:
+                self.start += 1
+            self.tokens.append(self.lexer.next())
+        if index < self.start:
+            raise IndexError(
+                'Token %d has already been dropped from the stream' % index)
+        return self.tokens[index - self.start]
+
+
+def stream(source, engine=None, window=3):
+    return TokenStream(lexcore.make_lexer(ENGINES, source, engine), window)
+
+
+def lex_compact(source, engine=None):
+    lexer = lexcore.make_lexer(ENGINES, source, engine)
+    tokens = TokenBuffer(source)
     while not lexer.done:
-        tokens.append(lexer.next())
+        end = lexer.peek_end
+        token = lexer.next()
+        tokens.append(token.type, token.pos, end)
     return tokens
+
+
+def relex(tokens, start, end, replacement, engine=None, names=None):
+    """Update 'tokens' after replacing text[start:end] with 'replacement'.
+
+    'tokens' is the result of lexing a source (a list of Tokens). The
+    source is edited in place, and only the tokens around the edit are
+    lexed again: we restart at the last token that starts before the
+    edit (the lexer has no state between tokens, so that's always safe)
+    and stop as soon as a new token lands where an old token started
+    past the edit, since from then on the two streams can't differ.
+
+    Returns the new list of tokens. Tokens before the edit are reused
+    as-is, and tokens after it are reused with their positions shifted
+    in place, so the old list shouldn't be used afterwards. If the edit
+    leaves the text unlexable, CompileError is raised just as lex would,
+    but the source has already been edited by then.
+
+    An edited source has no bytes left to scan, so the 'bytes' engine
+    relexes with 'regex', its text_lexer, instead. With 'names', names
+    are interned there, as with lex.
+    """
+    source = tokens[0].source
+    text = source.text
+    if not 0 <= start <= end <= len(text):
+        raise ValueError('Invalid edit range: %r' % ((start, end),))
+
+    # Index of the last token that starts before the edit, if any.
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tokens[mid].pos < start:
+            lo = mid + 1
+        else:
+            hi = mid
+    first = max(lo - 1, 0)
+
+    source._edit(start, end, replacement)
+
+    shift = len(replacement) - (end - start)
+    edit_end = start + len(replacement)
+    if engine == 'bytes':
+        engine = 'regex'
+    lexer = lexcore.make_lexer(
+        ENGINES, source, engine, tokens[first].pos if lo else 0, names)
+
+    new_tokens = tokens[:first]
+    last = first  # tokens[last:] are candidates for resynchronizing
+    while True:
+        token = lexer.next()
+        if token.pos >= edit_end:
+            old_pos = token.pos - shift
+            while tokens[last].pos < old_pos:
+                last += 1
+            if tokens[last].pos == old_pos:
+                break
+        new_tokens.append(token)
+
+    rest = tokens[last:]
+    if shift:
+        for token in rest:
+            token.pos += shift
+    new_tokens.extend(rest)
+    return new_tokens
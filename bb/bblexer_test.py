@@ -1,5 +1,10 @@
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
 import bblexer
+import lexcore
 
 
 class TestCase(unittest.TestCase):
@@ -17,14 +22,18 @@ class TypeName Type methodName 12 1.3 x.y () 'hoi'
 
 
 class LexerTestCase(TestCase):
+    engine = 'loop'
+
+    def lex(self, source):
+        return bblexer.lex(source, self.engine)
 
     def test_empty_lexer_example(self):
-        tokens = bblexer.lex(EMPTY_LEXER_EXAMPLE)
+        tokens = self.lex(EMPTY_LEXER_EXAMPLE)
         type_value_pairs = [(token.type, token.value) for token in tokens]
         self.assertEqual(type_value_pairs, [('EOF', None)])
 
     def test_simple_example(self):
-        tokens = bblexer.lex(SIMPLE_LEXER_EXAMPLE)
+        tokens = self.lex(SIMPLE_LEXER_EXAMPLE)
         type_value_pairs = [(token.type, token.value) for token in tokens]
 
         self.assertEqual(type_value_pairs, [
@@ -45,7 +54,7 @@ class LexerTestCase(TestCase):
 
     def test_string_ends_with_int(self):
         # This used to crash because I didn't do an EOF check.
-        tokens = bblexer.lex(bblexer.Source('<test>', ' 2342'))
+        tokens = self.lex(bblexer.Source('<test>', ' 2342'))
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[0].type, 'INT')
         self.assertEqual(tokens[0].value, '2342')
@@ -53,33 +62,357 @@ class LexerTestCase(TestCase):
 
     def test_string_ends_with_float(self):
         # The 'int' version of this made me paranoid.
-        tokens = bblexer.lex(bblexer.Source('<test>', ' 2342.5'))
+        tokens = self.lex(bblexer.Source('<test>', ' 2342.5'))
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[0].type, 'FLOAT')
         self.assertEqual(tokens[0].value, '2342.5')
         self.assertEqual(tokens[1].type, 'EOF')
 
     def test_lone_capital_letter_is_typename(self):
-        tokens = bblexer.lex(bblexer.Source('<test>', 'X'))
+        tokens = self.lex(bblexer.Source('<test>', 'X'))
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[0].type, 'TYPENAME')
         self.assertEqual(tokens[0].value, 'X')
         self.assertEqual(tokens[1].type, 'EOF')
 
     def test_primitive_type_is_typename(self):
-        tokens = bblexer.lex(bblexer.Source('<test>', 'int'))
+        tokens = self.lex(bblexer.Source('<test>', 'int'))
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[0].type, 'TYPENAME')
         self.assertEqual(tokens[0].value, 'int')
         self.assertEqual(tokens[1].type, 'EOF')
 
     def test_simple_name(self):
-        tokens = bblexer.lex(bblexer.Source('<test>', 'name'))
+        tokens = self.lex(bblexer.Source('<test>', 'name'))
         self.assertEqual(len(tokens), 2)
         self.assertEqual(tokens[0].type, 'NAME')
         self.assertEqual(tokens[0].value, 'name')
         self.assertEqual(tokens[1].type, 'EOF')
 
+    def test_longest_symbol_wins(self):
+        tokens = self.lex(bblexer.Source('<test>', '<=<+= +=!= ='))
+        types = [token.type for token in tokens]
+        self.assertEqual(types, ['<=', '<', '+=', '+=', '!=', '=', 'EOF'])
+
+    def test_strings(self):
+        tokens = self.lex(bblexer.Source('<test>', r"""
+        'a\tb' "it's" r'a\b' '''x''y''' r'''\''' '' ""
+        """))
+        self.assertEqual([token.value for token in tokens], [
+            'a\tb', "it's", 'a\\b', "x''y", '\\', '', '', None,
+        ])
+
+    def test_positions(self):
+        tokens = self.lex(bblexer.Source('<test>', 'a  # c\n<= 1.5'))
+        self.assertEqual([token.pos for token in tokens], [0, 7, 10, 13])
+
+    def test_non_ascii(self):
+        tokens = self.lex(bblexer.Source('<test>', u'caf\xe9 \xb2'))
+        type_value_pairs = [(token.type, token.value) for token in tokens]
+        self.assertEqual(type_value_pairs, [
+            ('NAME', u'caf\xe9'),
+            ('INT', u'\xb2'),
+            ('EOF', None),
+        ])
+
+    def test_unterminated_string(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            self.lex(bblexer.Source('<test>', 'x """abc\n'))
+        self.assertEqual(
+            context.exception.message, 'Unterminated string literal')
+        self.assertEqual(context.exception.token.pos, 2)
+
+    def test_invalid_escape(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            self.lex(bblexer.Source('<test>', r"x 'a\qb'"))
+        self.assertEqual(context.exception.message, 'Invalid escape: q')
+        self.assertEqual(context.exception.token.pos, 5)
+
+    def test_invalid_escape_in_unterminated_string(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            self.lex(bblexer.Source('<test>', r"x 'a\qb"))
+        self.assertEqual(context.exception.message, 'Invalid escape: q')
+        self.assertEqual(context.exception.token.pos, 5)
+
+    def test_backslash_at_end_of_unterminated_string(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            self.lex(bblexer.Source('<test>', 'x "a\\'))
+        self.assertEqual(
+            context.exception.message, 'Unterminated string literal')
+        self.assertEqual(context.exception.token.pos, 2)
+
+    def test_escaped_quotes(self):
+        tokens = self.lex(bblexer.Source(
+            '<test>', r""" 'it\'s' "\"" '''a\'''b''' "\\" r'\' """))
+        self.assertEqual([token.value for token in tokens], [
+            "it's", '"', "a'''b", '\\', '\\', None,
+        ])
+
+    def test_long_docstring_and_comments(self):
+        doc = 'line\n' * 1000
+        text = '# c\n' * 1000 + '"""' + doc + '""" x'
+        tokens = self.lex(bblexer.Source('<test>', text))
+        self.assertEqual(
+            [(token.type, token.value, token.pos) for token in tokens], [
+                ('STRING', doc, 4000),
+                ('NAME', 'x', len(text) - 1),
+                ('EOF', None, len(text)),
+            ])
+
+    def test_invalid_token(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            self.lex(bblexer.Source('<test>', 'x # $comment\n  $y z'))
+        self.assertEqual(context.exception.message, 'Invalid token: $y')
+        self.assertEqual(context.exception.token.pos, 15)
+
+    def test_interned_names(self):
+        names = bblexer.InternTable()
+        source = bblexer.Source('<test>', 'x Foo.x(x) int class')
+        tokens = bblexer.lex(source, self.engine, names)
+        self.assertEqual(
+            [token.value for token in tokens],
+            ['x', 'Foo', None, 'x', None, 'x', None, 'int', None, None])
+        self.assertIs(tokens[0].value, tokens[3].value)
+        self.assertIs(tokens[0].value, tokens[5].value)
+        self.assertEqual(len(names), 3)
+
+        tokens = bblexer.lex(
+            bblexer.Source('<test>', 'Foo x'), self.engine, names)
+        self.assertIs(tokens[0].value, names.intern('Foo'))
+        self.assertIs(tokens[1].value, names.intern('x'))
+        self.assertEqual(len(names), 3)
+
+
+class FindLexerTestCase(LexerTestCase):
+    engine = 'find'
+
+
+class RegexLexerTestCase(LexerTestCase):
+    engine = 'regex'
+
+
+class TokenBufferTestCase(TestCase):
+
+    def test_matches_lex(self):
+        source = bblexer.Source('<test>', r"""
+        class A { 'x\ty' r'a\b' '''doc''' 1.5 name <= ; }
+        """)
+        expected = [
+            (token.type, token.pos, token.value)
+            for token in bblexer.lex(source)]
+        buffer = bblexer.lex_compact(source)
+        self.assertEqual(len(buffer), len(expected))
+        self.assertEqual(
+            [(token.type, token.pos, token.value) for token in buffer],
+            expected)
+
+    def test_view(self):
+        source = bblexer.Source('<test>', 'x = "hi";')
+        buffer = bblexer.lex_compact(source)
+        token = buffer[2]
+        self.assertIs(token.source, source)
+        self.assertEqual(token.pos, 4)
+        self.assertEqual(repr(token), "Token(type_='STRING', value='hi')")
+        self.assertEqual(buffer[-1].type, 'EOF')
+        with self.assertRaises(IndexError):
+            buffer[len(buffer)]
+
+
+class RelexTestCase(TestCase):
+    def check_relex(self, text, start, end, replacement):
+        source = bblexer.Source('<test>', text)
+        tokens = bblexer.relex(
+            bblexer.lex(source), start, end, replacement)
+        new_text = text[:start] + replacement + text[end:]
+        self.assertEqual(source.text, new_text)
+        self.assertTrue(all(token.source is source for token in tokens))
+        self.assertEqual(
+            [(token.type, token.value, token.pos) for token in tokens],
+            [(token.type, token.value, token.pos)
+             for token in bblexer.lex(bblexer.Source('<test>', new_text))])
+        return tokens
+
+    def test_edit_inside_token(self):
+        self.check_relex('a bc d', 3, 4, 'xyz')
+        self.check_relex('a 12 d', 3, 3, '.')
+        self.check_relex('a < d', 3, 3, '=')
+
+    def test_edit_at_ends(self):
+        self.check_relex('a b', 0, 0, 'x')
+        self.check_relex('a b', 3, 3, 'c')
+        self.check_relex('a b', 0, 3, '')
+        self.check_relex('', 0, 0, 'a b')
+
+    def test_edit_inside_triple_quoted_string(self):
+        self.check_relex('a """ b c d """ e', 8, 8, 'x')
+        self.check_relex('a """ b c d """ e', 7, 10, '\n# \n')
+
+    def test_edit_merges_and_splits_triple_quoted_strings(self):
+        self.check_relex('a """ b """ c """ d """ e', 8, 17, '')
+        self.check_relex('a """ b  d """ e', 8, 8, '""" c """')
+
+    def test_edit_opens_and_closes_comment(self):
+        text = 'a b\nc # d\ne f'
+        self.check_relex(text, 2, 2, '#')
+        self.check_relex(text, 6, 7, '')
+        self.check_relex(text, 9, 10, ' ')
+
+    def test_tokens_away_from_edit_are_reused(self):
+        source = bblexer.Source('<test>', 'a b c d e f')
+        old_tokens = bblexer.lex(source)
+        tokens = bblexer.relex(list(old_tokens), 4, 5, 'xy')
+        self.assertEqual([token.value for token in tokens],
+                         ['a', 'b', 'xy', 'd', 'e', 'f', None])
+        self.assertIs(tokens[0], old_tokens[0])
+        self.assertIsNot(tokens[2], old_tokens[2])
+        self.assertIs(tokens[-2], old_tokens[-2])
+        self.assertEqual(tokens[-2].pos, 11)
+
+    def test_engines(self):
+        for engine in sorted(bblexer.ENGINES):
+            source = bblexer.Source('<test>', 'a b c d')
+            tokens = bblexer.relex(
+                bblexer.lex(source), 2, 3, '"x"', engine=engine)
+            self.assertEqual([token.value for token in tokens],
+                             ['a', 'x', 'c', 'd', None])
+
+    def test_interned_names(self):
+        names = bblexer.InternTable()
+        source = bblexer.Source('<test>', 'a b c')
+        tokens = bblexer.relex(
+            bblexer.lex(source, names=names), 2, 3, 'a', names=names)
+        self.assertIs(tokens[1].value, tokens[0].value)
+        self.assertEqual(len(names), 3)
+
+    def test_error(self):
+        source = bblexer.Source('<test>', 'a b c')
+        with self.assertRaises(bblexer.CompileError) as context:
+            bblexer.relex(bblexer.lex(source), 2, 2, '"')
+        self.assertEqual(
+            context.exception.message, 'Unterminated string literal')
+        self.assertEqual(context.exception.token.pos, 2)
+
+
+class LineAndColumnTestCase(TestCase):
+    def test_line_and_column(self):
+        source = bblexer.Source('<test>', 'ab\n\ncd\n')
+        self.assertEqual(list(source.line_starts), [0, 3, 4, 7])
+        self.assertEqual(source.line_and_column(0), (1, 1))
+        self.assertEqual(source.line_and_column(2), (1, 3))
+        self.assertEqual(source.line_and_column(3), (2, 1))
+        self.assertEqual(source.line_and_column(5), (3, 2))
+        self.assertEqual(source.line_and_column(7), (4, 1))
+
+    def test_token_positions(self):
+        tokens = bblexer.lex(SIMPLE_LEXER_EXAMPLE)
+        self.assertEqual(
+            SIMPLE_LEXER_EXAMPLE.lines_and_columns(
+                token.pos for token in tokens[:4]),
+            [(3, 1), (3, 7), (3, 16), (3, 21)])
+        self.assertEqual(
+            SIMPLE_LEXER_EXAMPLE.line_and_column(tokens[-1].pos), (4, 1))
+
+    def test_line_index(self):
+        source = bblexer.Source('<test>', 'ab\n\ncd\n')
+        line_index = source.line_index()
+        self.assertEqual(line_index.uri, '<test>')
+        self.assertEqual(
+            line_index.lines_and_columns(range(8)),
+            source.lines_and_columns(range(8)))
+        self.assertEqual(line_index.line_and_column(5), (3, 2))
+
+
+class SourceFromPathTestCase(TestCase):
+    def setUp(self):
+        super(SourceFromPathTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, text):
+        path = os.path.join(self.directory, 'example.bb')
+        with open(path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        return path
+
+    def check_same_tokens(self, text):
+        source = bblexer.Source.from_path(self.write(text))
+        self.assertEqual(
+            [(token.type, token.value, token.pos)
+             for token in bblexer.lex(source)],
+            [(token.type, token.value, token.pos)
+             for token in bblexer.lex(bblexer.Source('<test>', text))])
+
+    def test_ascii(self):
+        self.check_same_tokens(SIMPLE_LEXER_EXAMPLE.text)
+
+    def test_non_ascii(self):
+        self.check_same_tokens(
+            u"# caf\xe9\n'na\xefve' x caf\xe9 X\xb2 1\xb2 \u3000 y")
+
+    def test_empty(self):
+        self.check_same_tokens('')
+
+    def test_text_is_decoded_on_demand(self):
+        path = self.write(u'x = "\xe9";')
+        source = bblexer.Source.from_path(path)
+        self.assertEqual(source.uri, path)
+        self.assertEqual(source.data[:], u'x = "\xe9";'.encode('utf-8'))
+        self.assertEqual(source.text, u'x = "\xe9";')
+
+    def test_line_and_column(self):
+        text = u'# caf\xe9\n\u3000x\ny'
+        source = bblexer.Source.from_path(self.write(text))
+        positions = [token.pos for token in bblexer.lex(source)]
+        self.assertEqual(positions, [8, 10, 11])
+        self.assertEqual(
+            source.lines_and_columns(positions), [(2, 2), (3, 1), (3, 2)])
+
+    def test_error_position(self):
+        source = bblexer.Source.from_path(self.write(u'"\xe9\xe9" $'))
+        with self.assertRaises(bblexer.CompileError) as context:
+            bblexer.lex(source)
+        self.assertEqual(context.exception.message, 'Invalid token: $')
+        self.assertEqual(context.exception.token.pos, 5)
+
+    def test_default_engine(self):
+        self.assertIs(
+            type(lexcore.make_lexer(
+                bblexer.ENGINES, bblexer.Source('<test>', 'x'))),
+            bblexer.RegexLexer)
+        self.assertIs(
+            type(lexcore.make_lexer(
+                bblexer.ENGINES, bblexer.Source.from_path(self.write('x')))),
+            bblexer.BytesLexer)
+
+    def test_interned_names(self):
+        # Past a non-ASCII character, tokens come from the text lexer.
+        path = self.write(u'x y "\xe9" x y')
+        names = bblexer.InternTable()
+        tokens = bblexer.lex(bblexer.Source.from_path(path), names=names)
+        self.assertIs(tokens[0].value, tokens[3].value)
+        self.assertIs(tokens[1].value, tokens[4].value)
+        self.assertEqual(len(names), 2)
+
+    def test_pickle(self):
+        path = self.write(u'x \xe9')
+        source = pickle.loads(pickle.dumps(bblexer.Source.from_path(path)))
+        self.assertEqual(source.path, path)
+        self.assertEqual(source.data[:], u'x \xe9'.encode('utf-8'))
+
+        # Once edited, the contents no longer match the file.
+        source._edit(0, 1, 'y')
+        source = pickle.loads(pickle.dumps(source))
+        self.assertEqual(source.path, None)
+        self.assertEqual((source.uri, source.text), (path, u'y \xe9'))
+
+    def test_pickle_error(self):
+        with self.assertRaises(bblexer.CompileError) as context:
+            bblexer.lex(bblexer.Source('<test>', 'x $'))
+        error = pickle.loads(pickle.dumps(context.exception))
+        self.assertEqual(error.message, 'Invalid token: $')
+        self.assertEqual(error.token.pos, 2)
+        self.assertEqual(error.token.source.text, 'x $')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,19 @@
 """bbparser.py
 """
+import contextlib
+import functools
+import gc
+import hashlib
+import io
+import multiprocessing
+import os
+import pickle
+import tempfile
+
+import astcodec
 import bblexer
 import bbast
+import parsecore
 
 OPEN_BRACKET = bblexer.OPEN_BRACKET
 CLOSE_BRACKET = bblexer.CLOSE_BRACKET
@@ -11,6 +23,7 @@ OPEN_CURLEY = '{'
 CLOSE_CURLEY = '}'
 
 Source = bblexer.Source
+InternTable = bblexer.InternTable
 CompileError = bblexer.CompileError
 
 PRIMITIVE_TYPES = bblexer.PRIMITIVE_TYPES
@@ -21,9 +34,22 @@ BUILTIN_TYPES = {
 
 
 class Parser(object):
-    def __init__(self, source):
+    method_class = bbast.Method
+
+    def __init__(self, source, tokens=None, names=None):
+        # 'tokens' may be anything indexable that holds the tokens of
+        # 'source', e.g. the TokenBuffer returned by bblexer.lex_compact,
+        # or the TokenStream returned by bblexer.stream to interleave
+        # lexing with parsing.
+        #
+        # 'names' is the InternTable of the compilation, shared by the
+        # parsers of all its modules, which the names in the tree go
+        # through (only those the parser makes, if 'tokens' is given).
         self.source = source
-        self.tokens = bblexer.lex(source)
+        self.names = InternTable() if names is None else names
+        if tokens is None:
+            tokens = bblexer.lex(source, names=self.names)
+        self.tokens = tokens
         self.pos = 0
 
         # Module level variables
@@ -35,6 +61,9 @@ class Parser(object):
         # unique to the Parser instance.
         self.alias_table = dict()
         self.package = ''
+        # From the TYPENAMEs of the module to their qualified-typenames
+        # (see parse_typename).
+        self.typenames = dict()
 
     def peek(self):
         return self.tokens[self.pos]
@@ -59,6 +88,26 @@ class Parser(object):
             return self.next_token()
 
     def parse_module(self):
+        items = self.iter_module()
+        module = next(items)
+        module.classes.extend(items)
+        return module
+
+    def iter_module(self):
+        """Parse the module one class at a time, as a generator.
+
+        Yields the Module first, with everything but its classes, and
+        then each Class as soon as it's parsed. The classes aren't added
+        to the Module, so that they can be done with one at a time.
+        """
+        token, doc, imports = self.parse_module_header()
+        yield bbast.Module(token, doc, self.package, imports, [])
+        while not self.at('EOF'):
+            yield self.parse_class()
+
+    def parse_module_header(self):
+        # Everything before the classes: returns the module's token, doc
+        # and imports, and sets up 'package' and 'alias_table'.
         token = self.peek()
 
         if self.at('STRING'):
@@ -73,11 +122,7 @@ class Parser(object):
         while self.at('import'):
             imports.append(self.parse_and_process_import())
 
-        classes = []
-        while not self.at('EOF'):
-            classes.append(self.parse_class())
-
-        return bbast.Module(token, doc, self.package, imports, classes)
+        return token, doc, imports
 
     def parse_package_name(self):
         package_items = []
@@ -85,7 +130,7 @@ class Parser(object):
         while self.consume('.'):
             package_items.append(self.expect('NAME').value)
         self.expect(';')
-        return '.'.join(package_items)
+        return self.names.intern('.'.join(package_items))
 
     def parse_and_process_import(self):
         self.expect('import')
@@ -101,7 +146,8 @@ class Parser(object):
             alias = name
         self.expect(';')
 
-        qualified_name = '.'.join(package_items) + '.' + name
+        qualified_name = self.names.intern(
+            '.'.join(package_items) + '.' + name)
 
         self.alias_table[alias] = qualified_name
 
@@ -126,7 +172,7 @@ class Parser(object):
         if self.consume('extends'):
             base = self.parse_typename()
         else:
-            base = 'bb.lang.Object'
+            base = self.names.intern('bb.lang.Object')
 
         if is_native and base != 'bb.lang.Object':
             raise CompileError(
@@ -151,146 +197,186 @@ class Parser(object):
             doc = None
 
         while not self.consume('}'):
-            member_token = self.peek()
+            member = self.parse_class_member(is_native, is_interface)
+            if isinstance(member, bbast.Member):
+                members.append(member)
+            else:
+                methods.append(member)
 
-            if self.consume('static'):
-                if is_interface:
+        return bbast.Class(
+            token=token, doc=doc,
+            is_native=is_native, is_interface=is_interface,
+            package=self.package, name=class_name,
+            base=base, interfaces=interfaces,
+            members=members, methods=methods,
+            qualified_typename=self.names.intern(
+                self.package + '.' + class_name))
+
+    def parse_class_member(self, is_native, is_interface):
+        # A Member or Method of a class with the given flags.
+        member_token = self.peek()
+
+        if self.consume('static'):
+            if is_interface:
+                raise CompileError(
+                    member_token,
+                    "Interfaces cannot have static methods")
+            is_static = True
+        else:
+            is_static = False
+        type_ = self.parse_typename()
+        member_name = self.expect('NAME').value
+        if self.consume(';'):
+            if is_interface:
+                raise CompileError(
+                    member_token,
+                    "Member declarations are not allowed inside "
+                    "interfaces")
+
+            if is_native:
+                raise CompileError(
+                    member_token,
+                    "Native classes are not allowed to declare members");
+
+            if self.at('STRING'):
+                member_doc = self.expect('STRING').value
+            else:
+                member_doc = None
+
+            return bbast.Member(
+                token=member_token, doc=member_doc, is_static=is_static,
+                type_=type_, name=member_name)
+        else:
+            self.expect(OPEN_PARENTHESIS)
+            args = []
+            while not self.consume(CLOSE_PARENTHESIS):
+                argtype = self.parse_typename()
+                argname = self.expect('NAME').value
+                args.append((argtype, argname))
+                if not self.at(CLOSE_PARENTHESIS):
+                    self.expect(',')
+
+            if self.consume(';'):
+                if not (is_native or is_interface):
                     raise CompileError(
                         member_token,
-                        "Interfaces cannot have static methods")
-                is_static = True
+                        'Abstract methods are not supported')
+                if self.at('STRING'):
+                    member_doc = self.expect('STRING').value
+                else:
+                    member_doc = None
+                body = None
             else:
-                is_static = False
-            type_ = self.parse_typename()
-            member_name = self.expect('NAME').value
-            if self.consume(';'):
                 if is_interface:
                     raise CompileError(
                         member_token,
-                        "Member declarations are not allowed inside "
-                        "interfaces")
-
+                        'Interface method implementations are not yet '
+                        'supported')
                 if is_native:
                     raise CompileError(
                         member_token,
-                        "Native classes are not allowed to declare members");
+                        'Native classes cannot define method '
+                        'implementations')
 
-                if self.at('STRING'):
-                    member_doc = self.expect('STRING').value
-                else:
-                    member_doc = None
+                member_doc, body = self.parse_method_body()
 
-                members.append(bbast.Member(
-                    token=member_token, doc=member_doc, is_static=is_static,
-                    type_=type_, name=member_name))
-            else:
-                self.expect(OPEN_PARENTHESIS)
-                args = []
-                while not self.consume(CLOSE_PARENTHESIS):
-                    argtype = self.parse_typename()
-                    argname = self.expect('NAME').value
-                    args.append((argtype, argname))
-                    if not self.at(CLOSE_PARENTHESIS):
-                        self.expect(',')
-
-                if self.consume(';'):
-                    if not (is_native or is_interface):
-                        raise CompileError(
-                            member_token,
-                            'Abstract methods are not supported')
-                    if self.at('STRING'):
-                        member_doc = self.expect('STRING').value
-                    else:
-                        member_doc = None
-                    body = None
-                else:
-                    if is_interface:
-                        raise CompileError(
-                            member_token,
-                            'Interface method implementations are not yet '
-                            'supported')
-                    if is_native:
-                        raise CompileError(
-                            member_token,
-                            'Native classes cannot define method '
-                            'implementations')
-
-                    if (self.pos + 2 < len(self.tokens) and
-                            self.tokens[self.pos + 1].type == 'STRING' and
-                            self.tokens[self.pos + 2].type == ';'):
-                        body_token = self.expect('{')
-                        member_doc = self.expect('STRING').value
-                        self.expect(';')
-                        stmts = []
-                        while not self.consume('}'):
-                            stmts.append(self.parse_statement())
-                        body = bbast.Block(body_token, stmts)
-                    else:
-                        body = self.parse_block()
-                        member_doc = None
-
-                methods.append(bbast.Method(
-                    token=member_token, doc=member_doc, is_static=is_static,
-                    returns=type_, name=member_name,
-                    args=args, body=body))
+            return self.method_class(
+                token=member_token, doc=member_doc, is_static=is_static,
+                returns=type_, name=member_name,
+                args=args, body=body)
 
-        return bbast.Class(
-            token=token, doc=doc,
-            is_native=is_native, is_interface=is_interface,
-            package=self.package, name=class_name,
-            base=base, interfaces=interfaces,
-            members=members, methods=methods)
+    def parse_method_body(self):
+        # A method's doc, if it has one, is the first thing in its body:
+        # returns the doc (or None) and the body.
+
+        # Every token stream ends with EOF, so if the next token is a
+        # STRING there's always one after it.
+        if (self.tokens[self.pos + 1].type == 'STRING' and
+                self.tokens[self.pos + 2].type == ';'):
+            body_token = self.expect('{')
+            doc = self.expect('STRING').value
+            self.expect(';')
+            stmts = []
+            while not self.consume('}'):
+                stmts.append(self.parse_statement())
+            return doc, bbast.Block(body_token, stmts)
+        else:
+            return None, self.parse_block()
 
     def parse_typename(self):
         name = self.expect('TYPENAME').value
+        try:
+            return self.typenames[name]
+        except KeyError:
+            pass
         if name in PRIMITIVE_TYPES:
-            return name
+            typename = name
         elif name in BUILTIN_TYPES:
-            return 'bb.lang.' + name
+            typename = 'bb.lang.' + name
         elif name in self.alias_table:
-            return self.alias_table[name]
+            typename = self.alias_table[name]
         else:
-            return self.package + '.' + name
+            typename = self.package + '.' + name
+        typename = self.typenames[name] = self.names.intern(typename)
+        return typename
+
+    # Runs the productions that can contain others, which are written as
+    # generators (see parsecore).
+    run_production = staticmethod(parsecore.recurse)
 
     def parse_block(self):
+        return self.run_production(self._parse_block())
+
+    def parse_statement(self):
+        return self.run_production(self._parse_statement())
+
+    def parse_expression(self):
+        return self.run_production(self._parse_expression())
+
+    def _parse_block(self):
         token = self.expect(OPEN_CURLEY)
         stmts = []
         while not self.consume(CLOSE_CURLEY):
-            stmts.append(self.parse_statement())
+            stmts.append((yield self._parse_statement()))
         return bbast.Block(token, stmts)
 
-    def parse_statement(self):
-        token = self.peek()
-        if self.at(OPEN_CURLEY):
-            return self.parse_block()
+    def _parse_statement(self):
+        token = self.tokens[self.pos]
+        if token.type == OPEN_CURLEY:
+            return (yield self._parse_block())
         else:
-            expr = self.parse_expression()
+            expr = yield self._parse_expression()
             self.expect(';')
             return bbast.ExpressionStatement(token, expr)
 
-    def parse_expression_list(self, open_, close):
+    def _parse_expression_list(self, open_, close):
         self.expect(open_)
         args = []
         while not self.consume(close):
-            args.append(self.parse_expression())
+            args.append((yield self._parse_expression()))
             if not self.at(close):
                 self.expect(',')
         return args
 
-    def parse_expression(self):
-        return self.parse_postfix_expression()
+    def _parse_expression(self):
+        # A primary expression, then any attribute accesses, method
+        # calls and attribute assignments on it.
+        parse = self.NESTED_PRIMARY_EXPRESSION_PARSERS.get(
+            self.tokens[self.pos].type)
+        if parse is None:
+            expr = self.parse_primary_expression()
+        else:
+            expr = yield parse(self)
 
-    def parse_postfix_expression(self):
-        expr = self.parse_primary_expression()
         while True:
             token = self.peek()
             if self.consume('.'):
                 name = self.expect('NAME').value
                 if self.at(OPEN_PARENTHESIS):
-                    args = self.parse_expression_list('(', ')')
+                    args = yield self._parse_expression_list('(', ')')
                     expr = bbast.MethodCall(token, expr, name, args)
                 elif self.consume('='):
-                    rhs = self.parse_expression()
+                    rhs = yield self._parse_expression()
                     expr = bbast.SetAttribute(token, expr, name, rhs)
                 else:
                     expr = bbast.GetAttribute(token, expr, name)
@@ -299,61 +385,683 @@ class Parser(object):
         return expr
 
     def parse_primary_expression(self):
-        token = self.peek()
+        # Only those that can't contain other expressions: the others
+        # are in NESTED_PRIMARY_EXPRESSION_PARSERS.
+        token = self.tokens[self.pos]
+        parse = self.PRIMARY_EXPRESSION_PARSERS.get(token.type)
+        if parse is None:
+            raise CompileError(
+                token, 'Expected expression but got %r' % token)
+        return parse(self)
 
-        if self.consume('('):
-            expr = self.parse_expression()
-            self.expect(')')
-            return expr
+    # Handlers for parse_primary_expression, one per kind of token a
+    # primary expression can start with.
 
-        if self.consume('this'):
-            return bbast.This(token)
+    def parse_this(self):
+        return bbast.This(self.next_token())
 
-        if self.consume('null'):
-            return bbast.Null(token)
+    def parse_null(self):
+        return bbast.Null(self.next_token())
 
-        if self.consume('true'):
-            return bbast.TrueExpression(token)
+    def parse_true(self):
+        return bbast.TrueExpression(self.next_token())
 
-        if self.consume('false'):
-            return bbast.FalseExpression(token)
+    def parse_false(self):
+        return bbast.FalseExpression(self.next_token())
 
-        if self.consume('NAME'):
-            name = token.value
-            if self.consume('='):
-                rhs = self.parse_expression()
-                return bbast.Assign(token, name, rhs)
-            else:
-                return bbast.Name(token, name)
+    def parse_int(self):
+        token = self.next_token()
+        return bbast.Int(token, token.value)
 
-        if self.consume('INT'):
-            return bbast.Int(token, token.value)
+    def parse_float(self):
+        token = self.next_token()
+        return bbast.Float(token, token.value)
 
-        if self.consume('FLOAT'):
-            return bbast.Float(token, token.value)
+    def parse_string(self):
+        token = self.next_token()
+        return bbast.String(token, token.value)
 
-        if self.consume('STRING'):
-            return bbast.String(token, token.value)
+    PRIMARY_EXPRESSION_PARSERS = {
+        'this': parse_this,
+        'null': parse_null,
+        'true': parse_true,
+        'false': parse_false,
+        'INT': parse_int,
+        'FLOAT': parse_float,
+        'STRING': parse_string,
+    }
 
-        if self.at('TYPENAME'):
-            type_ = self.parse_typename()
+    # The generators for the primary expressions that can contain
+    # others, by the kind of token they start with.
+
+    def _parse_parenthesized_expression(self):
+        self.expect('(')
+        expr = yield self._parse_expression()
+        self.expect(')')
+        return expr
+
+    def _parse_name_or_assign(self):
+        token = self.next_token()
+        name = token.value
+        if self.consume('='):
+            rhs = yield self._parse_expression()
+            return bbast.Assign(token, name, rhs)
+        else:
+            return bbast.Name(token, name)
+
+    def _parse_typename_expression(self):
+        token = self.peek()
+        type_ = self.parse_typename()
+        if self.at(OPEN_PARENTHESIS):
+            args = yield self._parse_expression_list('(', ')')
+            return bbast.New(token, type_, args)
+        else:
+            self.expect('.')
+            name = self.expect('NAME').value
             if self.at(OPEN_PARENTHESIS):
-                args = self.parse_expression_list('(', ')')
-                return bbast.New(token, type_, args)
+                args = yield self._parse_expression_list('(', ')')
+                return bbast.StaticMethodCall(token, type_, name, args)
+            elif self.consume('='):
+                expr = yield self._parse_expression()
+                return bbast.SetStaticAttribute(token, type_, name, expr)
             else:
-                self.expect('.')
-                name = self.expect('NAME').value
-                if self.at(OPEN_PARENTHESIS):
-                    args = self.parse_expression_list('(', ')')
-                    return bbast.StaticMethodCall(token, type_, name, args)
-                elif self.consume('='):
-                    expr = self.parse_expression()
-                    return bbast.SetStaticAttribute(token, type_, name, expr)
-                else:
-                    return bbast.GetStaticAttribute(token, type_, name)
+                return bbast.GetStaticAttribute(token, type_, name)
+
+    NESTED_PRIMARY_EXPRESSION_PARSERS = {
+        '(': _parse_parenthesized_expression,
+        'NAME': _parse_name_or_assign,
+        'TYPENAME': _parse_typename_expression,
+    }
+
+
+class StacklessParser(Parser):
+    """Parser that doesn't recurse in Python to parse nested code.
+
+    Runs its productions with parsecore.run, so how deeply blocks and
+    expressions can nest is bounded by memory instead of by
+    sys.getrecursionlimit(). Builds exactly the same trees as Parser,
+    just a little more slowly.
+    """
+
+    run_production = staticmethod(parsecore.run)
+
+
+class UnparsedBody(object):
+    """Where the body of a LazyMethod is in the tokens of its module."""
+
+    def __init__(self, parser, pos):
+        self.parser = parser
+        self.pos = pos
+
+    def parse(self):
+        # DeclarationParser only overrides how bodies are skipped, so
+        # Parser's methods parse them for real.
+        self.parser.pos = self.pos
+        return Parser.parse_method_body(self.parser)[1]
+
 
-        raise CompileError(token, 'Expected expression but got %r' % token)
+class LazyMethod(bbast.Method):
+    """A Method whose body is only parsed the first time it's used.
+
+    DeclarationParser makes these with an UnparsedBody for 'body'. Once
+    parsed, the Block is just the 'body' attribute, as for any Method,
+    and syntax errors in it are raised from there. Unlike other nodes,
+    LazyMethods have a __dict__, which is where that attribute is kept
+    (by functools.cached_property, overriding Method's slot).
+    """
+
+    def __init__(self, token, doc, is_static, returns, name, args, body):
+        super(LazyMethod, self).__init__(
+            token, doc, is_static, returns, name, args, body)
+        if isinstance(body, UnparsedBody):
+            del self.body
+            self.unparsed_body = body
+
+    @functools.cached_property
+    def body(self):
+        body = self.unparsed_body.parse()
+        del self.unparsed_body
+        return body
+
+    def __reduce__(self):
+        # Pickled (e.g. by parse_many) as the Method it stands for.
+        return bbast.Method, (self.token,) + tuple(
+            getattr(self, name) for name in self._fields)
+
+
+class DeclarationParser(Parser):
+    """Parser that leaves method bodies to be parsed on demand.
+
+    Only finds where each method body ends, by matching braces, which is
+    most of the work saved for users of only the declarations (like
+    bbannotator.extract_type_data). Methods are LazyMethods, holding on
+    to this parser and its tokens until their bodies are parsed.
+    """
+
+    method_class = LazyMethod
+
+    def parse_method_body(self):
+        if (self.tokens[self.pos + 1].type == 'STRING' and
+                self.tokens[self.pos + 2].type == ';'):
+            doc = self.tokens[self.pos + 1].value
+        else:
+            doc = None
+        body = UnparsedBody(self, self.pos)
+        self.skip_block()
+        return doc, body
+
+    def skip_block(self):
+        self.expect(OPEN_CURLEY)
+        depth = 1
+        while depth:
+            type_ = self.peek().type
+            if type_ == 'EOF':
+                self.expect(CLOSE_CURLEY)
+            self.pos += 1
+            if type_ == OPEN_CURLEY:
+                depth += 1
+            elif type_ == CLOSE_CURLEY:
+                depth -= 1
+
+
+# A TokenStream drops the tokens of a method body well before a
+# LazyMethod would get to parse it.
+_LAZY_STREAM_ERROR = 'Lazily parsed modules cannot be parsed from a stream'
+
+
+def parse(source, tokens=None, stackless=False, cache=None, lazy=False,
+          lean=False, docs=True, names=None):
+    # With lazy=True, method bodies are only parsed when they're used
+    # (see DeclarationParser), and by Parser even if stackless=True.
+    #
+    # With lean=True, nodes keep only the position of their token (see
+    # bbast.Ast), and the module gets a 'line_index' to resolve those
+    # (see lexcore.LineIndex), so nothing in the tree refers to 'source'.
+    # With docs=False, docs are dropped.
+    #
+    # 'names' is the InternTable to share with the parses of the other
+    # modules of a compilation (see Parser). Modules loaded from 'cache'
+    # don't go through it.
+    if lazy and lean:
+        raise ValueError('Lazily parsed modules cannot be lean')
+    if lazy and isinstance(tokens, bblexer.TokenStream):
+        raise ValueError(_LAZY_STREAM_ERROR)
+    if cache is not None:
+        key = cache.key(source)
+        module = cache._load(key, source)
+        if module is not None:
+            return _strip(module, source, lean, docs)
+    if lazy:
+        parser_class = DeclarationParser
+    else:
+        parser_class = StacklessParser if stackless else Parser
+    module = parser_class(source, tokens, names).parse_module()
+    if cache is not None and not lazy:
+        # Storing a lazily parsed module would parse all its bodies.
+        cache._store(key, astcodec.dumps(module))
+    return _strip(module, source, lean, docs)
+
+
+def _strip(module, source, lean, docs):
+    # See parse. Skips the bodies of LazyMethods not parsed yet, rather
+    # than parse them.
+    if not lean and docs:
+        return module
+    stack = [module]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, bbast.Ast):
+            if lean and value.token is not None:
+                value.token = value.token.pos
+            if not docs and 'doc' in value._fields:
+                value.doc = None
+            stack.extend(
+                getattr(value, name) for name in value._fields
+                if not (name == 'body' and isinstance(value, LazyMethod) and
+                        'body' not in vars(value)))
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    if lean:
+        module.line_index = source.line_index()
+    return module
+
+
+def iter_parse(source, tokens=None, stackless=False, lazy=False,
+               names=None):
+    # Like parse, but see Parser.iter_module. With tokens from
+    # bblexer.stream, not even the tokens of the whole module are held
+    # at once (which lazy=True needs though, to parse bodies later).
+    if lazy and isinstance(tokens, bblexer.TokenStream):
+        raise ValueError(_LAZY_STREAM_ERROR)
+    if lazy:
+        parser_class = DeclarationParser
+    else:
+        parser_class = StacklessParser if stackless else Parser
+    return parser_class(source, tokens, names).iter_module()
+
+
+def reparse(module, old_tokens, tokens, start, end, replacement,
+            names=None):
+    """Update 'module' after an edit of its source, reusing its nodes.
+
+    'module' was parsed from 'old_tokens', and 'tokens' is what
+    bblexer.relex returned for replacing text[start:end] with
+    'replacement'. Only the class member (or failing that, the class)
+    around the edit is parsed again, parsing on until the tokens line up
+    with an old member or class again. Returns a new Module, which is
+    just what parse would give for 'tokens', but made of the very same
+    nodes as 'module' everywhere else.
+
+    Lean modules can't be reparsed: the nodes from 'tokens' wouldn't be.
+    Pass the InternTable 'module' was parsed with as 'names' (and to
+    bblexer.relex) to keep the names in the new nodes in it too.
+    """
+    if module.line_index is not None:
+        raise ValueError('Lean modules cannot be reparsed')
+    parser = Parser(tokens[0].source, tokens, names)
+    prefix, suffix = _unchanged_tokens(
+        old_tokens, tokens, start, start + len(replacement))
+    parser.parse_module_header()
+    if parser.pos >= prefix:
+        # The edit is in the module header, or right after it, where it
+        # may have removed the end of the old header (like its last
+        # import): the header is only known to be the same if every
+        # token up to the one that ends it is.
+        parser.pos = 0
+        return parser.parse_module()
+
+    classes = module.classes
+    boundary = old_tokens[prefix] if prefix < len(old_tokens) else None
+    before, restart, after = _edit_boundaries(
+        classes, tokens, prefix, suffix, boundary)
+    if restart is None:
+        restart = parser.pos
+    else:
+        cls = classes[len(before)]
+        if len(before) + 1 < len(classes):
+            close = _find_token(tokens, classes[len(before) + 1].token)
+        else:
+            close = len(tokens) - 1  # EOF
+        if close is not None and close - 1 >= suffix:
+            cls = _reparse_class_members(
+                parser, cls, old_tokens, prefix, suffix, close - 1)
+            if cls is not None:
+                return _replace(module, classes=(
+                    before + [cls] + classes[len(before) + 1:]))
+
+    parser.pos = restart
+    new_classes = []
+    while not parser.at('EOF'):
+        new_classes.append(parser.parse_class())
+        if parser.pos in after:
+            break
+    return _replace(module, classes=(
+        before + new_classes + _nodes_from(after, parser.pos)))
+
+
+def _reparse_class_members(parser, cls, old_tokens, prefix, suffix, close):
+    # The new Class for reparse, if the edit is only in the members of
+    # 'cls', whose closing brace is tokens[close]. Otherwise None.
+    tokens = parser.tokens
+    if prefix < len(old_tokens) and tokens[prefix].type != 'STRING':
+        boundary = old_tokens[prefix]
+    else:
+        # The member before the edit might take the STRING for its doc.
+        boundary = None
+    before, restart, after = _edit_boundaries(
+        cls.members + cls.methods, tokens, prefix, suffix, boundary)
+    if restart is None:
+        return None
+
+    parser.pos = restart
+    members = before
+    while not parser.at(CLOSE_CURLEY):
+        members.append(
+            parser.parse_class_member(cls.is_native, cls.is_interface))
+        if parser.pos in after:
+            members.extend(_nodes_from(after, parser.pos))
+            break
+    else:
+        if parser.pos != close:
+            return None
+    return _replace(
+        cls,
+        members=[m for m in members if isinstance(m, bbast.Member)],
+        methods=[m for m in members if not isinstance(m, bbast.Member)])
+
+
+def _edit_boundaries(nodes, tokens, prefix, suffix, boundary):
+    # Sorts out 'nodes' (the classes of a module, or the members of a
+    # class) for reparse, given that tokens[:prefix] and tokens[suffix:]
+    # are unchanged. Returns (before, restart, after): the nodes before
+    # the edit that stay as they are, in order, the index in 'tokens' to
+    # start parsing again at (None if no node starts before the edit),
+    # and the nodes after the edit by the index they start at.
+    #
+    # A node that started with 'boundary', the old token at 'prefix',
+    # started just after the node before it ended, so parsing can start
+    # again at 'prefix' rather than at the node before.
+    starts = []
+    after = dict()
+    for node in nodes:
+        index = _find_token(tokens, node.token)
+        if index is None:
+            if node.token is boundary:
+                starts.append((prefix, node))
+        elif index < prefix:
+            starts.append((index, node))
+        elif index >= suffix:
+            after[index] = node
+    if not starts:
+        return [], None, after
+    starts.sort(key=lambda pair: pair[0])
+    return [node for _, node in starts[:-1]], starts[-1][0], after
+
+
+def _nodes_from(nodes, index):
+    # Those of 'nodes' (by start index) starting at 'index' or later.
+    return [nodes[start] for start in sorted(nodes) if start >= index]
+
+
+def _unchanged_tokens(old_tokens, tokens, start, edit_end):
+    # (prefix, suffix) such that tokens[:prefix] and tokens[suffix:] are
+    # the same as the tokens at the start and end of old_tokens: the
+    # very same objects, as relex reuses tokens away from the edit, or
+    # for the token just before the edit (which relex always lexes
+    # again), one of the same type and value at the same position.
+    prefix = min(_bisect_tokens(tokens, start), len(old_tokens))
+    while prefix and tokens[prefix - 1] is not old_tokens[prefix - 1]:
+        prefix -= 1
+    if prefix < min(len(tokens), len(old_tokens)):
+        token, old_token = tokens[prefix], old_tokens[prefix]
+        if (token.type == old_token.type and
+                token.value == old_token.value and
+                token.pos == old_token.pos):
+            prefix += 1
+    shift = len(old_tokens) - len(tokens)
+    suffix = max(_bisect_tokens(tokens, edit_end), prefix)
+    while suffix < len(tokens) and not (
+            0 <= suffix + shift and
+            tokens[suffix] is old_tokens[suffix + shift]):
+        suffix += 1
+    return prefix, suffix
+
+
+def _bisect_tokens(tokens, pos):
+    # Index of the first token that starts at or after 'pos'.
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tokens[mid].pos < pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _find_token(tokens, token):
+    # Index of 'token' in 'tokens', if it's there.
+    index = _bisect_tokens(tokens, token.pos)
+    if index < len(tokens) and tokens[index] is token:
+        return index
+    return None
+
+
+def _replace(node, **values):
+    # A copy of 'node' with some of its _fields replaced.
+    return type(node)(node.token, *[
+        values[name] if name in values else getattr(node, name)
+        for name in node._fields])
+
+
+def _dumps(value, source):
+    # Pickle 'value' with references to 'source' left out: the process
+    # that loads it already has it. See parse_many, which sends errors
+    # back this way (but not trees, which pickle recurses through).
+    f = io.BytesIO()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: 0 if obj is source else None
+    pickler.dump(value)
+    return f.getvalue()
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # While lots of syntax trees are built (or loaded), the collector
+    # spends most of the time traversing the ones built before, over
+    # and over. Syntax trees don't have reference cycles anyway.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _loads(data, source):
+    unpickler = pickle.Unpickler(io.BytesIO(data))
+    unpickler.persistent_load = lambda pid: source
+    with _gc_paused():
+        return unpickler.load()
+
+
+def _parse_in_worker(source):
+    # Returns (error, module), one of them None: a pickled CompileError,
+    # or the module encoded by astcodec, exactly as ParseCache stores it.
+    try:
+        module = parse(source)
+    except CompileError as e:
+        return _dumps(e, source), None
+    return None, astcodec.dumps(module)
+
+
+def parse_many(sources, workers=None, cache=None):
+    """Parse all of 'sources' with a pool of 'workers' processes.
+
+    Returns the modules in the same order as 'sources', their tokens
+    referring to the given Source objects just like with parse. If any
+    source fails to parse, the CompileError of the first one in that
+    order is raised. 'workers' defaults to the number of CPUs; with 1,
+    everything is parsed in this process. With a ParseCache, only the
+    sources missing from it are parsed at all.
+    """
+    with _gc_paused():
+        return _parse_many(list(sources), workers, cache)
+
+
+def _parse_many(sources, workers, cache):
+    modules = [None] * len(sources)
+    if cache is not None:
+        keys = [cache.key(source) for source in sources]
+        for i, source in enumerate(sources):
+            modules[i] = cache._load(keys[i], source)
+    todo = [i for i, module in enumerate(modules) if module is None]
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(todo))
+    if workers <= 1:
+        # The cache has been looked in already.
+        for i in todo:
+            modules[i] = parse(sources[i])
+            if cache is not None:
+                cache._store(keys[i], astcodec.dumps(modules[i]))
+        return modules
+
+    # Hand out a few chunks per worker, so that one large module doesn't
+    # leave the rest of the pool idle for long.
+    chunksize = max(1, len(todo) // (workers * 4))
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.imap(
+            _parse_in_worker, [sources[i] for i in todo], chunksize)
+        for i, (error, data) in zip(todo, results):
+            if error is not None:
+                raise _loads(error, sources[i])
+            modules[i] = astcodec.loads(data, sources[i])
+            if cache is not None:
+                cache._store(keys[i], data)
+        return modules
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# Bump whenever parse may return something different for the same text,
+# e.g. when the grammar changes, so that ParseCaches don't load entries
+# written by an older parser. Changes to the layout of the node classes
+# are taken care of by cache_schema.
+PARSE_CACHE_VERSION = 2
+
+
+def cache_schema():
+    """A digest of the layout of the node classes, for ParseCache keys.
+
+    It covers the name, _fields, _annotations and __slots__ of each
+    node class of bbast (and LazyMethod), so that entries written with
+    another layout are never loaded.
+    """
+    layouts = []
+    classes = [value for value in vars(bbast).values()
+               if isinstance(value, type) and issubclass(value, bbast.Ast)]
+    for cls in sorted(classes + [LazyMethod], key=lambda cls: cls.__name__):
+        layouts.append('%s %r %r %r' % (
+            cls.__name__, cls._fields, cls._annotations,
+            vars(cls).get('__slots__')))
+    return hashlib.sha256('\n'.join(layouts).encode('utf-8')).hexdigest()
+
+
+_CACHE_SCHEMA = cache_schema()
+
+ENTRY_SUFFIX = '.ast'
+# What decoding an entry may raise, if it isn't a record astcodec can
+# decode into the node classes we have.
+_DECODE_ERRORS = (
+    ValueError, EOFError, IndexError, KeyError, TypeError, AttributeError,
+    StopIteration)
+
+
+class ParseCache(object):
+    """On-disk cache of parsed modules, keyed by a hash of their source.
+
+    Pass one to parse or parse_many to load modules from 'directory'
+    instead of parsing them again when their source hasn't changed.
+    Once the entries take up more than 'max_size' bytes, the least
+    recently used ones are removed. Entries are modules encoded by
+    astcodec, which unlike pickle handles trees of any depth, preceded
+    by a checksum of the encoding. Entries that don't match it, or that
+    can't be decoded, are ignored and removed.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None  # Total size of the entries, once known.
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, source):
+        if source.data is not None:
+            contents = source.data
+        else:
+            contents = source.text.encode('utf-8')
+        digest = hashlib.sha256(
+            ('%d %s\n' % (PARSE_CACHE_VERSION, _CACHE_SCHEMA)).encode())
+        digest.update(contents)
+        return digest.hexdigest()
+
+    def load(self, source):
+        """The cached module for 'source', or None."""
+        return self._load(self.key(source), source)
+
+    def store(self, source, module):
+        self._store(self.key(source), astcodec.dumps(module))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _load(self, key, source):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = f.read()
+        except (IOError, OSError):
+            return None
+        checksum, data = entry[:32], entry[32:]
+        if hashlib.sha256(data).digest() != checksum:
+            _remove(path)
+            return None
+        try:
+            # Entries are evicted by modification time.
+            os.utime(path, None)
+        except OSError:
+            pass
+        try:
+            with _gc_paused():
+                return astcodec.loads(data, source)
+        except _DECODE_ERRORS:
+            # The checksum matches, but the entry still can't be decoded
+            # (say it names a node class that's gone): just a miss.
+            _remove(path)
+            return None
+
+    def _store(self, key, data):
+        entry = hashlib.sha256(data).digest() + data
+
+        # Write to a temporary file first, so that nobody can ever see a
+        # partially written entry under the real name.
+        path = self._path(key)
+        fd, temporary_path = tempfile.mkstemp(
+            suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(entry)
+            try:
+                # That of an entry this one replaces, if any.
+                old_size = os.stat(path).st_size
+            except OSError:
+                old_size = 0
+            os.replace(temporary_path, path)
+        except BaseException:
+            _remove(temporary_path)
+            raise
+
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += len(entry) - old_size
+        if self._size > self.max_size:
+            self._evict()
+
+    def _entries(self):
+        # (modification time, path, size) of each entry.
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Just removed by someone else.
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        # Go well below max_size, so that this doesn't happen again on
+        # the very next store.
+        entries = sorted(self._entries())
+        size = sum(size for _, _, size in entries)
+        for _, path, entry_size in entries:
+            if size <= self.max_size * 3 // 4:
+                break
+            _remove(path)
+            size -= entry_size
+        self._size = size
 
 
-def parse(source):
-    return Parser(source).parse_module()
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,12 +1,23 @@
+import os
+import pickle
+import random
+import shutil
+import tempfile
 import unittest
+import weakref
+import astcodec
+import bbannotator
+import bblexer
 import bbparser
 import bbast
+import bbast_testutils
 
 
 class TestCase(unittest.TestCase):
     def setUp(self):
         super(TestCase, self).setUp()
         self.maxDiff = None
+        bbast_testutils.add_ast_equality_funcs(self)
 
 
 class EmptyTestCase(TestCase):
@@ -302,6 +313,87 @@ class ExpressionTestCase(TestCase):
         self.assertEqual(type(ast.expr), bbast.Int)
         self.assertEqual(ast.expr.value, '2')
 
+    def test_parenthesized(self):
+        parser = bbparser.Parser(bbparser.Source('<test>', '(x).y'))
+        ast = parser.parse_expression()
+        self.assertEqual(type(ast), bbast.GetAttribute)
+        self.assertEqual(type(ast.owner), bbast.Name)
+
+    def test_not_an_expression(self):
+        parser = bbparser.Parser(bbparser.Source('<test>', 'class'))
+        with self.assertRaises(bbparser.CompileError) as context:
+            parser.parse_expression()
+        self.assertEqual(
+            context.exception.message,
+            "Expected expression but got Token(type_='class', value=None)")
+
+
+class StacklessTestCase(TestCase):
+    # Deeper than the default recursion limit allows Parser to go.
+    DEPTH = 10000
+
+    def parse_statement(self, text):
+        parser = bbparser.StacklessParser(bbparser.Source('<test>', text))
+        ast = parser.parse_statement()
+        self.assertEqual(parser.peek().type, 'EOF')
+        return ast
+
+    def test_parentheses(self):
+        ast = self.parse_statement(
+            '(' * self.DEPTH + 'x' + ').y' * self.DEPTH + ';')
+        ast = ast.expr
+        for _ in range(self.DEPTH):
+            self.assertEqual(type(ast), bbast.GetAttribute)
+            ast = ast.owner
+        self.assertEqual(type(ast), bbast.Name)
+
+    def test_nested_calls_and_assignments(self):
+        ast = self.parse_statement(
+            'x.f(a = Foo.g(' * self.DEPTH + 'y' + '))' * self.DEPTH + ';')
+        ast = ast.expr
+        for _ in range(self.DEPTH):
+            self.assertEqual(type(ast), bbast.MethodCall)
+            self.assertEqual(type(ast.args[0]), bbast.Assign)
+            self.assertEqual(type(ast.args[0].expr), bbast.StaticMethodCall)
+            ast = ast.args[0].expr.args[0]
+        self.assertEqual(type(ast), bbast.Name)
+
+    def test_blocks(self):
+        ast = self.parse_statement(
+            '{' * self.DEPTH + 'x;' + '}' * self.DEPTH)
+        for _ in range(self.DEPTH):
+            self.assertEqual(type(ast), bbast.Block)
+            ast, = ast.statements
+        self.assertEqual(type(ast), bbast.ExpressionStatement)
+
+    def test_same_module_as_parser(self):
+        text = r"""
+        package local;
+        class Klass {
+            void f(int a) {
+                "Docs.";
+                {
+                    Klass.x = (a = this.g(1, "s")).h;
+                }
+                (Klass(2.5, null)).k();
+            }
+        }
+        """
+        expected = bbparser.parse(bbparser.Source('<test>', text))
+        ast = bbparser.parse(bbparser.Source('<test>', text), stackless=True)
+        bbast_testutils.assert_same_trees(self, ast, expected)
+
+    def test_same_error_as_parser(self):
+        text = '{ (a.f(b, Foo.x = ]' + ')' * self.DEPTH + '; }'
+        with self.assertRaises(bbparser.CompileError) as context:
+            self.parse_statement(text)
+        with self.assertRaises(bbparser.CompileError) as expected:
+            bbparser.Parser(bbparser.Source('<test>', text)).parse_statement()
+        self.assertEqual(
+            context.exception.message, expected.exception.message)
+        self.assertEqual(
+            context.exception.token.pos, expected.exception.token.pos)
+
 
 class ClassWithOneMethodTestCase(TestCase):
     def test(self):
@@ -453,5 +545,578 @@ class EmptyDocInMethodTestCase(TestCase):
         self.assertEqual(cls.methods[0].doc, None)
 
 
+TOKEN_SEQUENCE_EXAMPLE = r"""
+        package local;
+
+        class Klass {
+            "Klass docs"
+            int count;
+            String f(int x) {
+                "f docs";
+                this.count = x;
+                System.out.println('hi');
+            }
+        }
+
+        """
+
+
+class TokenSequenceTestCase(TestCase):
+    def check_module(self, ast):
+        cls = ast.classes[0]
+        self.assertEqual(cls.doc, 'Klass docs')
+        self.assertEqual(cls.members[0].name, 'count')
+        method = cls.methods[0]
+        self.assertEqual(method.doc, 'f docs')
+        self.assertEqual(method.args, [('int', 'x')])
+        statements = method.body.statements
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(type(statements[0].expr), bbast.SetAttribute)
+        self.assertEqual(type(statements[1].expr), bbast.MethodCall)
+        self.assertEqual(statements[1].expr.args[0].value, 'hi')
+
+    def test_token_buffer(self):
+        source = bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE)
+        self.check_module(
+            bbparser.parse(source, bblexer.lex_compact(source)))
+
+    def test_token_stream(self):
+        source = bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE)
+        tokens = bblexer.stream(source)
+        self.check_module(bbparser.parse(source, tokens))
+        self.assertEqual(len(tokens.tokens), 3)
+        with self.assertRaises(IndexError):
+            tokens[0]
+
+
+
+LAZY_EXAMPLE = bbparser.Source('<test>', r"""
+        package local;
+
+        import bb.lang.Map as Table;
+
+        class Klass {
+            int count;
+            Table f(int x) {
+                "f docs";
+                { this.count = x; }
+                Table();
+            }
+            void g() {}
+        }
+        """)
+
+
+class LazyTestCase(TestCase):
+    def test_bodies_are_parsed_on_use(self):
+        module = bbparser.parse(LAZY_EXAMPLE, lazy=True)
+        expected = bbparser.parse(LAZY_EXAMPLE)
+        methods = module.classes[0].methods
+        self.assertEqual(type(methods[0]), bbparser.LazyMethod)
+        self.assertNotIn('body', vars(methods[0]))
+        self.assertEqual(methods[0].doc, 'f docs')
+
+        expected_methods = expected.classes[0].methods
+        for method, expected_method in zip(methods, expected_methods):
+            bbast_testutils.assert_same_trees(
+                self, method.body, expected_method.body)
+            self.assertEqual(vars(method), {'body': method.body})
+        self.assertEqual(
+            methods[0].body.statements[1].expr.type, 'bb.lang.Map')
+
+    def test_declarations(self):
+        module = bbparser.parse(LAZY_EXAMPLE, lazy=True)
+        self.assertEqual(
+            bbannotator.extract_type_data(module.classes),
+            bbannotator.extract_type_data(
+                bbparser.parse(LAZY_EXAMPLE).classes))
+        for method in module.classes[0].methods:
+            self.assertNotIn('body', vars(method))
+
+    def test_pickle(self):
+        module = bbparser.parse(LAZY_EXAMPLE, lazy=True)
+        module = pickle.loads(pickle.dumps(module))
+        self.assertEqual(type(module.classes[0].methods[0]), bbast.Method)
+        bbast_testutils.assert_same_trees(
+            self, module, bbparser.parse(LAZY_EXAMPLE))
+
+    def test_errors(self):
+        source = bbparser.Source('<test>', r"""
+        package local;
+        class Klass { void f() { x = ; } void g() {} }
+        """)
+        module = bbparser.parse(source, lazy=True)
+        self.assertEqual(module.classes[0].methods[1].body.statements, [])
+        with self.assertRaises(bbparser.CompileError) as context:
+            module.classes[0].methods[0].body
+        self.assertEqual(context.exception.token.type, ';')
+
+        source = bbparser.Source(
+            '<test>', 'package local; class Klass { void f() { { }')
+        with self.assertRaises(bbparser.CompileError) as context:
+            bbparser.parse(source, lazy=True)
+        self.assertEqual(context.exception.token.type, 'EOF')
+
+
+class LeanTestCase(TestCase):
+    def nodes(self, module):
+        # Every node in 'module', in a deterministic order.
+        nodes = []
+        stack = [module]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, bbast.Ast):
+                nodes.append(value)
+                stack.extend(
+                    getattr(value, name) for name in sorted(value._fields))
+            elif isinstance(value, (list, tuple)):
+                stack.extend(value)
+        return nodes
+
+    def test_positions(self):
+        module = bbparser.parse(
+            bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE), lean=True)
+        expected = bbparser.parse(
+            bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE))
+        nodes = self.nodes(module)
+        self.assertEqual(
+            [(type(node), node.token) for node in nodes],
+            [(type(node), node.token.pos)
+             for node in self.nodes(expected)])
+        self.assertEqual(module.classes[0].doc, 'Klass docs')
+
+        method = module.classes[0].methods[0]
+        self.assertEqual(
+            module.line_index.line_and_column(method.token), (7, 13))
+        self.assertEqual(module.line_index.uri, '<test>')
+
+    def test_source_is_released(self):
+        source = bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE)
+        module = bbparser.parse(source, lean=True)
+        source = weakref.ref(source)
+        self.assertIsNone(source())
+        self.assertEqual(module.classes[0].name, 'Klass')
+
+    def test_no_docs(self):
+        module = bbparser.parse(
+            bbparser.Source('<test>', TOKEN_SEQUENCE_EXAMPLE), docs=False)
+        cls = module.classes[0]
+        self.assertEqual(
+            [cls.doc, cls.members[0].doc, cls.methods[0].doc],
+            [None, None, None])
+        self.assertEqual(cls.token.type, 'class')
+
+        module = bbparser.parse(LAZY_EXAMPLE, lazy=True, docs=False)
+        method = module.classes[0].methods[0]
+        self.assertIsNone(method.doc)
+        self.assertNotIn('body', vars(method))
+
+        with self.assertRaises(ValueError):
+            bbparser.parse(LAZY_EXAMPLE, lazy=True, lean=True)
+
+
+REPARSE_EXAMPLE = r"""
+        package local;
+
+        import bb.lang.Map as Table;
+
+        class A {
+            "A docs"
+            int count;
+            void f(int x) {
+                "f docs";
+                this.count = x;
+            }
+            Table g() { Table(); }
+            String name;
+                "name docs"
+        }
+
+        class B extends A {
+            void h() { this.f(1); { this.g(); } }
+        }
+
+        interface C {
+            int i();
+        }
+        """
+
+
+class ReparseTestCase(TestCase):
+    def reparse(self, text, start, end, replacement):
+        source = bbparser.Source('<test>', text)
+        old_tokens = bblexer.lex(source)
+        module = bbparser.parse(source, list(old_tokens))
+        tokens = bblexer.relex(list(old_tokens), start, end, replacement)
+        new_module = bbparser.reparse(
+            module, old_tokens, tokens, start, end, replacement)
+        bbast_testutils.assert_same_trees(
+            self, new_module,
+            bbparser.parse(bbparser.Source('<test>', source.text)))
+        return module, new_module
+
+    def edit(self, old, new, after=''):
+        start = REPARSE_EXAMPLE.index(old, REPARSE_EXAMPLE.index(after))
+        return self.reparse(
+            REPARSE_EXAMPLE, start, start + len(old), new)
+
+    def test_edit_in_method(self):
+        module, new_module = self.edit('x;', 'x.plus(1);')
+        a, new_a = module.classes[0], new_module.classes[0]
+        self.assertIsNot(new_a, a)
+        self.assertIs(new_a.members[0], a.members[0])
+        self.assertIs(new_a.members[1], a.members[1])
+        self.assertIsNot(new_a.methods[0], a.methods[0])
+        self.assertIs(new_a.methods[1], a.methods[1])
+        self.assertIs(new_module.classes[1], module.classes[1])
+        self.assertIs(new_module.classes[2], module.classes[2])
+
+    def test_edit_adds_and_removes_members(self):
+        module, new_module = self.edit('}', '} int more; void h() {}')
+        self.assertEqual(
+            [m.name for m in new_module.classes[0].methods],
+            ['f', 'h', 'g'])
+        self.assertIs(
+            new_module.classes[0].methods[2], module.classes[0].methods[1])
+
+        module, new_module = self.edit('String name;', 'int other;')
+        a, new_a = module.classes[0], new_module.classes[0]
+        self.assertEqual(new_a.members[1].name, 'other')
+        self.assertIs(new_a.members[0], a.members[0])
+        self.assertEqual(new_a.methods, a.methods)
+
+        # Without a member before the edit, the whole class is reparsed.
+        module, new_module = self.edit('int count;', '')
+        self.assertIsNot(
+            new_module.classes[0].methods[0], module.classes[0].methods[0])
+        self.assertIs(new_module.classes[1], module.classes[1])
+
+    def test_edit_in_class_header(self):
+        module, new_module = self.edit('A {', 'D {')
+        self.assertEqual(new_module.classes[0].name, 'D')
+        self.assertIsNot(
+            new_module.classes[0].methods[0], module.classes[0].methods[0])
+        self.assertIs(new_module.classes[1], module.classes[1])
+
+    def test_edit_splits_and_merges_classes(self):
+        module, new_module = self.edit('}', '} } class E {', 'Table g')
+        self.assertEqual(
+            [cls.name for cls in new_module.classes], ['A', 'E', 'B', 'C'])
+        self.assertIs(new_module.classes[2], module.classes[1])
+
+        module, new_module = self.edit(
+            '}\n\n        class B extends A {', '', 'name')
+        self.assertEqual(
+            [cls.name for cls in new_module.classes], ['A', 'C'])
+        self.assertIs(new_module.classes[1], module.classes[2])
+
+    def test_edit_in_module_header(self):
+        module, new_module = self.edit('Table;', 'Tab;')
+        self.assertEqual(new_module.imports, ['bb.lang.Map'])
+
+        text = (
+            'package a.b;\nimport x.y.Z;\nimport q.R as S;\n'
+            'class Cls extends S { }\n')
+        start = text.index('import q')
+        module, new_module = self.reparse(
+            text, start, text.index('class'), '')
+        self.assertEqual(new_module.imports, ['x.y.Z'])
+        self.assertEqual(new_module.classes[0].base, 'a.b.S')
+
+    def test_errors(self):
+        for old, new in (('x;', 'x'), ('A {', 'A')):
+            with self.assertRaises(bbparser.CompileError) as context:
+                self.edit(old, new)
+            with self.assertRaises(bbparser.CompileError) as expected:
+                start = REPARSE_EXAMPLE.index(old)
+                bbparser.parse(bbparser.Source('<test>', (
+                    REPARSE_EXAMPLE[:start] + new +
+                    REPARSE_EXAMPLE[start + len(old):])))
+            self.assertEqual(
+                context.exception.message, expected.exception.message)
+
+    def test_interned_names(self):
+        names = bbparser.InternTable()
+        source = bbparser.Source('<test>', REPARSE_EXAMPLE)
+        old_tokens = bblexer.lex(source, names=names)
+        module = bbparser.parse(source, list(old_tokens), names=names)
+        start = REPARSE_EXAMPLE.index('x;')
+        replacement = 'Table(count.plus(x))'
+        tokens = bblexer.relex(
+            list(old_tokens), start, start + 1, replacement, names=names)
+        new_module = bbparser.reparse(
+            module, old_tokens, tokens, start, start + 1, replacement,
+            names=names)
+        new = new_module.classes[0].methods[0].body.statements[0].expr.expr
+        self.assertIs(new.type, names.intern('bb.lang.Map'))
+        self.assertIs(new.args[0].method_name, names.intern('plus'))
+        self.assertIs(new.args[0].owner.name, names.intern('count'))
+
+    def test_lean(self):
+        source = bbparser.Source('<test>', REPARSE_EXAMPLE)
+        old_tokens = bblexer.lex(source)
+        module = bbparser.parse(source, list(old_tokens), lean=True)
+        start = REPARSE_EXAMPLE.index('x;')
+        tokens = bblexer.relex(list(old_tokens), start, start + 1, 'y')
+        with self.assertRaises(ValueError):
+            bbparser.reparse(module, old_tokens, tokens, start, start + 1, 'y')
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        snippets = ['', '{', '}', ';', 'x', 'int y;', 'void k() {}',
+                    '} class Z {', '(', ')', '.f()', '"s"', 'int', '\n']
+        for _ in range(300):
+            start = rng.randrange(len(REPARSE_EXAMPLE))
+            end = min(start + rng.choice([0, 0, 1, 3, 10]),
+                      len(REPARSE_EXAMPLE))
+            replacement = rng.choice(snippets)
+            try:
+                self.reparse(REPARSE_EXAMPLE, start, end, replacement)
+            except bbparser.CompileError as e:
+                with self.assertRaises(bbparser.CompileError) as expected:
+                    bbparser.parse(bbparser.Source('<test>', (
+                        REPARSE_EXAMPLE[:start] + replacement +
+                        REPARSE_EXAMPLE[end:])))
+                self.assertEqual(e.message, expected.exception.message)
+
+
+class IterParseTestCase(TestCase):
+    def test_header_then_classes(self):
+        source = bbparser.Source('<test>', REPARSE_EXAMPLE)
+        items = list(bbparser.iter_parse(source))
+        module = bbparser.parse(source)
+        self.assertEqual(type(items[0]), bbast.Module)
+        self.assertEqual(items[0].classes, [])
+        self.assertEqual(items[0].imports, ['bb.lang.Map'])
+        module.classes, classes = [], module.classes
+        bbast_testutils.assert_same_trees(self, items[0], module)
+        bbast_testutils.assert_same_trees(self, items[1:], classes)
+
+    def test_classes_come_as_parsed(self):
+        source = bbparser.Source('<test>', r"""
+        package local;
+        class A { void f() {} }
+        class B { void g() { ) } }
+        """)
+        items = bbparser.iter_parse(source, bblexer.stream(source))
+        self.assertEqual(next(items).package, 'local')
+        self.assertEqual(next(items).name, 'A')
+        with self.assertRaises(bbparser.CompileError):
+            next(items)
+
+    def test_stream(self):
+        source = bbparser.Source('<test>', REPARSE_EXAMPLE)
+        bbast_testutils.assert_same_trees(
+            self,
+            list(bbparser.iter_parse(source, bblexer.stream(source))),
+            list(bbparser.iter_parse(source)))
+
+    def test_lazy_stream(self):
+        source = bbparser.Source('<test>', REPARSE_EXAMPLE)
+        with self.assertRaises(ValueError):
+            bbparser.iter_parse(source, bblexer.stream(source), lazy=True)
+        with self.assertRaises(ValueError):
+            bbparser.parse(source, bblexer.stream(source), lazy=True)
+
+
+class ParseManyTestCase(TestCase):
+    def sources(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sources = []
+        for i in range(6):
+            text = 'package p%d; class Klass%d { void f() { x.y(%d); } }' % (
+                i, i, i)
+            if i % 2:
+                sources.append(bbparser.Source('<test%d>' % i, text))
+            else:
+                path = os.path.join(directory, 'Klass%d.bb' % i)
+                with open(path, 'w') as f:
+                    f.write(text)
+                sources.append(bbparser.Source.from_path(path))
+        return sources
+
+    def test_in_order(self):
+        sources = self.sources()
+        modules = bbparser.parse_many(sources, workers=3)
+        self.assertEqual(
+            [module.package for module in modules],
+            ['p0', 'p1', 'p2', 'p3', 'p4', 'p5'])
+        bbast_testutils.assert_same_trees(
+            self, modules, [bbparser.parse(source) for source in sources])
+        for source, module in zip(sources, modules):
+            self.assertIs(module.token.source, source)
+            method = module.classes[0].methods[0]
+            self.assertIs(method.body.token.source, source)
+
+    def test_first_error_wins(self):
+        sources = self.sources()
+        sources[4] = bbparser.Source('<bad4>', 'package p; class {}')
+        sources[2] = bbparser.Source('<bad2>', 'package p; $')
+        with self.assertRaises(bbparser.CompileError) as context:
+            bbparser.parse_many(sources, workers=3)
+        self.assertEqual(context.exception.message, 'Invalid token: $')
+        self.assertIs(context.exception.token.source, sources[2])
+        self.assertEqual(context.exception.token.pos, 11)
+
+    def test_deep_tree(self):
+        # Deeper than pickle could send back from the workers.
+        depth = 300
+        sources = [bbparser.Source('<test%d>' % i, (
+            'package p; class K { void f() { %s; } }' %
+            ('x.g(' * depth + 'x' + ')' * depth))) for i in range(2)]
+        modules = bbparser.parse_many(sources, workers=2)
+        expected = bbparser.parse(sources[0])
+        self.assertEqual(modules, [expected, expected])
+        self.assertIs(modules[1].token.source, sources[1])
+
+    def test_one_worker(self):
+        sources = self.sources()
+        bbast_testutils.assert_same_trees(
+            self, bbparser.parse_many(sources, 1),
+            [bbparser.parse(source) for source in sources])
+
+
+class ParseCacheTestCase(TestCase):
+    def setUp(self):
+        super(ParseCacheTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def source(self, i=0):
+        return bbparser.Source(
+            '<test>', 'package p; class Klass%d { void f() { x.y(); } }' % i)
+
+    def entries(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_hit(self):
+        cache = bbparser.ParseCache(self.directory)
+        self.assertIsNone(cache.load(self.source()))
+        expected = bbparser.parse(self.source(), cache=cache)
+        self.assertEqual(
+            self.entries(), [cache.key(self.source()) + '.ast'])
+
+        source = self.source()
+        module = cache.load(source)
+        bbast_testutils.assert_same_trees(self, module, expected)
+        self.assertIs(module.classes[0].token.source, source)
+        self.assertIsNone(cache.load(self.source(1)))
+
+    def test_version_is_part_of_key(self):
+        cache = bbparser.ParseCache(self.directory)
+        key = cache.key(self.source())
+        bbparser.PARSE_CACHE_VERSION += 1
+        try:
+            self.assertNotEqual(cache.key(self.source()), key)
+        finally:
+            bbparser.PARSE_CACHE_VERSION -= 1
+
+    def test_schema_is_part_of_key(self):
+        schema = bbparser.cache_schema()
+        self.assertEqual(schema, bbparser._CACHE_SCHEMA)
+        slots = bbast.Member.__slots__
+        bbast.Member.__slots__ = slots + ('extra',)
+        try:
+            self.assertNotEqual(bbparser.cache_schema(), schema)
+        finally:
+            bbast.Member.__slots__ = slots
+        self.assertEqual(bbparser.cache_schema(), schema)
+
+    def test_corrupted_entry(self):
+        cache = bbparser.ParseCache(self.directory)
+        bbparser.parse(self.source(), cache=cache)
+        path = os.path.join(self.directory, self.entries()[0])
+        with open(path, 'rb') as f:
+            entry = bytearray(f.read())
+        entry[-5] ^= 1
+        with open(path, 'wb') as f:
+            f.write(entry)
+
+        self.assertIsNone(cache.load(self.source()))
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(
+            bbparser.parse(self.source(), cache=cache).classes[0].name,
+            'Klass0')
+
+    def test_undecodable_entry(self):
+        cache = bbparser.ParseCache(self.directory)
+        source = self.source()
+        data = astcodec.dumps(bbparser.parse(source))
+        for payload in (
+                b'garbage', b'', data[:-3],
+                data.replace(b'bbast.Method', b'bbast.Missing'),
+                data.replace(b'bbast.Method', b'nomodule.Method'),
+                pickle.dumps(bbparser.parse(source))):
+            # Entries with valid checksums, but not of a module.
+            cache._store(cache.key(source), payload)
+            self.assertEqual(len(self.entries()), 1)
+            self.assertIsNone(cache.load(source))
+            self.assertEqual(self.entries(), [])
+        self.assertEqual(
+            bbparser.parse(source, cache=cache).classes[0].name, 'Klass0')
+        self.assertEqual(cache.load(source).classes[0].name, 'Klass0')
+
+    def test_deep_tree(self):
+        depth = 1000
+        source = bbparser.Source('<test>', (
+            'package p; class K { void f() { %s; } }' %
+            ('x.g(' * depth + 'x' + ')' * depth)))
+        cache = bbparser.ParseCache(self.directory)
+        expected = bbparser.parse(source, stackless=True, cache=cache)
+        module = cache.load(source)
+        self.assertIsNot(module, expected)
+        self.assertEqual(module, expected)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = bbparser.ParseCache(self.directory)
+        for i in range(3):
+            cache.store(self.source(i), bbparser.parse(self.source(i)))
+        paths = [cache._path(cache.key(self.source(i))) for i in range(3)]
+        entry_size = max(os.path.getsize(path) for path in paths)
+        for i, path in enumerate(paths):
+            os.utime(path, (1000 + i, 1000 + i))
+        self.assertIsNotNone(cache.load(self.source(0)))
+
+        # Adding one more entry makes the oldest two go.
+        cache = bbparser.ParseCache(self.directory, entry_size * 3)
+        cache.store(self.source(3), bbparser.parse(self.source(3)))
+        self.assertIsNotNone(cache.load(self.source(0)))
+        self.assertIsNone(cache.load(self.source(1)))
+        self.assertIsNone(cache.load(self.source(2)))
+        self.assertIsNotNone(cache.load(self.source(3)))
+
+    def test_replaced_entries(self):
+        cache = bbparser.ParseCache(self.directory)
+        module = bbparser.parse(self.source())
+        for _ in range(5):
+            cache.store(self.source(), module)
+        path = cache._path(cache.key(self.source()))
+        self.assertEqual(cache._size, os.path.getsize(path))
+
+    def test_parse_many_serially(self):
+        cache = bbparser.ParseCache(self.directory)
+        sources = [self.source(i) for i in range(3)]
+        cache.store(sources[1], bbparser.parse(sources[1]))
+        keys = []
+        load = cache._load
+        cache._load = lambda key, source: keys.append(key) or load(
+            key, source)
+        bbparser.parse_many(sources, workers=1, cache=cache)
+        self.assertEqual(keys, [cache.key(source) for source in sources])
+        self.assertEqual(len(self.entries()), 3)
+
+    def test_parse_many(self):
+        cache = bbparser.ParseCache(self.directory)
+        sources = [self.source(i) for i in range(4)]
+        cache.store(sources[1], bbparser.parse(sources[1]))
+        modules = bbparser.parse_many(sources, workers=2, cache=cache)
+        self.assertEqual(len(self.entries()), 4)
+        bbast_testutils.assert_same_trees(
+            self, modules, [cache.load(source) for source in sources])
+        bbast_testutils.assert_same_trees(
+            self, modules, [bbparser.parse(source) for source in sources])
+
+
 if __name__ == '__main__':
     unittest.main()
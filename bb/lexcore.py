@@ -0,0 +1,729 @@
+"""lexcore.py
+
+The lexer shared by the bb (bblexer) and sleep (sleeplexer) front ends.
+
+Everything the two languages disagree on (keywords, primitive types,
+symbols, which names count as type names and which exception to raise)
+lives in a Language. Each lexing engine here reads those from its
+'language' class attribute, so a front end configures the engines by
+subclassing them:
+
+    class Lexer(lexcore.Lexer):
+        language = LANGUAGE
+"""
+import array
+import bisect
+import mmap
+import re
+import sys
+
+ESCAPE_TABLE = {
+    'n': '\n',
+    't': '\t',
+    '\\': '\\',
+    '"': '"',
+    "'": "'",
+}
+
+
+class LineIndex(object):
+    """Resolves character offsets in a source to lines and columns.
+
+    Holds on to nothing but the uri and where lines start, so positions
+    can be reported long after the text itself is gone. See
+    Source.line_index.
+    """
+
+    def __init__(self, uri, line_starts):
+        self.uri = uri
+        self.line_starts = line_starts
+
+    def line_and_column(self, pos):
+        """1-based (line, column) of the character at offset 'pos'."""
+        line_starts = self.line_starts
+        line = bisect.bisect_right(line_starts, pos)
+        return line, pos - line_starts[line - 1] + 1
+
+    def lines_and_columns(self, positions):
+        """line_and_column for many positions at once."""
+        line_starts = self.line_starts
+        bisect_right = bisect.bisect_right
+        result = []
+        for pos in positions:
+            line = bisect_right(line_starts, pos)
+            result.append((line, pos - line_starts[line - 1] + 1))
+        return result
+
+
+class Source(LineIndex):
+    def __init__(self, uri, text):
+        self.uri = uri
+        self._text = text
+
+        # The raw UTF-8 contents, for sources loaded with from_path.
+        # When set, 'text' is only decoded if someone asks for it.
+        self.data = None
+        self.path = None
+
+        self._line_starts = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.data[:].decode('utf-8')
+        return self._text
+
+    @property
+    def line_starts(self):
+        """Offsets at which each line starts, computed on first use."""
+        if self._line_starts is None:
+            if (self._text is None and
+                    _NON_ASCII_BYTE_RE.search(self.data) is None):
+                # Byte offsets are character offsets, no need to decode.
+                content, newline = self.data, b'\n'
+            else:
+                content, newline = self.text, '\n'
+            line_starts = array.array('I', [0])
+            pos = content.find(newline)
+            while pos != -1:
+                line_starts.append(pos + 1)
+                pos = content.find(newline, pos + 1)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def line_index(self):
+        """A LineIndex for this source, which doesn't keep it alive."""
+        return LineIndex(self.uri, self.line_starts)
+
+    def __reduce__(self):
+        # Sources are pickled to hand them to other processes (see
+        # bbparser.parse_many): a mapped file is simply mapped again
+        # there, and the caches are rebuilt when needed.
+        if self.data is not None and self.path is not None:
+            return type(self).from_path, (self.path, self.uri)
+        return type(self), (self.uri, self.text)
+
+    def _edit(self, start, end, replacement):
+        # Replace text[start:end], dropping anything derived from the old
+        # contents. See bblexer.relex.
+        text = self.text
+        self._text = text[:start] + replacement + text[end:]
+        self.data = None
+        self._line_starts = None
+
+    @classmethod
+    def from_path(cls, path, uri=None):
+        """Load a source by memory-mapping the file at 'path'.
+
+        Lexing such a source works directly on the mapped bytes (see
+        BytesLexer), so large files never get read and decoded as a
+        whole. Token positions are still character offsets.
+        """
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped.
+                data = b''
+        source = cls(path if uri is None else uri, None)
+        source.data = data
+        source.path = path
+        return source
+
+
+class InternTable(object):
+    """The strings of one compilation, so that equal ones are one object.
+
+    Lexers given one intern the values of NAME and TYPENAME tokens, and
+    bbparser the names it makes (like qualified typenames), so each is
+    only kept once, and the dicts keyed by them (like bbannotator's type
+    data) find them by identity rather than comparing characters.
+    """
+
+    def __init__(self):
+        self.strings = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        return self.strings.setdefault(string, string)
+
+
+class Token(object):
+    def __init__(self, source, pos, type_, value=None):
+        self.source = source
+        self.pos = pos
+        self.type = type_
+        self.value = value
+
+    def __repr__(self):
+        return 'Token(type_=%r, value=%r)' % (self.type, self.value)
+
+
+def _group_symbols_by_first_character(symbols):
+    table = dict()
+    for symbol in sorted(symbols, key=len, reverse=True):
+        table.setdefault(symbol[0], []).append(symbol)
+    return {first: tuple(group) for first, group in table.items()}
+
+
+class Language(object):
+    """The lexical rules of one front end.
+
+    'is_typename' decides whether a name that isn't a keyword or a
+    primitive type is a TYPENAME (otherwise it's a NAME), and 'error' is
+    the exception class raised as error(token, message).
+    """
+
+    def __init__(self, keywords, primitive_types, symbols, is_typename,
+                 error, escape_table=ESCAPE_TABLE):
+        self.keywords = keywords
+        self.primitive_types = primitive_types
+        self.symbols = symbols
+        self.is_typename = is_typename
+        self.error = error
+        self.escape_table = escape_table
+
+        # Symbols grouped by their first character, longest first, so
+        # that the loop lexers only have to try the handful of symbols
+        # that could possibly match.
+        self.symbols_by_first_character = (
+            _group_symbols_by_first_character(symbols))
+
+        # Exact for ASCII text. For everything else see unicode_token_re.
+        self.token_re = _compile_token_re(symbols)
+        self._unicode_token_re = None
+
+        self.bytes_token_re = _compile_bytes_token_re(symbols)
+        self.bytes_symbols = {
+            symbol.encode('ascii'): symbol for symbol in symbols}
+
+    def unicode_token_re(self):
+        """The master pattern for text that isn't pure ASCII.
+
+        Lexer uses str.isdigit and str.isalpha, which disagree with '\\d'
+        and '\\w' on a few hundred characters (e.g. superscripts and
+        vulgar fractions). Finding them means scanning all of Unicode, so
+        we only do it the first time we see a non-ASCII source.
+        """
+        if self._unicode_token_re is None:
+            self._unicode_token_re = _compile_token_re(
+                self.symbols, *_unicode_classes())
+        return self._unicode_token_re
+
+    def name_token(self, source, pos, value, names=None):
+        # 'names' is the lexer's InternTable, if any.
+        if value in self.keywords:
+            return Token(source, pos, value)
+        if names is not None:
+            value = names.intern(value)
+        if value in self.primitive_types or self.is_typename(value):
+            return Token(source, pos, 'TYPENAME', value)
+        else:
+            return Token(source, pos, 'NAME', value)
+
+    def unescape(self, source, body, offset):
+        """Process the escapes in the body of a non-raw string literal.
+
+        'offset' is the position of 'body' in the source text, so that an
+        invalid escape is reported at the same position Lexer reports it.
+        """
+        if '\\' not in body:
+            return body
+        for match in _ESCAPE_RE.finditer(body):
+            if match.group(1) not in self.escape_table:
+                raise self.error(
+                    Token(source, offset + match.start(1), 'ERROR'),
+                    'Invalid escape: ' + match.group(1))
+        return _ESCAPE_RE.sub(
+            lambda match: self.escape_table[match.group(1)], body)
+
+    def string_literal_value(self, source, start, literal):
+        """The value of the (terminated) string literal at 'start'."""
+        raw = literal[0] == 'r'
+        if literal.startswith(('"""', "'''"), raw):
+            quote_length = 3
+        else:
+            quote_length = 1
+        body = literal[raw + quote_length:-quote_length]
+        if raw:
+            return body
+        return self.unescape(source, body, start + quote_length)
+
+
+class Lexer(object):
+    language = None
+
+    def __init__(self, source, pos=0, names=None):
+        self.source = source
+        self.text = source.text
+        self.pos = pos
+        self.names = names
+        self.peek = self._extract_token()
+        self.peek_end = self.pos
+        self.done = False
+
+    def next(self):
+        token = self.peek
+        self.peek = self._extract_token()
+        self.peek_end = self.pos
+        self.done = token.type == 'EOF'
+        return token
+
+    def _skip_whitespace_and_comments(self):
+        while (self.pos < len(self.text) and
+               (self.text[self.pos] == '#' or
+                self.text[self.pos].isspace())):
+            if self.text[self.pos] == '#':
+                while (self.pos < len(self.text) and
+                       self.text[self.pos] != '\n'):
+                    self.pos += 1
+            else:
+                self.pos += 1
+
+    def _extract_string(self, start):
+        escape_table = self.language.escape_table
+
+        if self.text[self.pos] == 'r':
+            raw = True
+            self.pos += 1
+        else:
+            raw = False
+
+        if self.text.startswith(('"""', "'''"), self.pos):
+            quote = self.text[self.pos:self.pos+3]
+            self.pos += 3
+        else:
+            quote = self.text[self.pos]
+            self.pos += 1
+
+        chars = []
+
+        while not self.text.startswith(quote, self.pos):
+            if self.pos >= len(self.text):
+                raise self.language.error(
+                    Token(self.source, start, 'ERROR'),
+                    'Unterminated string literal')
+
+            if (not raw and self.text[self.pos] == '\\' and
+                    self.pos + 1 < len(self.text)):
+                self.pos += 1
+                ch = self.text[self.pos]
+                if ch not in escape_table:
+                    raise self.language.error(
+                        Token(self.source, self.pos, 'ERROR'),
+                        'Invalid escape: ' + ch)
+                chars.append(escape_table[ch])
+                self.pos += 1
+            else:
+                chars.append(self.text[self.pos])
+                self.pos += 1
+
+        self.pos += len(quote)
+        value = ''.join(chars)
+        return Token(self.source, start, 'STRING', value)
+
+    def _extract_token(self):
+        self._skip_whitespace_and_comments()
+        if self.pos >= len(self.text):
+            return Token(self.source, self.pos, 'EOF')
+
+        start = self.pos
+
+        # INT or FLOAT
+        if self.text[self.pos].isdigit():
+            while (self.pos < len(self.text) and
+                   self.text[self.pos].isdigit()):
+                self.pos += 1
+            if self.pos < len(self.text) and self.text[self.pos] == '.':
+                self.pos += 1
+                while (self.pos < len(self.text) and
+                       self.text[self.pos].isdigit()):
+                    self.pos += 1
+                value = self.text[start:self.pos]
+                return Token(self.source, start, 'FLOAT', value)
+            else:
+                value = self.text[start:self.pos]
+                return Token(self.source, start, 'INT', value)
+
+        # STRING
+        if self.text.startswith(('r"', "r'", '"', "'"), self.pos):
+            return self._extract_string(start)
+
+        # TYPENAME or NAME or KEYWORD
+        if self.text[self.pos].isalpha() or self.text[self.pos] == '_':
+            while (self.pos < len(self.text) and
+                   (self.text[self.pos].isalnum() or
+                    self.text[self.pos] == '_')):
+                self.pos += 1
+            value = self.text[start:self.pos]
+            return self.language.name_token(
+                self.source, start, value, self.names)
+
+        # SYMBOL
+        symbols = self.language.symbols_by_first_character.get(
+            self.text[self.pos], ())
+        for symbol in symbols:
+            if self.text.startswith(symbol, self.pos):
+                self.pos += len(symbol)
+                return Token(self.source, start, symbol)
+
+        # ERROR
+        while (self.pos < len(self.text) and
+               not self.text[self.pos].isspace()):
+            self.pos += 1
+        raise self.language.error(Token(self.source, start, 'ERROR'),
+            'Invalid token: ' + self.text[start:self.pos])
+
+
+class FindLexer(Lexer):
+    """Lexer that scans strings, comments and whitespace in runs.
+
+    Instead of stepping through them one character at a time, it looks
+    for the next quote, backslash or newline with str.find and copies
+    everything in between with a single slice. Tokens and errors are
+    exactly the same as Lexer's.
+    """
+
+    def _skip_whitespace_and_comments(self):
+        text = self.text
+        pos = _SPACE_RE.match(text, self.pos).end()
+        while text.startswith('#', pos):
+            pos = text.find('\n', pos)
+            if pos == -1:
+                pos = len(text)
+                break
+            pos = _SPACE_RE.match(text, pos).end()
+        self.pos = pos
+
+    def _extract_string(self, start):
+        escape_table = self.language.escape_table
+        text = self.text
+        pos = self.pos
+        raw = text[pos] == 'r'
+        if raw:
+            pos += 1
+        if text.startswith(('"""', "'''"), pos):
+            quote = text[pos:pos+3]
+        else:
+            quote = text[pos]
+        pos += len(quote)
+
+        chunks = []
+        end = text.find(quote, pos)
+        while True:
+            if raw:
+                backslash = -1
+            else:
+                backslash = text.find(
+                    '\\', pos, len(text) if end == -1 else end)
+
+            if backslash == -1 or backslash + 1 == len(text):
+                if end == -1:
+                    raise self.language.error(
+                        Token(self.source, start, 'ERROR'),
+                        'Unterminated string literal')
+                chunks.append(text[pos:end])
+                self.pos = end + len(quote)
+                return Token(self.source, start, 'STRING', ''.join(chunks))
+
+            ch = text[backslash + 1]
+            if ch not in escape_table:
+                raise self.language.error(
+                    Token(self.source, backslash + 1, 'ERROR'),
+                    'Invalid escape: ' + ch)
+            chunks.append(text[pos:backslash])
+            chunks.append(escape_table[ch])
+            pos = backslash + 2
+
+            # The escaped character may have been (the start of) the
+            # quote we found, in which case the string goes on past it.
+            if end != -1 and end < pos:
+                end = text.find(quote, pos)
+
+
+# The master pattern used by RegexLexer. Each match skips a run of
+# whitespace and comments and then matches exactly one token, so
+# successive matches from a scanner tile the whole text.
+#
+# String literals only match here when they are terminated. An opening
+# quote that doesn't make it to its closing quote falls through to the
+# UNTERMINATED group so that we can report the same error Lexer does.
+_STRING_PATTERNS = (
+    r'r"""[^"]*(?:"(?!"")[^"]*)*"""',
+    r"r'''[^']*(?:'(?!'')[^']*)*'''",
+    r'r"(?!"")[^"]*"',
+    r"r'(?!'')[^']*'",
+    r'"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""',
+    r"'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''",
+    r'"(?!"")[^"\\]*(?:\\.[^"\\]*)*"',
+    r"'(?!'')[^'\\]*(?:\\.[^'\\]*)*'",
+)
+
+# A comment has to run all the way to the end of its line; otherwise the
+# regex engine could backtrack into it looking for a token.
+_SKIP_PATTERN = r'\s*(?:#[^\n]*(?![^\n])\s*)*'
+
+
+def _compile_token_re(symbols, extra_digits='', extra_non_name_starts=''):
+    digit = r'[\d%s]' % extra_digits
+    return re.compile(
+        _SKIP_PATTERN +
+        r'(?:'
+        r'(?P<FLOAT>' + digit + r'+\.' + digit + r'*)|'
+        r'(?P<INT>' + digit + r'+)|'
+        r'(?P<STRING>' + '|'.join(_STRING_PATTERNS) + r')|'
+        r'(?P<UNTERMINATED>r?(?:"""|' + "'''" + r'''|"|'))|'''
+        r'(?P<NAME>[^\W\d%s%s]\w*)|' % (extra_digits, extra_non_name_starts) +
+        r'(?P<SYMBOL>' + '|'.join(map(re.escape, symbols)) + r')|'
+        r'(?P<EOF>\Z)'
+        r')',
+        re.DOTALL)
+
+
+_UNICODE_CLASSES = []
+
+
+def _unicode_classes():
+    # Characters where str.isdigit/str.isalpha and '\d'/'\w' disagree.
+    if not _UNICODE_CLASSES:
+        chars = [chr(i) for i in range(128, sys.maxunicode + 1)]
+        extra_digits = ''.join(
+            re.escape(c) for c in chars if c.isdigit() and not c.isdecimal())
+        extra_non_name_starts = ''.join(
+            re.escape(c) for c in chars
+            if c.isnumeric() and not c.isdigit() and not c.isalpha())
+        _UNICODE_CLASSES.extend((extra_digits, extra_non_name_starts))
+    return _UNICODE_CLASSES
+
+
+_SKIP_RE = re.compile(_SKIP_PATTERN)
+
+_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+_NON_SPACE_RE = re.compile(r'\S*')
+_SPACE_RE = re.compile(r'\s*')
+
+
+class RegexLexer(object):
+    """Alternative to Lexer that tokenizes with a single compiled regex.
+
+    Produces the same tokens and raises the same errors as Lexer, but the
+    per-character work happens inside the regex engine instead of in
+    Python loops.
+    """
+
+    language = None
+
+    def __init__(self, source, pos=0, names=None):
+        self.source = source
+        self.text = source.text
+        self.pos = pos
+        self.names = names
+        if self.text.isascii():
+            token_re = self.language.token_re
+        else:
+            token_re = self.language.unicode_token_re()
+        self._match = token_re.scanner(self.text, pos).match
+        self._eof = None
+        self.peek = self._extract_token()
+        self.peek_end = self.pos
+        self.done = False
+
+    def next(self):
+        token = self.peek
+        self.peek = self._extract_token()
+        self.peek_end = self.pos
+        self.done = token.type == 'EOF'
+        return token
+
+    def _extract_token(self):
+        if self._eof is not None:
+            return self._eof
+
+        m = self._match()
+
+        if m is None:
+            start = _SKIP_RE.match(self.text, self.pos).end()
+            end = _NON_SPACE_RE.match(self.text, start).end()
+            raise self.language.error(Token(self.source, start, 'ERROR'),
+                'Invalid token: ' + self.text[start:end])
+
+        kind = m.lastgroup
+        start = m.start(kind)
+        value = m.group(kind)
+        self.pos = m.end()
+
+        if kind == 'NAME':
+            return self.language.name_token(
+                self.source, start, value, self.names)
+
+        if kind == 'SYMBOL':
+            return Token(self.source, start, value)
+
+        if kind == 'STRING':
+            value = self.language.string_literal_value(
+                self.source, start, value)
+            return Token(self.source, start, 'STRING', value)
+
+        if kind == 'UNTERMINATED':
+            # An invalid escape before the end of the text gets reported
+            # first, just like in Lexer.
+            if value[0] != 'r':
+                self.language.unescape(
+                    self.source, self.text[self.pos:], self.pos)
+            raise self.language.error(
+                Token(self.source, start, 'ERROR'),
+                'Unterminated string literal')
+
+        if kind == 'EOF':
+            self._eof = Token(self.source, start, 'EOF')
+            return self._eof
+
+        return Token(self.source, start, kind, value)
+
+
+def _compile_bytes_token_re(symbols):
+    # The master pattern used by BytesLexer. It only knows about ASCII
+    # names, numbers and whitespace; anything it can't match at a token
+    # boundary (including a name or number running into a non-ASCII
+    # character) is handed over to RegexLexer on the decoded text.
+    return re.compile((
+        _SKIP_PATTERN +
+        r'(?:'
+        r'(?P<FLOAT>[0-9]+\.[0-9]*(?![0-9\x80-\xff]))|'
+        r'(?P<INT>[0-9]+(?![0-9.\x80-\xff]))|'
+        r'(?P<STRING>' + '|'.join(_STRING_PATTERNS) + r')|'
+        r'(?P<UNTERMINATED>r?["\'])|'
+        r'(?P<NAME>[A-Za-z_]\w*(?![\w\x80-\xff]))|'
+        r'(?P<SYMBOL>' + '|'.join(map(re.escape, symbols)) + r')|'
+        r'(?P<EOF>\Z)'
+        r')').encode('ascii'),
+        re.DOTALL)
+
+
+_NON_ASCII_BYTE_RE = re.compile(br'[\x80-\xff]')
+
+# Deleting these from a run of UTF-8 leaves only continuation bytes.
+_NON_CONTINUATION_BYTES = bytes(range(0x80)) + bytes(range(0xc0, 0x100))
+
+
+class BytesLexer(object):
+    """Lexer for sources loaded with Source.from_path.
+
+    Scans the mapped UTF-8 bytes directly and only decodes token values.
+    Byte offsets are turned into character offsets as we go, which is
+    free as long as the file is pure ASCII.
+
+    Subclasses set 'text_lexer' to the RegexLexer of their language,
+    which takes over for the odd token the bytes pattern can't handle.
+    """
+
+    language = None
+    text_lexer = None
+
+    def __init__(self, source, names=None):
+        self.source = source
+        self.data = source.data
+        self.pos = 0
+        self.names = names
+        self._match = self.language.bytes_token_re.scanner(self.data).match
+        self._ascii = _NON_ASCII_BYTE_RE.search(self.data) is None
+        self._byte_base = 0
+        self._char_base = 0
+        self._eof = None
+        self.peek = self._extract_token()
+        self.peek_end = (
+            self.pos if self._ascii else self._char_offset(self.pos))
+        self.done = False
+
+    def next(self):
+        token = self.peek
+        self.peek = self._extract_token()
+        self.peek_end = (
+            self.pos if self._ascii else self._char_offset(self.pos))
+        self.done = token.type == 'EOF'
+        return token
+
+    def _char_offset(self, byte_offset):
+        # Only ever called with non-decreasing offsets, so we can count
+        # characters incrementally.
+        run = self.data[self._byte_base:byte_offset]
+        self._char_base += (
+            len(run) - len(run.translate(None, _NON_CONTINUATION_BYTES)))
+        self._byte_base = byte_offset
+        return self._char_base
+
+    def _extract_token(self):
+        if self._eof is not None:
+            return self._eof
+
+        m = self._match()
+
+        if m is None or m.lastgroup == 'UNTERMINATED':
+            return self._extract_token_from_text()
+
+        kind = m.lastgroup
+        start = m.start(kind)
+        if not self._ascii:
+            start = self._char_offset(start)
+        value = m.group(kind)
+        self.pos = m.end()
+
+        if kind == 'NAME':
+            return self.language.name_token(
+                self.source, start, value.decode('ascii'), self.names)
+
+        if kind == 'SYMBOL':
+            symbol = self.language.bytes_symbols[value]
+            return Token(self.source, start, symbol)
+
+        if kind == 'STRING':
+            value = self.language.string_literal_value(
+                self.source, start, value.decode('utf-8'))
+            return Token(self.source, start, 'STRING', value)
+
+        if kind == 'EOF':
+            self._eof = Token(self.source, start, 'EOF')
+            return self._eof
+
+        return Token(self.source, start, kind, value.decode('ascii'))
+
+    def _extract_token_from_text(self):
+        # Lex a single token on the decoded text, which also takes care
+        # of raising the right error if there is one. This decodes the
+        # whole text, but only the first time it happens.
+        char_pos = self.pos if self._ascii else self._char_offset(self.pos)
+        lexer = self.text_lexer(self.source, char_pos, self.names)
+        token = lexer.peek
+        self.pos += len(self.source.text[char_pos:lexer.pos].encode('utf-8'))
+        self._byte_base = self.pos
+        self._char_base = lexer.pos
+        self._match = self.language.bytes_token_re.scanner(
+            self.data, self.pos).match
+        if token.type == 'EOF':
+            self._eof = token
+        return token
+
+
+def make_lexer(engines, source, engine=None, pos=0, names=None):
+    """Lexer for 'source' using engines['<engine>'].
+
+    By default that's 'regex' for sources held in memory, the fastest
+    engine on them, and 'bytes' for sources loaded with
+    Source.from_path. With 'names' (an InternTable), names are interned
+    there.
+    """
+    if engine is None:
+        engine = 'regex' if source.data is None else 'bytes'
+    if pos:
+        return engines[engine](source, pos, names=names)
+    return engines[engine](source, names=names)
+
+
+def tokenize(lexer):
+    tokens = []
+    while not lexer.done:
+        tokens.append(lexer.next())
+    return tokens
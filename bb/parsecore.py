@@ -0,0 +1,43 @@
+"""parsecore.py
+
+Running the parsers of bb (bbparser) and sleep (sleepparser) alike.
+
+Both write each production that can contain others, like blocks and
+expressions, once: as a generator that, instead of calling the method
+for a sub-production, yields the generator for it and gets its result
+sent back in. Which of the functions here runs them is what tells their
+Parser and StacklessParser apart:
+
+    recurse     runs each sub-production in a nested call, so how deeply
+                code can nest is bounded by sys.getrecursionlimit()
+    run         keeps the pending productions in a list instead, so that
+                is bounded by memory, a little more slowly
+"""
+
+
+def recurse(generator):
+    """Run 'generator' to completion, recursing into what it yields."""
+    send = generator.send
+    try:
+        request = send(None)
+        while True:
+            request = send(recurse(request))
+    except StopIteration as e:
+        return e.value
+
+
+def run(generator):
+    """Run 'generator' to completion without recursing in Python."""
+    stack = [generator]
+    value = None
+    while True:
+        try:
+            request = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            if not stack:
+                return e.value
+            value = e.value
+        else:
+            stack.append(request)
+            value = None
@@ -1,5 +1,11 @@
+export PYTHONPATH=../py
 python bblexer_test.py || exit 1
 python bbparser_test.py || exit 1
 python bbannotator_test.py || exit 1
 
 
+python bbbench_test.py || exit 1
+python astcodec_test.py || exit 1
+python astarena_test.py || exit 1
+python astvisitor_test.py || exit 1
+python astschema_test.py || exit 1
@@ -0,0 +1 @@
+../bb/astcodec.py
\ No newline at end of file
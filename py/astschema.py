@@ -0,0 +1 @@
+../bb/astschema.py
\ No newline at end of file
@@ -0,0 +1 @@
+../bb/astvisitor.py
\ No newline at end of file
@@ -0,0 +1 @@
+../bb/lexcore.py
\ No newline at end of file
@@ -0,0 +1 @@
+../bb/parsecore.py
\ No newline at end of file
@@ -1,9 +1,28 @@
+import astschema
 
 class Ast(object):
+    # What node classes declare is described in astschema.
+    _fields = ()
+    _annotations = ()
+    _children = ()
+    __slots__ = ('token', '_digest')
+
+    def __init_subclass__(cls, **kwargs):
+        super(Ast, cls).__init_subclass__(**kwargs)
+        astschema.add_class(cls)
+
     def __init__(self, token):
         self.token = token
 
+    def accept(self, visitor):
+        return getattr(visitor, self._visit_method)(self)
+
 class FileInput(Ast):
+    _fields = ('package', 'imports', 'interfaces', 'classes')
+    _children = ('imports', 'interfaces', 'classes')
+    _visit_method = 'visit_file_input'
+    __slots__ = _fields
+
     def __init__(self, token, package, imports, interfaces, classes):
         super(FileInput, self).__init__(token)
         self.package = package  # [string]
@@ -11,40 +30,47 @@ class FileInput(Ast):
         self.interfaces = interfaces  # [InterfaceDefinition]
         self.classes = classes  # [ClassDefinition]
 
-    def accept(self, visitor):
-        return visitor.visit_file_input(self)
-
 class ImportDeclaration(Ast):
+    _fields = ('package', 'name', 'alias')
+    _visit_method = 'visit_import_declaration'
+    __slots__ = _fields
+
     def __init__(self, token, package, name, alias):
         super(ImportDeclaration, self).__init__(token)
         self.package = package  # [string]
         self.name = name  # string
         self.alias = alias  # string
 
-    def accept(self, visitor):
-        return visitor.visit_import_declaration(self)
-
 class InterfaceDefinition(Ast):
+    _fields = ('name', 'bases', 'stubs')
+    _children = ('bases', 'stubs')
+    _visit_method = 'visit_interface_definition'
+    __slots__ = _fields
+
     def __init__(self, token, name, bases, stubs):
         super(InterfaceDefinition, self).__init__(token)
         self.name = name  # string
         self.bases = bases  # [Typename]
         self.stubs = stubs  # [MethodStub]
 
-    def accept(self, visitor):
-        return visitor.visit_interface_definition(self)
-
 class MethodStub(Ast):
+    _fields = ('returns', 'name', 'arglist')
+    _children = ('returns', 'arglist')
+    _visit_method = 'visit_method_stub'
+    __slots__ = _fields
+
     def __init__(self, token, returns, name, arglist):
         super(MethodStub, self).__init__(token)
         self.returns = returns  # Typename
         self.name = name  # string
         self.arglist = arglist  # [(Typename, string)]
 
-    def accept(self, visitor):
-        return visitor.visit_method_stub(self)
-
 class ClassDefinition(Ast):
+    _fields = ('name', 'base', 'interfaces', 'members', 'methods')
+    _children = ('base', 'interfaces', 'members', 'methods')
+    _visit_method = 'visit_class_definition'
+    __slots__ = _fields
+
     def __init__(self, token, name, base, interfaces,
                  members, methods):
         super(ClassDefinition, self).__init__(token)
@@ -54,10 +80,12 @@ class ClassDefinition(Ast):
         self.members = members  # [MemberDefinition]
         self.methods = methods  # [MethodDefinition]
 
-    def accept(self, visitor):
-        return visitor.visit_class_definition(self)
-
 class Typename(Ast):
+    _fields = ('name',)
+    _annotations = ('full_name',)
+    _visit_method = 'visit_typename'
+    __slots__ = _fields + _annotations
+
     def __init__(self, token, name):
         super(Typename, self).__init__(token)
         self.name = name  # string
@@ -65,20 +93,24 @@ class Typename(Ast):
         # To be filled in by annotator
         self.full_name = None  # string
 
-    def accept(self, visitor):
-        return visitor.visit_typename(self)
-
 class MemberDefinition(Ast):
+    _fields = ('is_static', 'type', 'name')
+    _children = ('type',)
+    _visit_method = 'visit_member_definition'
+    __slots__ = _fields
+
     def __init__(self, token, is_static, type_, name):
         super(MemberDefinition, self).__init__(token)
         self.is_static = is_static  # bool
         self.type = type_  # Typename
         self.name = name  # string
 
-    def accept(self, visitor):
-        return visitor.visit_member_definition(self)
-
 class MethodDefinition(Ast):
+    _fields = ('is_static', 'returns', 'name', 'arglist', 'body')
+    _children = ('returns', 'arglist', 'body')
+    _visit_method = 'visit_method_definition'
+    __slots__ = _fields
+
     def __init__(self, token, is_static, returns, name, arglist, body):
         super(MethodDefinition, self).__init__(token)
         self.is_static = is_static  # bool
@@ -87,74 +119,86 @@ class MethodDefinition(Ast):
         self.arglist = arglist  # [(Typename, string)]
         self.body = body  # Block
 
-    def accept(self, visitor):
-        return visitor.visit_method_definition(self)
-
 class Statement(Ast):
-    pass
+    __slots__ = ()
 
 class Block(Statement):
+    _fields = ('stmts',)
+    _children = ('stmts',)
+    _visit_method = 'visit_block'
+    __slots__ = _fields
+
     def __init__(self, token, stmts):
         super(Block, self).__init__(token)
         self.stmts = stmts  # [Statement]
 
-    def accept(self, visitor):
-        return visitor.visit_block(self)
-
 class VariableDeclaration(Statement):
+    _fields = ('type', 'name', 'value')
+    _children = ('type', 'value')
+    _visit_method = 'visit_variable_declaration'
+    __slots__ = _fields
+
     def __init__(self, token, type_, name, value):
         super(VariableDeclaration, self).__init__(token)
         self.type = type_  # Typename
         self.name = name  # string
         self.value = value  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_variable_declaration(self)
-
 class IfStatement(Statement):
+    _fields = ('condition', 'body', 'other')
+    _children = ('condition', 'body', 'other')
+    _visit_method = 'visit_if_statement'
+    __slots__ = _fields
+
     def __init__(self, token, condition, body, other):
         super(IfStatement, self).__init__(token)
         self.condition = condition  # Expression
         self.body = body  # Block
         self.other = other  # Block|IfStatement|None
 
-    def accept(self, visitor):
-        return visitor.visit_if_statement(self)
-
 class WhileStatement(Statement):
+    _fields = ('condition', 'body')
+    _children = ('condition', 'body')
+    _visit_method = 'visit_while_statement'
+    __slots__ = _fields
+
     def __init__(self, token, condition, body):
         super(WhileStatement, self).__init__(token)
         self.condition = condition  # Expression
         self.body = body  # Block
 
-    def accept(self, visitor):
-        return visitor.visit_while_statement(self)
-
 class BreakStatement(Statement):
-    def accept(self, visitor):
-        return visitor.visit_break_statement(self)
+    _visit_method = 'visit_break_statement'
+    __slots__ = ()
 
 class ContinueStatement(Statement):
-    def accept(self, visitor):
-        return visitor.visit_continue_statement(self)
+    _visit_method = 'visit_continue_statement'
+    __slots__ = ()
 
 class ReturnStatement(Statement):
+    _fields = ('return_value',)
+    _children = ('return_value',)
+    _visit_method = 'visit_return_statement'
+    __slots__ = _fields
+
     def __init__(self, token, return_value):
         super(ReturnStatement, self).__init__(token)
         self.return_value = return_value  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_return_statement(self)
-
 class ExpressionStatement(Statement):
+    _fields = ('expression',)
+    _children = ('expression',)
+    _visit_method = 'visit_expression_statement'
+    __slots__ = _fields
+
     def __init__(self, token, expression):
         super(ExpressionStatement, self).__init__(token)
         self.expression = expression
 
-    def accept(self, visitor):
-        return visitor.visit_expression_statement(self)
-
 class Expression(Ast):
+    _annotations = ('deduced_type',)
+    __slots__ = _annotations
+
     def __init__(self, token):
         super(Expression, self).__init__(token)
 
@@ -162,159 +206,194 @@ class Expression(Ast):
         self.deduced_type = None  # string
 
 class StringLiteral(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_string_literal'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(StringLiteral, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_string_literal(self)
-
 class FloatLiteral(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_float_literal'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(FloatLiteral, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_float_literal(self)
-
 class IntLiteral(Expression):
+    _fields = ('value',)
+    _visit_method = 'visit_int_literal'
+    __slots__ = _fields
+
     def __init__(self, token, value):
         super(IntLiteral, self).__init__(token)
         self.value = value  # string
 
-    def accept(self, visitor):
-        return visitor.visit_int_literal(self)
-
 class NameExpression(Expression):
+    _fields = ('name',)
+    _visit_method = 'visit_name_expression'
+    __slots__ = _fields
+
     def __init__(self, token, name):
         super(NameExpression, self).__init__(token)
         self.name = name  # string
 
-    def accept(self, visitor):
-        return visitor.visit_name_expression(self)
-
 class AssignExpression(Expression):
+    _fields = ('name', 'value')
+    _children = ('value',)
+    _visit_method = 'visit_assign_expression'
+    __slots__ = _fields
+
     def __init__(self, token, name, value):
-        suepr(AssignExpression, self).__init__(token)
+        super(AssignExpression, self).__init__(token)
         self.name = name  # string
         self.value = value  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_assign_expression(self)
-
 class ListDisplay(Expression):
+    _fields = ('values',)
+    _children = ('values',)
+    _visit_method = 'visit_list_display'
+    __slots__ = _fields
+
     def __init__(self, token, values):
         super(ListDisplay, self).__init__(token)
         self.values = values  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_list_display(self)
-
 class NewExpression(Expression):
+    _fields = ('type', 'args')
+    _children = ('type', 'args')
+    _visit_method = 'visit_new_expression'
+    __slots__ = _fields
+
     def __init__(self, token, type_, args):
         super(NewExpression, self).__init__(token)
         self.type = type_  # Typename
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_new_expression(self)
-
 class SuperMethodCallExpression(Expression):
+    _fields = ('method_name', 'args')
+    _children = ('args',)
+    _visit_method = 'visit_super_method_call_expression'
+    __slots__ = _fields
+
     def __init__(self, token, method_name, args):
         super(SuperMethodCallExpression, self).__init__(token)
         self.method_name = method_name  # string
         self.args = args  # [Expression]
 
 class MethodCallExpression(Expression):
+    _fields = ('target', 'method_name', 'args')
+    _children = ('target', 'args')
+    _visit_method = 'visit_method_call_expression'
+    __slots__ = _fields
+
     def __init__(self, token, target, method_name, args):
         super(MethodCallExpression, self).__init__(token)
         self.target = target  # Expression
         self.method_name = method_name  # string
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_method_call_expression(self)
-
 class GetAttributeExpression(Expression):
+    _fields = ('target', 'attribute_name')
+    _children = ('target',)
+    _visit_method = 'visit_get_attribute_expression'
+    __slots__ = _fields
+
     def __init__(self, token, target, attribute_name):
         super(GetAttributeExpression, self).__init__(token)
         self.target = target  # Expression
         self.attribute_name = attribute_name  # string
 
-    def accept(self, visitor):
-        return visitor.visit_get_attribute_expression(self)
-
 class SetAttributeExpression(Expression):
+    _fields = ('target', 'attribute_name', 'value')
+    _children = ('target', 'value')
+    _visit_method = 'visit_set_attribute_expression'
+    __slots__ = _fields
+
     def __init__(self, token, target, attribute_name, value):
         super(SetAttributeExpression, self).__init__(token)
         self.target = target  # Expression
         self.attribute_name = attribute_name  # string
         self.value = value  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_set_attribute_expression(self)
-
 class StaticMethodCallExpression(Expression):
+    _fields = ('type', 'method_name', 'args')
+    _children = ('type', 'args')
+    _visit_method = 'visit_static_method_call_expression'
+    __slots__ = _fields
+
     def __init__(self, token, type_, method_name, args):
         super(StaticMethodCallExpression, self).__init__(token)
         self.type = type_  # Typename
         self.method_name = method_name  # string
         self.args = args  # [Expression]
 
-    def accept(self, visitor):
-        return visitor.visit_static_method_call_expression(self)
-
 class GetStaticAttributeExpression(Expression):
+    _fields = ('type', 'attribute_name')
+    _children = ('type',)
+    _visit_method = 'visit_get_static_attribute_expression'
+    __slots__ = _fields
+
     def __init__(self, token, type_, attribute_name):
         super(GetStaticAttributeExpression, self).__init__(token)
         self.type = type_  # Typename
         self.attribute_name = attribute_name  # string
 
-    def accept(self, visitor):
-        return visitor.visit_get_static_attribute_expression(self)
-
 class SetStaticAttributeExpression(Expression):
+    _fields = ('type', 'attribute_name', 'value')
+    _children = ('type', 'value')
+    _visit_method = 'visit_set_static_attribute_expression'
+    __slots__ = _fields
+
     def __init__(self, token, type_, attribute_name, value):
         super(SetStaticAttributeExpression, self).__init__(token)
         self.type = type_  # Typename
         self.attribute_name = attribute_name  # string
         self.value = value  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_set_static_attribute_expression(self)
-
 class NotExpression(Expression):
+    _fields = ('target',)
+    _children = ('target',)
+    _visit_method = 'visit_not_expression'
+    __slots__ = _fields
+
     def __init__(self, token, target):
         super(NotExpression, self).__init__(token)
         self.target = target  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_not_expression(self)
-
 class AndExpression(Expression):
+    _fields = ('left', 'right')
+    _children = ('left', 'right')
+    _visit_method = 'visit_and_expression'
+    __slots__ = _fields
+
     def __init__(self, token, left, right):
         super(AndExpression, self).__init__(token)
         self.left = left  # Expression
         self.right = right  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_and_expression(self)
-
 class OrExpression(Expression):
+    _fields = ('left', 'right')
+    _children = ('left', 'right')
+    _visit_method = 'visit_or_expression'
+    __slots__ = _fields
+
     def __init__(self, token, left, right):
         super(OrExpression, self).__init__(token)
         self.left = left  # Expression
         self.right = right  # Expression
 
-    def accept(self, visitor):
-        return visitor.visit_or_expression(self)
-
 class TernaryExpression(Expression):
+    _fields = ('condition', 'left', 'right')
+    _children = ('condition', 'left', 'right')
+    _visit_method = 'visit_ternary_expression'
+    __slots__ = _fields
+
     def __init__(self, token, condition, left, right):
         super(TernaryExpression, self).__init__(token)
         self.condition = condition  # Expression
         self.left = left  # Expression
         self.right = right  # Expression
-
-    def accept(self, visitor):
-        return visitor.visit_ternary_expression(self)
@@ -1,7 +1,8 @@
 import sleepparser as parser
+import astvisitor
 
 
-class JavascriptTranspiler(object):
+class JavascriptTranspiler(astvisitor.Visitor):
 
     def __init__(self, loader):
         self.loader = loader
@@ -18,9 +19,6 @@ class JavascriptTranspiler(object):
         ast = parser.parse(source)
         self.results.append(self.visit(ast))
 
-    def visit(self, node):
-        return node.accept(self)
-
     def visit_file_input(self, node):
         pass
 
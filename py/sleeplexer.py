@@ -1,22 +1,12 @@
+import lexcore
+
 OPEN_PARENTHESIS = '('
 CLOSE_PARENTHESIS = ')'
 OPEN_BRACKET = '['
 CLOSE_BRACKET = ']'
 
-class Source(object):
-    def __init__(self, uri, text):
-        self.uri = uri
-        self.text = text
-
-class Token(object):
-    def __init__(self, source, pos, type_, value=None):
-        self.source = source
-        self.pos = pos
-        self.type = type_
-        self.value = value
-
-    def __repr__(self):
-        return 'Token(type_=%r, value=%r)' % (self.type, self.value)
+Source = lexcore.Source
+Token = lexcore.Token
 
 class ParseError(Exception):
     def __init__(self, token, message):
@@ -45,134 +35,33 @@ SYMBOLS = tuple(reversed(sorted((
     ';', '.', ',',
 ))))
 
-ESCAPE_TABLE = {
-    'n': '\n',
-    't': '\t',
-    '\\': '\\',
-    '"': '"',
-    "'": "'",
-}
-
-class Lexer(object):
-    def __init__(self, source):
-        self.source = source
-        self.text = source.text
-        self.pos = 0
-        self.peek = self._extract_token()
-        self.done = False
-
-    def next(self):
-        token = self.peek
-        self.peek = self._extract_token()
-        self.done = token.type == 'EOF'
-        return token
-
-    def _skip_whitespace_and_comments(self):
-        while (self.pos < len(self.text) and
-               (self.text[self.pos] == '#' or
-                self.text[self.pos].isspace())):
-            if self.text[self.pos] == '#':
-                while (self.pos < len(self.text) and
-                       self.text[self.pos] != '\n'):
-                    self.pos += 1
-            else:
-                self.pos += 1
+ESCAPE_TABLE = lexcore.ESCAPE_TABLE
 
-    def _extract_token(self):
-        self._skip_whitespace_and_comments()
-        if self.pos >= len(self.text):
-            return Token(self.source, self.pos, 'EOF')
+def _is_typename(name):
+    return name[0].isupper() and not name.isupper()
 
-        start = self.pos
+LANGUAGE = lexcore.Language(
+    KEYWORDS, PRIMITIVE_TYPES, SYMBOLS, _is_typename, ParseError)
 
-        # INT or FLOAT
-        if self.text[self.pos].isdigit():
-            while (self.pos < len(self.text) and
-                   self.text[self.pos].isdigit()):
-                self.pos += 1
-            if self.pos < len(self.text) and self.text[self.pos] == '.':
-                self.pos += 1
-                while (self.pos < len(self.text) and
-                       self.text[self.pos].isdigit()):
-                    self.pos += 1
-                value = self.text[start:self.pos]
-                return Token(self.source, start, 'FLOAT', value)
-            else:
-                value = self.text[start:self.pos]
-                return Token(self.source, start, 'INT', value)
+class Lexer(lexcore.Lexer):
+    language = LANGUAGE
 
-        # STRING
-        if self.text.startswith(('r"', "r'", '"', "'"), self.pos):
-            if self.text[self.pos] == 'r':
-                raw = True
-                self.pos += 1
-            else:
-                raw = False
+class FindLexer(lexcore.FindLexer):
+    language = LANGUAGE
 
-            if self.text.startswith(('"""', "'''"), self.pos):
-                quote = self.text[self.pos:self.pos+3]
-                self.pos += 3
-            else:
-                quote = self.text[self.pos]
-                self.pos += 1
+class RegexLexer(lexcore.RegexLexer):
+    language = LANGUAGE
 
-            chars = []
+class BytesLexer(lexcore.BytesLexer):
+    language = LANGUAGE
+    text_lexer = RegexLexer
 
-            while not self.text.startswith(quote, self.pos):
-                if self.pos >= len(self.text):
-                    raise ParseError(
-                        Token(self.source, start, 'ERROR'),
-                        'Unterminated string literal')
-
-                if not raw and self.text[self.pos] == '\\':
-                    self.pos += 1
-                    ch = self.text[self.pos]
-                    if ch not in ESCAPE_TABLE:
-                        raise ParseError(
-                            Token(self.source, self.pos, 'ERROR'),
-                            'Invalid escape: ' + ch)
-                    chars.append(ESCAPE_TABLE[ch])
-                    self.pos += 1
-                else:
-                    chars.append(self.text[self.pos])
-                    self.pos += 1
-
-            self.pos += len(quote)
-            value = ''.join(chars)
-            return Token(self.source, start, 'STRING', value)
-
-        # TYPENAME or NAME or KEYWORD
-        if self.text[self.pos].isalpha() or self.text[self.pos] == '_':
-            while (self.pos < len(self.text) and
-                   (self.text[self.pos].isalnum() or
-                    self.text[self.pos] == '_')):
-                self.pos += 1
-            value = self.text[start:self.pos]
-            if value in KEYWORDS:
-                return Token(self.source, start, value)
-            elif (value in PRIMITIVE_TYPES or
-                  (value[0].isupper() and
-                   not value.isupper())):
-                return Token(self.source, start, 'TYPENAME', value)
-            else:
-                return Token(self.source, start, 'NAME', value)
-
-        # SYMBOL
-        for symbol in SYMBOLS:
-            if self.text.startswith(symbol, self.pos):
-                self.pos += len(symbol)
-                return Token(self.source, start, symbol)
-
-        # ERROR
-        while (self.pos < len(self.text) and
-               not self.text[self.pos].isspace()):
-            self.pos += 1
-        raise ParseError(Token(self.source, start, 'ERROR'),
-            'Invalid token: ' + self.text[start:self.pos])
+ENGINES = {
+    'loop': Lexer,
+    'find': FindLexer,
+    'regex': RegexLexer,
+    'bytes': BytesLexer,
+}
 
-def lex(source):
-    lexer = Lexer(source)
-    tokens = []
-    while not lexer.done:
-        tokens.append(lexer.next())
-    return tokens
+def lex(source, engine=None):
+    return lexcore.tokenize(lexcore.make_lexer(ENGINES, source, engine))
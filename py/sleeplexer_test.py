@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 import sleeplexer as lexer
 
@@ -59,6 +62,64 @@ class LexerTestCase(TestCase):
         self.assertEqual(tokens[0].value, '2342.5')
         self.assertEqual(tokens[1].type, 'EOF')
 
+    def test_lone_capital_letter_is_name(self):
+        # Unlike in bb, where it would be a TYPENAME.
+        tokens = lexer.lex(lexer.Source('<test>', 'X null'))
+        type_value_pairs = [(token.type, token.value) for token in tokens]
+        self.assertEqual(type_value_pairs, [
+            ('NAME', 'X'),
+            ('NAME', 'null'),
+            ('EOF', None),
+        ])
+
+    def test_engines_agree(self):
+        source = lexer.Source('<test>', SIMPLE_LEXER_EXAMPLE.text + (
+            u"X r'\\q' '''a\\'b''' caf\xe9 <= # done"))
+        results = [
+            [(token.type, token.value, token.pos)
+             for token in lexer.lex(source, engine)]
+            for engine in ('loop', 'find', 'regex')]
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
+        self.assertEqual(results[0][-6:-1], [
+            ('NAME', 'X', 68),
+            ('STRING', '\\q', 70),
+            ('STRING', "a'b", 76),
+            ('NAME', u'caf\xe9', 87),
+            ('<=', None, 92),
+        ])
+
+        with self.assertRaises(lexer.ParseError) as context:
+            lexer.lex(lexer.Source('<test>', 'x $y'), 'regex')
+        self.assertEqual(context.exception.message, 'Invalid token: $y')
+
+    def test_longest_symbol_wins(self):
+        tokens = lexer.lex(lexer.Source('<test>', '<=<+= +=!= ='))
+        types = [token.type for token in tokens]
+        self.assertEqual(types, ['<=', '<', '+=', '+=', '!=', '=', 'EOF'])
+
+    def test_line_and_column(self):
+        tokens = lexer.lex(SIMPLE_LEXER_EXAMPLE)
+        self.assertEqual(
+            SIMPLE_LEXER_EXAMPLE.lines_and_columns(
+                token.pos for token in tokens[:4]),
+            [(3, 1), (3, 7), (3, 16), (3, 21)])
+        self.assertEqual(
+            SIMPLE_LEXER_EXAMPLE.line_and_column(tokens[-1].pos), (4, 1))
+
+    def test_source_from_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'example.sleep')
+        with open(path, 'wb') as f:
+            f.write(SIMPLE_LEXER_EXAMPLE.text.encode('utf-8'))
+        source = lexer.Source.from_path(path)
+        self.assertEqual(source.uri, path)
+        self.assertEqual(
+            [(token.type, token.value) for token in lexer.lex(source)],
+            [(token.type, token.value)
+             for token in lexer.lex(SIMPLE_LEXER_EXAMPLE)])
+
 
 if __name__ == '__main__':
     unittest.main()
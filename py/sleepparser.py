@@ -1,3 +1,4 @@
+import parsecore
 import sleeplexer as lexer
 import sleepast as ast
 
@@ -11,6 +12,48 @@ Source = lexer.Source
 ParseError = lexer.ParseError
 
 
+def _desugar(method_name):
+    def build(token, left, right):
+        return ast.MethodCallExpression(token, left, method_name, [right])
+    return build
+
+
+# Binding powers used by Parser._parse_expression, loosest first.
+TERNARY = 10
+OR = 20
+AND = 30
+NOT = 35
+COMPARISON = 40
+ADDITIVE = 50
+MULTIPLICATIVE = 60
+PREFIX = 70
+POSTFIX = 80
+
+# Infix operators: token type -> (binding power, node builder).
+BINARY_OPERATORS = {
+    'or': (OR, ast.OrExpression),
+    'and': (AND, ast.AndExpression),
+    '<': (COMPARISON, _desugar('__lt__')),
+    '<=': (COMPARISON, _desugar('__le__')),
+    '>': (COMPARISON, _desugar('__gt__')),
+    '>=': (COMPARISON, _desugar('__ge__')),
+    '==': (COMPARISON, _desugar('__eq__')),
+    '!=': (COMPARISON, _desugar('__ne__')),
+    '+': (ADDITIVE, _desugar('__add__')),
+    '-': (ADDITIVE, _desugar('__sub__')),
+    '*': (MULTIPLICATIVE, _desugar('__mul__')),
+    '/': (MULTIPLICATIVE, _desugar('__div__')),
+    '%': (MULTIPLICATIVE, _desugar('__mod__')),
+}
+
+# Prefix operators other than 'not': token type -> method name.
+PREFIX_OPERATORS = {
+    '-': '__neg__',
+    # TODO: This should probably be __pos__.
+    '+': '__neg__',
+}
+
+
 class Parser(object):
     def __init__(self, source):
         self.source = source
@@ -40,11 +83,25 @@ class Parser(object):
             return self.next_token()
 
     def parse_file_input(self):
+        items = self.iter_file_input()
+        file_input = next(items)
+        for item in items:
+            if isinstance(item, ast.InterfaceDefinition):
+                file_input.interfaces.append(item)
+            else:
+                file_input.classes.append(item)
+        return file_input
+
+    def iter_file_input(self):
+        """Parse the file one definition at a time, as a generator.
+
+        Yields the FileInput first, with only its package and imports,
+        and then each InterfaceDefinition and ClassDefinition as soon as
+        it's parsed, in the order they appear.
+        """
         token = self.peek()
         package = []
         imports = []
-        interfaces = []
-        classes = []
 
         if self.consume('package'):
             package.append(self.expect('NAME').value)
@@ -63,18 +120,18 @@ class Parser(object):
                 alias = name
             imports.append(ast.ImportDeclaration(token, pkg, name, alias))
 
+        yield ast.FileInput(token, package, imports, [], [])
+
         while not self.at('EOF'):
             if self.at('interface'):
-                interfaces.append(self.parse_interface_definition())
+                yield self.parse_interface_definition()
             elif self.at('class'):
-                classes.append(self.parse_class_definition())
+                yield self.parse_class_definition()
             else:
                 raise ParseError(
                     self.peek(),
                     "Expected a class or interface definition")
 
-        return ast.FileInput(token, package, imports, interfaces, classes)
-
     def parse_interface_definition(self):
         token = self.expect('interface')
         name = self.expect('TYPENAME').value
@@ -139,7 +196,7 @@ class Parser(object):
             type_ = self.parse_typename()
             member_name = self.expect('NAME').value
             if self.consume(';'):
-                members.append(MemberDefinition(
+                members.append(ast.MemberDefinition(
                     token, is_static, type_, member_name))
             else:
                 arglist = self.parse_arglist()
@@ -149,258 +206,294 @@ class Parser(object):
         return ast.ClassDefinition(
             token, name, base, interfaces, members, methods)
 
+    # How the generator methods below are run (see parsecore).
+    run_production = staticmethod(parsecore.recurse)
+
     def parse_block(self):
+        return self.run_production(self._parse_block())
+
+    def parse_statement(self):
+        return self.run_production(self._parse_statement())
+
+    def parse_expression(self, min_binding_power=0):
+        return self.run_production(self._parse_expression(min_binding_power))
+
+    def _parse_block(self):
         token = self.expect('{')
         stmts = []
         while not self.consume('}'):
-            stmts.append(self.parse_statement())
+            stmts.append((yield self._parse_statement()))
         return ast.Block(token, stmts)
 
-    def parse_if_statement(self):
+    def _parse_statement(self):
+        type_ = self.tokens[self.pos].type
+        parse = self.STATEMENT_PARSERS.get(type_)
+        if parse is not None:
+            return parse(self)
+        parse = self.NESTED_STATEMENT_PARSERS.get(
+            type_, Parser._parse_expression_statement)
+        return (yield parse(self))
+
+    # Handlers for _parse_statement, by the type of the first token:
+    # first those of statements that can't contain others.
+
+    def parse_continue_statement(self):
+        token = self.expect('continue')
+        self.expect(';')
+        return ast.ContinueStatement(token)
+
+    def parse_break_statement(self):
+        token = self.expect('break')
+        self.expect(';')
+        return ast.BreakStatement(token)
+
+    STATEMENT_PARSERS = {
+        'continue': parse_continue_statement,
+        'break': parse_break_statement,
+    }
+
+    def _parse_if_statement(self):
         token = self.expect('if')
-        cond = self.parse_expression()
-        body = self.parse_block()
+        cond = yield self._parse_expression()
+        body = yield self._parse_block()
         if self.consume('else'):
             if self.at('if'):
-                other = self.parse_if_statement()
+                other = yield self._parse_if_statement()
             else:
-                other = self.parse_block()
+                other = yield self._parse_block()
         else:
             other = None
         return ast.IfStatement(token, cond, body, other)
 
-    def parse_statement(self):
-        token = self.peek()
-        if self.at('{'):
-            return self.parse_block()
-        elif self.at_variable_declaration():
+    def _parse_declaration_or_expression_statement(self):
+        if self.at_variable_declaration():
+            token = self.peek()
             type_ = self.parse_typename()
             name = self.expect('NAME').value
             if self.consume('='):
-                value = self.parse_expression()
+                value = yield self._parse_expression()
             else:
                 value = None
             return ast.VariableDeclaration(token, type_, name, value)
-        elif self.at('if'):
-            return self.parse_if_statement()
-        elif self.consume('while'):
-            cond = self.parse_expression()
-            body = self.parse_block()
-            return ast.WhileStatement(token, cond, body)
-        elif self.consume('continue'):
-            self.expect(';')
-            return ast.ContinueStatement(token)
-        elif self.consume('break'):
-            self.expect(';')
-            return ast.BreakStatement(token)
-        elif self.consume('return'):
-            expr = self.parse_expression()
-            self.expect(';')
-            return ast.ReturnStatement(token, expr)
-        else:
-            expr = self.parse_expression()
-            self.expect(';')
-            return ast.ExpressionStatement(token, expr)
+        return (yield self._parse_expression_statement())
 
-    def parse_expression(self):
-        return self.parse_ternary_expression()
+    def _parse_while_statement(self):
+        token = self.expect('while')
+        cond = yield self._parse_expression()
+        body = yield self._parse_block()
+        return ast.WhileStatement(token, cond, body)
 
-    def parse_ternary_expression(self):
-        expr = self.parse_or_expression()
-        token = self.peek()
-        if self.consume('?'):
-            lhs = self.parse_expression()
-            self.expect(':')
-            rhs = self.parse_ternary_expression()
-            return ast.TernaryExpression(token, expr, lhs, rhs)
-        return expr
-
-    def parse_or_expression(self):
-        expr = self.parse_and_expression()
-        while True:
-            token = self.peek()
-            if self.consume('or'):
-                rhs = self.parse_and_expression()
-                expr = OrExpression(token, expr, rhs)
-            else:
-                break
-        return expr
+    def _parse_return_statement(self):
+        token = self.expect('return')
+        expr = yield self._parse_expression()
+        self.expect(';')
+        return ast.ReturnStatement(token, expr)
 
-    def parse_and_expression(self):
-        expr = self.parse_not_expression()
-        while True:
-            token = self.peek()
-            if self.consume('and'):
-                rhs = self.parse_not_expression()
-                expr = AndExpression(token, expr, rhs)
-            else:
-                break
-        return expr
-
-    def parse_not_expression(self):
+    def _parse_expression_statement(self):
+        token = self.peek()
+        expr = yield self._parse_expression()
+        self.expect(';')
+        return ast.ExpressionStatement(token, expr)
+
+    NESTED_STATEMENT_PARSERS = {
+        '{': _parse_block,
+        'TYPENAME': _parse_declaration_or_expression_statement,
+        'if': _parse_if_statement,
+        'while': _parse_while_statement,
+        'return': _parse_return_statement,
+    }
+
+    def _parse_expression(self, min_binding_power=0):
+        # Precedence climbing over the tables above: prefix operators
+        # first, then we keep folding in infix operators for as long as
+        # they bind at least as tightly as 'min_binding_power'. 'level'
+        # is how tightly the expression built so far is bound.
         token = self.peek()
         if self.consume('not'):
-            return ast.NotExpression(token, self.parse_comparison_expression())
+            if min_binding_power > NOT:
+                raise ParseError(token, "Expected expression")
+            expr = ast.NotExpression(
+                token, (yield self._parse_expression(COMPARISON)))
+            level = NOT
+        elif token.type in PREFIX_OPERATORS:
+            self.next_token()
+            expr = ast.MethodCallExpression(
+                token, (yield self._parse_postfix_expression()),
+                PREFIX_OPERATORS[token.type], [])
+            level = PREFIX
         else:
-            return self.parse_comparison_expression()
+            expr = yield self._parse_postfix_expression()
+            level = POSTFIX
 
-    def parse_comparison_expression(self):
-        # TODO: Treat comparison chaining in a special way:
-        # e.g. 'a == b == c' should be equivalent to 'a == b and b == c'
-        # Until then, simply don't allow chaining.
-        expr = self.parse_additive_expression()
-        token = self.peek()
-        if self.consume('<'):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__lt__', [rhs])
-        if self.consume('<='):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__le__', [rhs])
-        if self.consume('>'):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__gt__', [rhs])
-        if self.consume('>='):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__ge__', [rhs])
-        if self.consume('=='):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__eq__', [rhs])
-        if self.consume('!='):
-            rhs = self.parse_additive_expression()
-            return ast.MethodCallExpression(token, expr, '__ne__', [rhs])
-
-        return expr
-
-    def parse_additive_expression(self):
-        expr = self.parse_multiplicative_expression()
         while True:
             token = self.peek()
-            if self.consume('+'):
-                rhs = self.parse_multiplicative_expression()
-                expr = ast.MethodCallExpression(token, expr, '__add__', [rhs])
-            elif self.consume('-'):
-                rhs = self.parse_multiplicative_expression()
-                expr = ast.MethodCallExpression(token, expr, '__sub__', [rhs])
-            else:
+            if token.type == '?':
+                if min_binding_power > TERNARY:
+                    break
+                self.next_token()
+                lhs = yield self._parse_expression()
+                self.expect(':')
+                rhs = yield self._parse_expression(TERNARY)
+                expr = ast.TernaryExpression(token, expr, lhs, rhs)
+                level = TERNARY
+                continue
+
+            if token.type not in BINARY_OPERATORS:
                 break
-        return expr
-
-    def parse_multiplicative_expression(self):
-        expr = self.parse_prefix_expression()
-        while True:
-            token = self.peek()
-            if self.consume('*'):
-                rhs = self.parse_prefix_expression()
-                expr = ast.MethodCallExpression(token, expr, '__mul__', [rhs])
-            elif self.consume('/'):
-                rhs = self.parse_prefix_expression()
-                expr = ast.MethodCallExpression(token, expr, '__div__', [rhs])
-            elif self.consume('%'):
-                rhs = self.parse_prefix_expression()
-                expr = ast.MethodCallExpression(token, expr, '__mod__', [rhs])
-            else:
+            binding_power, build = BINARY_OPERATORS[token.type]
+            # TODO: Treat comparison chaining in a special way:
+            # e.g. 'a == b == c' should be equivalent to 'a == b and b == c'
+            # Until then, simply don't allow chaining.
+            if (binding_power < min_binding_power or
+                    binding_power > level or
+                    binding_power == level == COMPARISON):
                 break
+            self.next_token()
+            rhs = yield self._parse_expression(binding_power + 1)
+            expr = build(token, expr, rhs)
+            level = binding_power
+
         return expr
 
-    def parse_prefix_expression(self):
-        token = self.peek()
-        if self.consume('-'):
-            return ast.MethodCallExpression(
-                token, self.parse_postfix_expression(), '__neg__', [])
-        elif self.consume('+'):
-            return ast.MethodCallExpression(
-                token, self.parse_postfix_expression(), '__neg__', [])
-        return self.parse_postfix_expression()
-
-    def parse_postfix_expression(self):
-        expr = self.parse_primary_expression()
+    def _parse_arguments(self, close):
+        # The opening bracket has already been consumed.
+        args = []
+        while not self.consume(close):
+            args.append((yield self._parse_expression()))
+            if not self.at(close):
+                self.expect(',')
+        return args
+
+    def _parse_postfix_expression(self):
+        parse = self.NESTED_PRIMARY_EXPRESSION_PARSERS.get(
+            self.tokens[self.pos].type)
+        if parse is None:
+            expr = self.parse_primary_expression()
+        else:
+            expr = yield parse(self)
+
         while True:
             token = self.peek()
             if self.consume('.'):
                 name = self.expect('NAME').value
                 if self.consume(OPEN_PARENTHESIS):
-                    args = []
-                    while not self.consume(CLOSE_PARENTHESIS):
-                        args.append(self.parse_expression())
-                        if not self.at(CLOSE_PARENTHESIS):
-                            self.expect(',')
+                    args = yield self._parse_arguments(CLOSE_PARENTHESIS)
                     expr = ast.MethodCallExpression(token, expr, name, args)
                 elif self.consume('='):
-                    value = self.parse_expression()
-                    expr = SetAttributeExpression(token, expr, name, value)
+                    value = yield self._parse_expression()
+                    expr = ast.SetAttributeExpression(token, expr, name, value)
                 else:
-                    expr = GetAttributeExpression(token, expr, name)
+                    expr = ast.GetAttributeExpression(token, expr, name)
             else:
                 break
         return expr
 
     def parse_primary_expression(self):
+        # Only those that can't contain other expressions: the others
+        # are in NESTED_PRIMARY_EXPRESSION_PARSERS.
+        parse = self.PRIMARY_EXPRESSION_PARSERS.get(self.tokens[self.pos].type)
+        if parse is None:
+            raise ParseError(self.peek(), "Expected expression")
+        return parse(self)
+
+    # Handlers for parse_primary_expression, by the type of the first
+    # token.
+
+    def parse_int_literal(self):
+        token = self.expect('INT')
+        return ast.IntLiteral(token, token.value)
+
+    def parse_float_literal(self):
+        token = self.expect('FLOAT')
+        return ast.FloatLiteral(token, token.value)
+
+    def parse_string_literal(self):
+        token = self.expect('STRING')
+        return ast.StringLiteral(token, token.value)
+
+    PRIMARY_EXPRESSION_PARSERS = {
+        'INT': parse_int_literal,
+        'FLOAT': parse_float_literal,
+        'STRING': parse_string_literal,
+    }
+
+    # The generators for the primary expressions that can contain
+    # others, by the type of the first token.
+
+    def _parse_parenthesized_expression(self):
+        self.expect('(')
+        expr = yield self._parse_expression()
+        self.expect(')')
+        return expr
+
+    def _parse_name_or_assign_expression(self):
+        token = self.expect('NAME')
+        if self.consume('='):
+            value = yield self._parse_expression()
+            return ast.AssignExpression(token, token.value, value)
+        else:
+            return ast.NameExpression(token, token.value)
+
+    def _parse_list_display(self):
+        token = self.expect(OPEN_BRACKET)
+        exprs = yield self._parse_arguments(CLOSE_BRACKET)
+        return ast.ListDisplay(token, exprs)
+
+    def _parse_static_expression(self):
+        type_ = self.parse_typename()
         token = self.peek()
-        if self.consume('('):
-            expr = self.parse_expression()
-            self.expect(')')
-            return expr
-        elif self.consume('NAME'):
-            if self.consume('='):
-                value = self.parse_expression()
-                return ast.AssignExpression(token, token.value, value)
-            else:
-                return ast.NameExpression(token, token.value)
-        elif self.consume('INT'):
-            return ast.IntLiteral(token, token.value)
-        elif self.consume('FLOAT'):
-            return ast.FloatLiteral(token, token.value)
-        elif self.consume('STRING'):
-            return ast.StringLiteral(token, token.value)
-        elif self.consume(OPEN_BRACKET):
-            exprs = []
-            while not self.consume(CLOSE_BRACKET):
-                exprs.append(self.parse_expression())
-                if not self.at(CLOSE_BRACKET):
-                    self.expect(',')
-            return ast.ListDisplay(token, exprs)
-        elif self.at('TYPENAME'):
-            type_ = self.parse_typename()
-            token = self.peek()
+        if self.consume(OPEN_PARENTHESIS):
+            args = yield self._parse_arguments(CLOSE_PARENTHESIS)
+            return ast.NewExpression(token, type_, args)
+        elif self.consume('.'):
+            name = self.expect('NAME').value
             if self.consume(OPEN_PARENTHESIS):
-                args = []
-                while not self.consume(CLOSE_PARENTHESIS):
-                    args.append(self.parse_expression())
-                    if not self.at(CLOSE_PARENTHESIS):
-                        self.expect(',')
-                return ast.NewExpression(token, type_, args)
-            elif self.consume('.'):
-                name = self.expect('NAME').value
-                if self.consume(OPEN_PARENTHESIS):
-                    args = []
-                    while not self.consume(CLOSE_PARENTHESIS):
-                        args.append(self.parse_expression())
-                        if not self.at(CLOSE_PARENTHESIS):
-                            self.expect(',')
-                    return ast.StaticMethodCallExpression(
-                        token, type_, name, args)
-                elif self.consume('='):
-                    value = self.parse_expression()
-                    return ast.SetStaticAttributeExpression(
-                        token, type_, name, value)
-                else:
-                    return ast.GetStaticAttributeExpression(
-                        token, type_, name)
+                args = yield self._parse_arguments(CLOSE_PARENTHESIS)
+                return ast.StaticMethodCallExpression(
+                    token, type_, name, args)
+            elif self.consume('='):
+                value = yield self._parse_expression()
+                return ast.SetStaticAttributeExpression(
+                    token, type_, name, value)
             else:
-                raise ParseError(token, "Expected static method call")
-        elif self.consume('super'):
-            self.expect('.')
-            method_name = self.expect('NAME').value
-            self.expect(OPEN_PARENTHESIS)
-            args = []
-            while not self.consume(CLOSE_PARENTHESIS):
-                args.append(self.parse_expression())
-                if not self.at(CLOSE_PARENTHESIS):
-                    self.expect(',')
-            return ast.SuperMethodCallExpression(token, method_name, args)
-
-        raise ParseError(self.peek(), "Expected expression")
-
-def parse(source):
-    return Parser(source).parse_file_input()
+                return ast.GetStaticAttributeExpression(
+                    token, type_, name)
+        else:
+            raise ParseError(token, "Expected static method call")
+
+    def _parse_super_method_call_expression(self):
+        token = self.expect('super')
+        self.expect('.')
+        method_name = self.expect('NAME').value
+        self.expect(OPEN_PARENTHESIS)
+        args = yield self._parse_arguments(CLOSE_PARENTHESIS)
+        return ast.SuperMethodCallExpression(token, method_name, args)
+
+    NESTED_PRIMARY_EXPRESSION_PARSERS = {
+        '(': _parse_parenthesized_expression,
+        'NAME': _parse_name_or_assign_expression,
+        OPEN_BRACKET: _parse_list_display,
+        'TYPENAME': _parse_static_expression,
+        'super': _parse_super_method_call_expression,
+    }
+
+class StacklessParser(Parser):
+    """Parser that doesn't recurse in Python to parse nested code.
+
+    Runs its productions with parsecore.run, so how deeply expressions
+    can nest and how long 'else if' chains can get is bounded by memory
+    instead of by sys.getrecursionlimit(). Builds exactly the same trees
+    as Parser, just a little more slowly.
+    """
+
+    run_production = staticmethod(parsecore.run)
+
+def parse(source, stackless=False):
+    parser_class = StacklessParser if stackless else Parser
+    return parser_class(source).parse_file_input()
+
+def iter_parse(source, stackless=False):
+    # Like parse, but see Parser.iter_file_input.
+    parser_class = StacklessParser if stackless else Parser
+    return parser_class(source).iter_file_input()
 
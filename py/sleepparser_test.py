@@ -1,6 +1,9 @@
 import unittest
 import sleepparser as parser
 import sleepast as ast
+import astcodec
+import astschema
+import astvisitor
 
 
 class TestCase(unittest.TestCase):
@@ -128,6 +131,277 @@ class ParserTestCase(TestCase):
         self.assertEqual(type(node), ast.MethodCallExpression)
         self.assertEqual(node.method_name, '__mod__')
 
+    def test_statements(self):
+        p = parser.Parser(parser.Source('<test>', r"""
+        {
+            Foo x = Foo()
+            Foo.bar(x);
+            if x { return [x]; } else if y { break; } else { continue; }
+            while x { x; }
+        }
+        """))
+        block = p.parse_statement()
+        self.assertEqual(
+            [type(stmt) for stmt in block.stmts], [
+                ast.VariableDeclaration,
+                ast.ExpressionStatement,
+                ast.IfStatement,
+                ast.WhileStatement,
+            ])
+        self.assertEqual(type(block.stmts[2].other), ast.IfStatement)
+        self.assertEqual(
+            type(block.stmts[2].body.stmts[0].return_value),
+            ast.ListDisplay)
+
+    def test_not_an_expression(self):
+        p = parser.Parser(parser.Source('<test>', 'x = ;'))
+        with self.assertRaises(parser.ParseError) as context:
+            p.parse_statement()
+        self.assertEqual(context.exception.message, 'Expected expression')
+        self.assertEqual(context.exception.token.type, ';')
+
+
+def sexpr(node):
+    """Render an expression compactly, to check how it was grouped."""
+    if isinstance(node, ast.NameExpression):
+        return node.name
+    if isinstance(node, ast.IntLiteral):
+        return node.value
+    if isinstance(node, ast.MethodCallExpression):
+        return '(%s)' % ' '.join(
+            [node.method_name, sexpr(node.target)] +
+            [sexpr(arg) for arg in node.args])
+    if isinstance(node, ast.NotExpression):
+        return '(not %s)' % sexpr(node.target)
+    if isinstance(node, ast.AndExpression):
+        return '(and %s %s)' % (sexpr(node.left), sexpr(node.right))
+    if isinstance(node, ast.OrExpression):
+        return '(or %s %s)' % (sexpr(node.left), sexpr(node.right))
+    if isinstance(node, ast.TernaryExpression):
+        return '(? %s %s %s)' % (
+            sexpr(node.condition), sexpr(node.left), sexpr(node.right))
+    raise TypeError(node)
+
+
+class IterParseTestCase(TestCase):
+
+    def test_definitions_in_order(self):
+        source = parser.Source('<test>', r"""
+        package org.sample
+        import com.foo.Bar
+        class Alpha { int x; }
+        interface Iface { int f() }
+        class Beta extends Alpha { }
+        """)
+        items = list(parser.iter_parse(source))
+        self.assertEqual(
+            [type(item) for item in items],
+            [ast.FileInput, ast.ClassDefinition, ast.InterfaceDefinition,
+             ast.ClassDefinition])
+        self.assertEqual(items[0].package, ['org', 'sample'])
+        self.assertEqual(items[0].imports[0].name, 'Bar')
+        self.assertEqual((items[0].interfaces, items[0].classes), ([], []))
+        self.assertEqual(
+            [item.name for item in items[1:]], ['Alpha', 'Iface', 'Beta'])
+        self.assertEqual(items[1].members[0].name, 'x')
+
+        node = parser.parse(source)
+        self.assertEqual([i.name for i in node.interfaces], ['Iface'])
+        self.assertEqual([c.name for c in node.classes], ['Alpha', 'Beta'])
+
+    def test_definitions_come_as_parsed(self):
+        items = parser.iter_parse(parser.Source(
+            '<test>', 'class Alpha { } class Beta { ) }'))
+        self.assertEqual(next(items).classes, [])
+        self.assertEqual(next(items).name, 'Alpha')
+        with self.assertRaises(parser.ParseError):
+            next(items)
+
+
+class ExpressionTestCase(TestCase):
+
+    def parse_expression(self, text):
+        p = parser.Parser(parser.Source('<test>', text))
+        node = p.parse_expression()
+        self.assertEqual(p.peek().type, 'EOF')
+        return sexpr(node)
+
+    def test_arithmetic(self):
+        self.assertEqual(
+            self.parse_expression('a + b * c - d % 2 / e'),
+            '(__sub__ (__add__ a (__mul__ b c)) (__div__ (__mod__ d 2) e))')
+        self.assertEqual(
+            self.parse_expression('(a + b) * -c - -d'),
+            '(__sub__ (__mul__ (__add__ a b) (__neg__ c)) (__neg__ d))')
+
+    def test_logic(self):
+        self.assertEqual(
+            self.parse_expression('not a < b + 1 and c or d and not e'),
+            '(or (and (not (__lt__ a (__add__ b 1))) c) (and d (not e)))')
+
+    def test_ternary(self):
+        self.assertEqual(
+            self.parse_expression('a or b ? c ? d : e : f ? g : h'),
+            '(? (or a b) (? c d e) (? f g h))')
+
+    def test_comparisons_do_not_chain(self):
+        for text in ('a < b < c', 'not a == b != c'):
+            p = parser.Parser(parser.Source('<test>', text))
+            p.parse_expression()
+            self.assertIn(p.peek().type, ('<', '!='))
+
+    def test_not_only_where_allowed(self):
+        for text in ('a + not b', 'a < not b', '- not a', 'not not a'):
+            p = parser.Parser(parser.Source('<test>', text))
+            with self.assertRaises(parser.ParseError) as context:
+                p.parse_expression()
+            self.assertEqual(context.exception.message, 'Expected expression')
+            self.assertEqual(context.exception.token.type, 'not')
+
+
+class StacklessTestCase(TestCase):
+    # Deeper than the default recursion limit allows Parser to go.
+    DEPTH = 10000
+
+    def parse(self, text, method='parse_statement'):
+        p = parser.StacklessParser(parser.Source('<test>', text))
+        node = getattr(p, method)()
+        self.assertEqual(p.peek().type, 'EOF')
+        return node
+
+    def test_nested_expressions(self):
+        node = self.parse(
+            '-(not [x.f(' * self.DEPTH + 'b' + ')]) + 1' * self.DEPTH,
+            'parse_expression')
+        for _ in range(self.DEPTH):
+            self.assertEqual(node.method_name, '__add__')
+            node = node.target.target.target.values[0].args[0]
+        self.assertEqual(sexpr(node), 'b')
+
+    def test_else_if_chain(self):
+        node = self.parse(
+            'if a { x; }' + ' else if b { y; }' * self.DEPTH + ' else { z; }')
+        for _ in range(self.DEPTH + 1):
+            self.assertEqual(type(node), ast.IfStatement)
+            node = node.other
+        self.assertEqual(type(node), ast.Block)
+
+    def test_same_as_parser(self):
+        text = 'a or b ? -c.d(e, f.g(1)) : not h < i * (j + 2)'
+        self.assertEqual(
+            sexpr(self.parse(text, 'parse_expression')),
+            sexpr(parser.Parser(
+                parser.Source('<test>', text)).parse_expression()))
+
+        source = SIMPLE_PARSER_CLASS_EXAMPLE
+        node = parser.parse(source, stackless=True)
+        method = node.classes[0].methods[0]
+        self.assertEqual(type(method.body.stmts[0]), ast.ReturnStatement)
+
+    def test_same_error_as_parser(self):
+        text = 'while ' + '(a.f(b + not c' * self.DEPTH + ' { }'
+        with self.assertRaises(parser.ParseError) as context:
+            self.parse(text)
+        self.assertEqual(context.exception.message, 'Expected expression')
+        self.assertEqual(context.exception.token.type, 'not')
+
+
+class AstCodecTestCase(TestCase):
+
+    def test_round_trip(self):
+        for source in (SIMPLE_PARSER_INTERFACE_EXAMPLE,
+                       SIMPLE_PARSER_CLASS_EXAMPLE,
+                       PARSER_IMPORT_EXAMPLE):
+            node = parser.parse(source)
+            decoded = astcodec.loads(astcodec.dumps(node), source)
+            self.assertEqual(
+                astcodec.dumps(decoded), astcodec.dumps(node))
+
+        node = parser.parse(SIMPLE_PARSER_INTERFACE_EXAMPLE)
+        node.interfaces[0].stubs[0].returns.full_name = 'sleep.lang.int'
+        decoded = astcodec.loads(
+            astcodec.dumps(node), SIMPLE_PARSER_INTERFACE_EXAMPLE)
+        stub = decoded.interfaces[0].stubs[0]
+        self.assertEqual(stub.returns.full_name, 'sleep.lang.int')
+        self.assertEqual(stub.arglist[1][1], 'arg1')
+        self.assertIs(stub.token.source, SIMPLE_PARSER_INTERFACE_EXAMPLE)
+        self.assertIsNone(stub.arglist[0][0].full_name)
+
+
+VISITOR_EXAMPLE = parser.Source('<VISITOR_EXAMPLE>', r"""
+package org.sample
+import com.foo.Bar
+interface Iface extends Base { int f(String s) }
+class Alpha extends Beta implements Iface {
+    static int x;
+    int f(String s) {
+        Bar b = Bar(s, [1, 2.5])
+        if s and not b or s {
+            return s;
+        } else {
+            b.x = s.size() ? Bar.y : 'n';
+        }
+        while b { Bar.z = b.x; break; }
+        s = Bar.make(b);
+        continue;
+    }
+}
+""")
+
+
+class VisitorTestCase(TestCase):
+
+    def test_children(self):
+        node = parser.parse(VISITOR_EXAMPLE)
+        nodes = list(astvisitor.walk(node))
+        # The lexer takes 'super' for a NAME, so there are no
+        # SuperMethodCallExpressions.
+        kinds = {type(value) for value in nodes}
+        self.assertEqual(
+            {value for value in vars(ast).values()
+             if isinstance(value, type) and '_visit_method' in vars(value)} -
+            kinds, {ast.SuperMethodCallExpression})
+
+    def test_dispatch(self):
+        class Calls(astvisitor.Visitor):
+            def __init__(self):
+                self.names = []
+
+            def visit_method_call_expression(self, node):
+                self.names.append(node.method_name)
+                self.generic_visit(node)
+
+            def visit_super_method_call_expression(self, node):
+                self.names.append('super.' + node.method_name)
+
+        calls = Calls()
+        calls.visit(parser.parse(VISITOR_EXAMPLE))
+        calls.visit(ast.SuperMethodCallExpression(None, 'f', []))
+        self.assertEqual(calls.names, ['size', 'super.f'])
+
+class StructuralEqualityTestCase(TestCase):
+
+    def test_equality_and_hash(self):
+        node = parser.parse(VISITOR_EXAMPLE)
+        moved = parser.parse(parser.Source(
+            '<test>', '\n\n' + VISITOR_EXAMPLE.text))
+        self.assertEqual(node, moved)
+        self.assertEqual(
+            astschema.structural_hash(node),
+            astschema.structural_hash(moved))
+
+        changed = parser.parse(parser.Source(
+            '<test>', VISITOR_EXAMPLE.text.replace('2.5', '3.5')))
+        self.assertNotEqual(node, changed)
+        self.assertNotEqual(
+            astschema.structural_hash(node),
+            astschema.structural_hash(changed))
+        # Distinct nodes stay distinct keys, equal or not.
+        self.assertEqual(len({node, moved, changed}), 3)
+        self.assertEqual(
+            len({astschema.structural_hash(n)
+                 for n in (node, moved, changed)}), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
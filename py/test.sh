@@ -0,0 +1,2 @@
+python sleeplexer_test.py || exit 1
+python sleepparser_test.py || exit 1